@@ -0,0 +1,4 @@
+'''
+Load-testing benchmarks for the Flask apps in this repository.
+See __main__.py for usage.
+'''
@@ -0,0 +1,123 @@
+'''
+Load tests fyyur, trivia, capstone and the coffee shop API.
+
+    $ python -m benchmarks run --rows 1000 100000 --requests 2000 --concurrency 16 --output report.json
+    $ python -m benchmarks compare before.json after.json
+
+Each app is seeded into its own database (a temporary SQLite file unless
+--database-url APP=URL is given) and served by a separate process; every
+endpoint is then driven with --requests requests, --concurrency at a time.
+'''
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from urllib.request import urlopen
+
+from benchmarks.loadgen import drive, summarize
+from benchmarks.report import compare, new_report, write_report
+from benchmarks.targets import ROOT, TARGETS
+
+HOST = '127.0.0.1'
+# requests sent to each endpoint before measuring, to warm caches and connections
+WARMUP_REQUESTS = 20
+
+
+def statements_run(port):
+    with urlopen('http://{}:{}/_benchmark/queries'.format(HOST, port)) as response:
+        return json.load(response)
+
+
+def benchmark_target(target, numRows, databaseUrl, numRequests, concurrency, only=None):
+    '''
+    Seeds and serves one app, then drives each of its endpoints, or those
+    whose name contains one of the strings in only.
+    Output: <dict> rows and seeding time, and a summary per endpoint
+    '''
+    server = subprocess.Popen([sys.executable, '-m', 'benchmarks.serve', target, '--rows', str(numRows),
+                               '--database-url', databaseUrl],
+                              cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    try:
+        readyLine = server.stdout.readline()
+        if not readyLine:
+            raise RuntimeError('{} exited before serving (status {})'.format(target, server.wait()))
+        ready = json.loads(readyLine)
+        results = {'rows': ready['rows'], 'seed_seconds': ready['seed_seconds'], 'endpoints': {}}
+        for endpoint in TARGETS[target][2]:
+            if only and not any(part in endpoint.name for part in only):
+                continue
+            headers = {}
+            if endpoint.auth:
+                if not os.environ.get(endpoint.auth):
+                    results['endpoints'][endpoint.name] = {'skipped': 'set {} to an Authorization header'.format(endpoint.auth)}
+                    continue
+                headers['Authorization'] = os.environ[endpoint.auth]
+            asyncio.run(drive(HOST, ready['port'], endpoint, WARMUP_REQUESTS, concurrency, headers))
+            before = statements_run(ready['port'])
+            result = asyncio.run(drive(HOST, ready['port'], endpoint, numRequests, concurrency, headers))
+            summary = summarize(result)
+            summary['queries_per_request'] = round((statements_run(ready['port']) - before) / summary['requests'], 2) \
+                if summary['requests'] else None
+            results['endpoints'][endpoint.name] = summary
+            print('{:<12} rows={:>8} {:<40} p50={}ms p99={}ms rps={} queries={}'.format(
+                target, numRows, endpoint.name, summary['p50_ms'], summary['p99_ms'], summary['rps'],
+                summary['queries_per_request']), file=sys.stderr)
+        return results
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def run(targets, rowCounts, numRequests, concurrency, databaseUrls, output, only=None):
+    report = new_report({'targets': targets, 'rows': rowCounts, 'requests': numRequests,
+                         'concurrency': concurrency, 'warmup_requests': WARMUP_REQUESTS, 'endpoints': only})
+    with tempfile.TemporaryDirectory() as directory:
+        for target in targets:
+            report['results'][target] = {}
+            for numRows in rowCounts:
+                databaseUrl = databaseUrls.get(target) or 'sqlite:///' + os.path.join(
+                    directory, '{}-{}.db'.format(target, numRows))
+                try:
+                    results = benchmark_target(target, numRows, databaseUrl, numRequests, concurrency, only)
+                except RuntimeError as error:
+                    # an app missing its dependencies should not sink the whole run
+                    results = {'error': str(error)}
+                    print(error, file=sys.stderr)
+                report['results'][target][str(numRows)] = results
+    write_report(report, output)
+    return report
+
+
+def database_url(value):
+    target, separator, url = value.partition('=')
+    if not separator or target not in TARGETS:
+        raise argparse.ArgumentTypeError('expected APP=URL with APP one of ' + ', '.join(sorted(TARGETS)))
+    return target, url
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='Load test the Flask apps.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    runParser = commands.add_parser('run', help='seed, serve and load test the apps')
+    runParser.add_argument('--app', nargs='+', choices=sorted(TARGETS), default=sorted(TARGETS), dest='targets')
+    runParser.add_argument('--rows', type=int, nargs='+', default=[1000],
+                           help='rows to seed, one run per value (e.g. 1000 100000 1000000)')
+    runParser.add_argument('--requests', type=int, default=1000, help='measured requests per endpoint')
+    runParser.add_argument('--concurrency', type=int, default=8, help='requests in flight')
+    runParser.add_argument('--database-url', type=database_url, action='append', default=[],
+                           help='APP=URL database to seed instead of a temporary SQLite file; it must start empty')
+    runParser.add_argument('--endpoint', nargs='+', dest='only',
+                           help='drive only endpoints whose name contains one of these (e.g. /questions/search)')
+    runParser.add_argument('--output', default='benchmark-report.json')
+    compareParser = commands.add_parser('compare', help='compare two reports')
+    compareParser.add_argument('before')
+    compareParser.add_argument('after')
+    arguments = parser.parse_args()
+    if arguments.command == 'run':
+        run(arguments.targets, arguments.rows, arguments.requests, arguments.concurrency,
+            dict(arguments.database_url), arguments.output, arguments.only)
+    else:
+        print('\n'.join(compare(arguments.before, arguments.after)))
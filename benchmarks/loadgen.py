@@ -0,0 +1,170 @@
+'''
+A small asyncio HTTP/1.1 load generator.
+Each worker keeps one connection open and sends requests back to back until
+the shared request count runs out, so concurrency is the number of requests
+in flight.
+'''
+import asyncio
+import json
+import math
+import time
+from collections import Counter
+from urllib.parse import urlencode
+
+
+class Endpoint:
+    '''
+    One request to drive: method, path and an optional JSON or form body.
+    '''
+
+    def __init__(self, method, path, json=None, form=None, auth=None):
+        self.method = method
+        self.path = path
+        self.json = json
+        self.form = form
+        # environment variable holding the Authorization header, for protected endpoints
+        self.auth = auth
+
+    @property
+    def name(self):
+        return '{} {}'.format(self.method, self.path)
+
+    def encode(self, host, headers=None):
+        body = b''
+        lines = ['{} {} HTTP/1.1'.format(self.method, self.path), 'Host: {}'.format(host)]
+        if self.json is not None:
+            body = json.dumps(self.json).encode()
+            lines.append('Content-Type: application/json')
+        elif self.form is not None:
+            body = urlencode(self.form).encode()
+            lines.append('Content-Type: application/x-www-form-urlencoded')
+        lines.append('Content-Length: {}'.format(len(body)))
+        for header, value in (headers or {}).items():
+            lines.append('{}: {}'.format(header, value))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+
+# ----------------------------------------------------------------------------#
+# HTTP.
+# ----------------------------------------------------------------------------#
+
+async def read_response(reader):
+    '''
+    Reads one response off a keep-alive connection.
+    Output: <tuple> (status, headers dict with lower-case names, body bytes)
+    '''
+    statusLine = await reader.readline()
+    if not statusLine:
+        raise ConnectionError('connection closed')
+    status = int(statusLine.split()[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        headers.setdefault(name.strip().lower(), []).append(value.strip())
+    headers = {name: ', '.join(values) for name, values in headers.items()}
+    if statusLine.startswith(b'HTTP/1.0') and headers.get('connection', '').lower() != 'keep-alive':
+        headers['connection'] = 'close'
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b''.join(chunks)
+    else:
+        body = await reader.read()
+        headers['connection'] = 'close'
+    return status, headers, body
+
+
+async def drive(host, port, endpoint, numRequests, concurrency, headers=None):
+    '''
+    Sends numRequests requests for endpoint over concurrency connections.
+    Output: <dict> latencies (seconds, in completion order), statuses,
+            errors and elapsed wall time
+    '''
+    request = endpoint.encode('{}:{}'.format(host, port), headers)
+    remaining = [numRequests]
+    latencies = []
+    statuses = Counter()
+    errors = Counter()
+
+    async def worker():
+        reader = writer = None
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            try:
+                if writer is None:
+                    reader, writer = await asyncio.open_connection(host, port)
+                start = time.perf_counter()
+                writer.write(request)
+                await writer.drain()
+                status, responseHeaders, _ = await read_response(reader)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                if responseHeaders.get('connection', '').lower() == 'close':
+                    writer.close()
+                    writer = None
+            except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError, IndexError) as error:
+                errors[type(error).__name__] += 1
+                if writer is not None:
+                    writer.close()
+                writer = None
+        if writer is not None:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(min(concurrency, numRequests))))
+    return {'latencies': latencies,
+            'statuses': statuses,
+            'errors': errors,
+            'elapsed': time.perf_counter() - start}
+
+
+# ----------------------------------------------------------------------------#
+# Statistics.
+# ----------------------------------------------------------------------------#
+
+def percentile(sortedValues, fraction):
+    '''
+    Nearest-rank percentile of an already sorted list.
+    '''
+    if not sortedValues:
+        return None
+    rank = min(len(sortedValues), max(1, math.ceil(fraction * len(sortedValues))))
+    return sortedValues[rank - 1]
+
+
+def summarize(result):
+    '''
+    Latency percentiles (milliseconds), throughput and status counts of a drive() result.
+    Output: <dict>
+    '''
+    latencies = sorted(result['latencies'])
+    completed = len(latencies)
+
+    def milliseconds(value):
+        return round(value * 1000, 3) if value is not None else None
+
+    summary = {
+        'requests': completed,
+        'errors': sum(result['errors'].values()),
+        'statuses': {str(status): count for status, count in sorted(result['statuses'].items())},
+        'rps': round(completed / result['elapsed'], 1) if result['elapsed'] else 0.0,
+        'mean_ms': milliseconds(sum(latencies) / completed) if completed else None,
+        'p50_ms': milliseconds(percentile(latencies, 0.50)),
+        'p90_ms': milliseconds(percentile(latencies, 0.90)),
+        'p99_ms': milliseconds(percentile(latencies, 0.99)),
+        'max_ms': milliseconds(latencies[-1] if latencies else None),
+    }
+    if result['errors']:
+        summary['error_types'] = dict(sorted(result['errors'].items()))
+    return summary
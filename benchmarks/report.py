@@ -0,0 +1,72 @@
+'''
+Benchmark reports: one JSON file per run, written with sorted keys so two
+reports diff cleanly, and a side-by-side comparison of two of them.
+'''
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.targets import ROOT
+
+COMPARED_METRICS = ('p50_ms', 'p99_ms', 'rps', 'queries_per_request')
+
+
+def git_commit():
+    '''
+    Output: <tuple> (commit hash or None, whether the tree has uncommitted changes)
+    '''
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, False
+    return commit, dirty
+
+
+def new_report(settings):
+    commit, dirty = git_commit()
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'created': datetime.now(timezone.utc).replace(microsecond=0).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'settings': settings,
+        'results': {},
+    }
+
+
+def write_report(report, path):
+    with open(path, 'w') as reportFile:
+        json.dump(report, reportFile, indent=2, sort_keys=True)
+        reportFile.write('\n')
+
+
+def _change(before, after):
+    if not before or after is None:
+        return '{} -> {}'.format(before, after)
+    return '{} -> {} ({:+.1f}%)'.format(before, after, (after - before) / before * 100)
+
+
+def compare(beforePath, afterPath):
+    '''
+    Lines comparing the endpoints two reports share, metric by metric.
+    Output: <list> of strings
+    '''
+    with open(beforePath) as beforeFile, open(afterPath) as afterFile:
+        before, after = json.load(beforeFile), json.load(afterFile)
+    lines = ['{} -> {}'.format((before.get('commit') or '?')[:10], (after.get('commit') or '?')[:10])]
+    for target in sorted(set(before['results']) & set(after['results'])):
+        for numRows in sorted(set(before['results'][target]) & set(after['results'][target]), key=int):
+            beforeRun = before['results'][target][numRows].get('endpoints', {})
+            afterRun = after['results'][target][numRows].get('endpoints', {})
+            for endpoint in sorted(set(beforeRun) & set(afterRun)):
+                if 'skipped' in beforeRun[endpoint] or 'skipped' in afterRun[endpoint]:
+                    continue
+                lines.append('{} rows={} {}: {}'.format(target, numRows, endpoint, '  '.join(
+                    '{} {}'.format(metric, _change(beforeRun[endpoint].get(metric), afterRun[endpoint].get(metric)))
+                    for metric in COMPARED_METRICS)))
+    return lines
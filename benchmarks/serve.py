@@ -0,0 +1,80 @@
+'''
+Serves one app for the load generator, in its own process.
+
+    $ python -m benchmarks.serve fyyur --rows 1000 --database-url sqlite:////tmp/fyyur.db
+
+Seeds the database, then prints one JSON line with the port, the rows seeded
+and the seeding time, and serves until killed. GET /_benchmark/queries
+returns the number of statements the app has run so far.
+'''
+import argparse
+import json
+import logging
+import os
+import socket
+import sys
+import threading
+import time
+
+from flask import jsonify
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+
+class StatementCounter:
+    '''
+    Counts the statements every engine in the process sends.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+        event.listen(Engine, 'after_cursor_execute', self.after_cursor_execute)
+
+    def after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        with self.lock:
+            self.count += 1
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    # HTTP/1.1 keeps the load generator's connections open between requests
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        # headers and body go out in separate writes; without this, Nagle's
+        # algorithm and delayed ACKs add ~40ms to every kept-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+
+def serve(target, numRows, databaseUrl, host='127.0.0.1'):
+    from benchmarks.targets import TARGETS
+    load, seed, _ = TARGETS[target]
+    # every app reads its database from DATABASE_URL, some of them at import time
+    os.environ['DATABASE_URL'] = databaseUrl
+    app, db = load()
+    start = time.perf_counter()
+    with app.app_context():
+        inserted = seed(db, numRows)
+        db.session.remove()
+    seedSeconds = time.perf_counter() - start
+
+    counter = StatementCounter()
+    app.add_url_rule('/_benchmark/queries', 'benchmark_queries', lambda: jsonify(counter.count))
+    server = make_server(host, 0, app, threaded=True, request_handler=KeepAliveRequestHandler)
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    print(json.dumps({'port': server.server_address[1], 'rows': inserted, 'seed_seconds': round(seedSeconds, 3)}),
+          flush=True)
+    # nothing reads stdout past the ready line; views that print would block on a full pipe
+    sys.stdout = open(os.devnull, 'w')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Seed and serve one app for benchmarking.')
+    parser.add_argument('target')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--database-url', required=True)
+    arguments = parser.parse_args()
+    serve(arguments.target, arguments.rows, arguments.database_url)
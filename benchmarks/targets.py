@@ -0,0 +1,224 @@
+'''
+The apps under test: where each lives, how to build and seed it, and the
+endpoints to drive. Apps are imported only inside the serving process (see
+serve.py), since fyyur, trivia and capstone all have top-level modules named
+app, models or config.
+'''
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+
+from benchmarks.loadgen import Endpoint
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# rows per INSERT; keeps seeding memory flat at a million rows
+SEED_CHUNK_SIZE = 10000
+CATEGORIES = ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']
+QUESTIONS_PER_CATEGORY = 10000
+
+
+def _use_directory(directory):
+    sys.path.insert(0, os.path.join(ROOT, directory))
+
+
+def insert_rows(db, table, rows):
+    '''
+    Inserts rows from an iterable in SEED_CHUNK_SIZE executemany batches.
+    Output: <int> rows inserted
+    '''
+    numRows = 0
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == SEED_CHUNK_SIZE:
+            db.session.execute(table.insert(), chunk)
+            numRows += len(chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(table.insert(), chunk)
+        numRows += len(chunk)
+    db.session.commit()
+    return numRows
+
+
+# ----------------------------------------------------------------------------#
+# fyyur.
+# ----------------------------------------------------------------------------#
+
+def load_fyyur():
+    _use_directory('fyyur')
+    import app as fyyur
+    from model import db
+    # measure the pages as production serves them, without the debug query panel,
+    # and render every request instead of serving it from the page cache
+    fyyur.app.config['QUERY_PROFILER_PANEL'] = False
+    fyyur.app.config['CACHE_BACKEND'] = None
+    fyyur.app.extensions['page_cache'].init_app(fyyur.app)
+    with fyyur.app.app_context():
+        db.create_all()
+    return fyyur.app, db
+
+
+def seed_fyyur(db, numRows):
+    '''
+    A quarter venues, a quarter artists and half shows, alternating past and upcoming.
+    '''
+    from model import Artist, Venue, Show, refresh_show_counts
+    now = datetime.today()
+    numVenues = max(1, numRows // 4)
+    numArtists = max(1, numRows // 4)
+    numShows = max(1, numRows - numVenues - numArtists)
+    cities = [('San Francisco', 'CA'), ('New York', 'NY'), ('Seattle', 'WA'), ('Austin', 'TX')]
+    inserted = insert_rows(db, Venue.__table__, (
+        {'id': venueId, 'name': 'Venue {}'.format(venueId),
+         'city': cities[venueId % len(cities)][0], 'state': cities[venueId % len(cities)][1]}
+        for venueId in range(1, numVenues + 1)))
+    inserted += insert_rows(db, Artist.__table__, (
+        {'id': artistId, 'name': 'Band {}'.format(artistId),
+         'city': cities[artistId % len(cities)][0], 'state': cities[artistId % len(cities)][1]}
+        for artistId in range(1, numArtists + 1)))
+
+    def shows():
+        for showNumber in range(numShows):
+            round_ = showNumber // numVenues
+            offset = timedelta(days=round_ // 2 + 1)
+            yield {'venue_id': showNumber % numVenues + 1,
+                   'artist_id': showNumber * 7 % numArtists + 1,
+                   'start_time': now + offset if round_ % 2 else now - offset}
+
+    inserted += insert_rows(db, Show.__table__, shows())
+    refresh_show_counts(now)
+    return inserted
+
+
+FYYUR_ENDPOINTS = [
+    Endpoint('GET', '/venues'),
+    Endpoint('GET', '/venues/1'),
+    Endpoint('GET', '/artists'),
+    Endpoint('GET', '/artists/1'),
+    Endpoint('GET', '/shows'),
+    Endpoint('POST', '/venues/search', form={'search_term': 'venue 777'}),
+    Endpoint('GET', '/api/v1/venues?limit=100'),
+    Endpoint('GET', '/api/v1/shows?limit=100'),
+]
+
+
+# ----------------------------------------------------------------------------#
+# trivia.
+# ----------------------------------------------------------------------------#
+
+def load_trivia():
+    _use_directory('trivia/backend')
+    from flaskr import create_app
+    from models import db
+    return create_app(), db
+
+
+def seed_trivia(db, numRows):
+    '''
+    One category per QUESTIONS_PER_CATEGORY rows, starting with the six
+    sample ones: 1M rows seeds 100 categories of 10k questions.
+    '''
+    from models import Category, Question
+    numCategories = max(len(CATEGORIES), numRows // QUESTIONS_PER_CATEGORY)
+    categoryTypes = CATEGORIES + ['Category {}'.format(number) for number in range(len(CATEGORIES) + 1, numCategories + 1)]
+    inserted = insert_rows(db, Category.__table__, (
+        {'id': categoryId, 'type': categoryType} for categoryId, categoryType in enumerate(categoryTypes, start=1)))
+    inserted += insert_rows(db, Question.__table__, (
+        {'question': 'What is the answer to question {}?'.format(questionNumber),
+         'answer': 'Answer {}'.format(questionNumber),
+         'category': questionNumber % numCategories + 1,
+         'difficulty': questionNumber % 5 + 1}
+        for questionNumber in range(max(1, numRows - numCategories))))
+    return inserted
+
+
+TRIVIA_ENDPOINTS = [
+    Endpoint('GET', '/categories'),
+    Endpoint('GET', '/questions'),
+    Endpoint('GET', '/questions?page=50'),
+    Endpoint('GET', '/categories/1/questions'),
+    Endpoint('GET', '/categories/50/questions?page=100'),
+    Endpoint('POST', '/questions', json={'searchTerm': 'question 12'}),
+    Endpoint('GET', '/questions/search?q=question+12'),
+    Endpoint('GET', '/questions/search?q=question+12&page=20'),
+    Endpoint('POST', '/quizzes', json={'previous_questions': [1, 2, 3], 'quiz_category': {'id': 0}}),
+]
+
+
+# ----------------------------------------------------------------------------#
+# capstone.
+# ----------------------------------------------------------------------------#
+
+def load_capstone():
+    _use_directory('capstone')
+    from app import create_app
+    from models import db
+    # create_app drops and recreates the tables with a few sample rows
+    return create_app(), db
+
+
+def seed_capstone(db, numRows):
+    from models import Actor, Movie, starring
+    numActors = max(1, numRows // 3)
+    numMovies = max(1, numRows // 3)
+    firstActor = (db.session.query(db.func.max(Actor.id)).scalar() or 0) + 1
+    firstMovie = (db.session.query(db.func.max(Movie.id)).scalar() or 0) + 1
+    today = datetime.today().date()
+    inserted = insert_rows(db, Movie.__table__, (
+        {'id': movieId, 'title': 'Movie {}'.format(movieId), 'release_date': today - timedelta(days=movieId % 3650)}
+        for movieId in range(firstMovie, firstMovie + numMovies)))
+    inserted += insert_rows(db, Actor.__table__, (
+        {'id': actorId, 'name': 'Actor {}'.format(actorId), 'gender': ('female', 'male')[actorId % 2],
+         'age': 20 + actorId % 50}
+        for actorId in range(firstActor, firstActor + numActors)))
+    inserted += insert_rows(db, starring, (
+        {'movie_id': firstMovie + roleNumber % numMovies, 'actor_id': firstActor + roleNumber * 7 % numActors}
+        for roleNumber in range(max(1, numRows - numActors - numMovies))))
+    return inserted
+
+
+CAPSTONE_ENDPOINTS = [
+    Endpoint('GET', '/actors', auth='CAPSTONE_AUTH_HEADER'),
+    Endpoint('GET', '/actors?page=50', auth='CAPSTONE_AUTH_HEADER'),
+    Endpoint('GET', '/movies', auth='CAPSTONE_AUTH_HEADER'),
+    Endpoint('GET', '/movies?page=50', auth='CAPSTONE_AUTH_HEADER'),
+    Endpoint('GET', '/actors?after_id=300', auth='CAPSTONE_AUTH_HEADER'),
+    Endpoint('GET', '/movies?after_id=300', auth='CAPSTONE_AUTH_HEADER'),
+]
+
+
+# ----------------------------------------------------------------------------#
+# coffee shop.
+# ----------------------------------------------------------------------------#
+
+def load_coffee_shop():
+    _use_directory('coffee shop/backend')
+    from src.api import app
+    from src.database.models import db
+    with app.app_context():
+        db.create_all()
+    return app, db
+
+
+def seed_coffee_shop(db, numRows):
+    from src.database.models import Drink
+    recipe = json.dumps([{'name': 'espresso', 'color': 'brown', 'parts': 1},
+                         {'name': 'milk', 'color': 'white', 'parts': 3}])
+    return insert_rows(db, Drink.__table__, (
+        {'title': 'Drink {}'.format(drinkNumber), 'recipe': recipe} for drinkNumber in range(numRows)))
+
+
+COFFEE_SHOP_ENDPOINTS = [
+    Endpoint('GET', '/drinks'),
+    Endpoint('GET', '/drinks-detail', auth='COFFEE_SHOP_AUTH_HEADER'),
+]
+
+
+TARGETS = {
+    'fyyur': (load_fyyur, seed_fyyur, FYYUR_ENDPOINTS),
+    'trivia': (load_trivia, seed_trivia, TRIVIA_ENDPOINTS),
+    'capstone': (load_capstone, seed_capstone, CAPSTONE_ENDPOINTS),
+    'coffee_shop': (load_coffee_shop, seed_coffee_shop, COFFEE_SHOP_ENDPOINTS),
+}
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from flask import Flask, jsonify, request
+from werkzeug.serving import make_server
+
+from benchmarks.loadgen import Endpoint, drive, percentile, summarize
+from benchmarks.report import compare, write_report
+
+
+class LoadGeneratorTestCase(unittest.TestCase):
+    """This class represents the load generator test case"""
+
+    def setUp(self):
+        app = Flask(__name__)
+
+        @app.route('/items', methods=['GET', 'POST'])
+        def items():
+            return jsonify({'form': request.form.get('term'), 'json': request.get_json(silent=True)})
+
+        @app.route('/stream')
+        def stream():
+            # no Content-Length: sent chunked over HTTP/1.1
+            return app.response_class((chunk for chunk in ['a', 'b', 'c']), mimetype='text/plain')
+
+        @app.route('/missing')
+        def missing():
+            return 'missing', 404
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_drive_counts_every_request_and_status(self):
+        for endpoint in [Endpoint('GET', '/items'), Endpoint('GET', '/stream'),
+                         Endpoint('POST', '/items', form={'term': 'x'}), Endpoint('POST', '/items', json={'a': 1})]:
+            result = asyncio.run(drive('127.0.0.1', self.port, endpoint, 25, 4))
+
+            self.assertEqual(len(result['latencies']), 25)
+            self.assertEqual(dict(result['statuses']), {200: 25})
+            self.assertFalse(result['errors'])
+
+        summary = summarize(asyncio.run(drive('127.0.0.1', self.port, Endpoint('GET', '/missing'), 10, 3)))
+        self.assertEqual(summary['statuses'], {'404': 10})
+        self.assertEqual(summary['requests'], 10)
+        self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(percentile(values, 0.5), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1.0), 100)
+        self.assertEqual(percentile([7], 0.99), 7)
+        self.assertIsNone(percentile([], 0.5))
+
+    def test_compare_reports_shared_endpoints(self):
+        directory = tempfile.mkdtemp()
+        paths = [os.path.join(directory, name) for name in ('before.json', 'after.json')]
+        for path, p50 in zip(paths, (10.0, 5.0)):
+            write_report({'commit': 'abc', 'results': {'trivia': {'1000': {'endpoints': {
+                'GET /categories': {'p50_ms': p50, 'p99_ms': 20.0, 'rps': 100.0, 'queries_per_request': 1.0},
+                'GET /secret': {'skipped': 'set TOKEN'}}}}}}, path)
+
+        lines = compare(*paths)
+
+        self.assertEqual(len(lines), 2)
+        self.assertIn('p50_ms 10.0 -> 5.0 (-50.0%)', lines[1])
+        with open(paths[0]) as reportFile:
+            self.assertEqual(json.load(reportFile)['commit'], 'abc')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,8 +3,9 @@ from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from auth import AuthError, requires_auth
-from models import db_drop_and_create_all, setup_db, Actor, Movie
+from models import db_drop_and_create_all, setup_db, row_count, db, Actor, Movie
 from config import ROWS_PER_PAGE
+from flask_dbtools.routing import read_only
 
 
 def create_app(test_config=None):
@@ -24,6 +25,7 @@ def create_app(test_config=None):
   def after_request(response):
       response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,true')
       response.headers.add('Access-Control-Allow-Methods', 'GET,PATCH,POST,DELETE,OPTIONS')
+      response.headers.add('Access-Control-Expose-Headers', 'X-Total-Count,Link')
       return response
 
 
@@ -44,18 +46,42 @@ def create_app(test_config=None):
           return default_text
 
 
-  def paginate_results(request, selection):
+  def paginate_results(request, query, model):
     '''
-    Paginates and formats database queries
-    input: <HTTP object> request, that may contain a "page" value
-           <database selection> selection of objects, queried from database
+    Pages and formats a database query in SQL, in id order
+    input: <HTTP object> request, that may contain a "page" value, or an "after_id"
+           to continue after that id (keyset paging, as fast for the last page as the first)
+           <database query> query of objects, not yet run
+           <model> model class queried
     output: <list> list of dictionaries of objects according to ROWS_PER_PAGE
-    '''    
-    page = request.args.get('page', 1, type=int)    
-    start =  (page - 1) * ROWS_PER_PAGE
-    end = start + ROWS_PER_PAGE    
-    objects_formatted = [object_name.format() for object_name in selection]
-    return objects_formatted[start:end]
+    '''
+    query = query.order_by(model.id)
+    after_id = request.args.get('after_id', None, type=int)
+    if after_id is not None:
+      query = query.filter(model.id > after_id)
+    else:
+      page = request.args.get('page', 1, type=int)
+      if page < 1:
+        return []
+      query = query.offset((page - 1) * ROWS_PER_PAGE)
+    return [object_name.format() for object_name in query.limit(ROWS_PER_PAGE)]
+
+
+  def paged_response(body, objects_paginated, model):
+    '''
+    Adds paging headers to a page of objects
+    input: <dict> response body
+           <list> formatted objects of the page
+           <model> model class paged
+    output: <HTTP response> body with X-Total-Count and, unless this is the last page,
+            a Link to the next one by after_id
+    '''
+    response = jsonify(body)
+    response.headers['X-Total-Count'] = str(row_count(model))
+    if len(objects_paginated) == ROWS_PER_PAGE:
+      response.headers['Link'] = '<{}?after_id={}>; rel="next"'.format(
+        request.base_url, objects_paginated[-1]['id'])
+    return response
 
 
   #----------------------------------------------------------------------------#
@@ -67,15 +93,17 @@ def create_app(test_config=None):
   #----------------------------------------------------------------------------#
   @app.route('/actors', methods=['GET'])
   @requires_auth('get:actors')
+  @read_only
   def get_actors(payload):
-    selection = Actor.query.all()
-    actors_paginated = paginate_results(request, selection)
+    # actors' movies are not listed, so skip the joined load of the backref
+    selection = Actor.query.options(db.lazyload(Actor.movies))
+    actors_paginated = paginate_results(request, selection, Actor)
     if len(actors_paginated) == 0:
       abort(404, {'message': 'No actors found in database.'})
-    return jsonify({
+    return paged_response({
       'success': True,
       'actors': actors_paginated
-    })
+    }, actors_paginated, Actor)
 
 
 
@@ -158,17 +186,17 @@ def create_app(test_config=None):
   #----------------------------------------------------------------------------#
   @app.route('/movies', methods=['GET'])
   @requires_auth('get:movies')
+  @read_only
   def get_movies(payload):
-    selection = Movie.query.all()
-    movies_paginated = paginate_results(request, selection)
+    movies_paginated = paginate_results(request, Movie.query, Movie)
 
     if len(movies_paginated) == 0:
       abort(404, {'message': 'No movies found in database.'})
 
-    return jsonify({
+    return paged_response({
       'success': True,
       'movies': movies_paginated
-    })
+    }, movies_paginated, Movie)
 
 
   @app.route('/movies', methods=['POST'])
@@ -7,6 +7,8 @@ database_config = {
 }
 
 ROWS_PER_PAGE = 10
+# seconds a table's row count, sent as X-Total-Count, is reused before recounting
+ROW_COUNT_TTL = 10
 
 auth0_config = {
     'AUTH0_DOMAIN' : 'huangqiron.us.auth0.com',
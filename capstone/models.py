@@ -1,9 +1,11 @@
 import os
+import time
 from sqlalchemy import Column, String, Integer, create_engine, Date, Float
 from flask_sqlalchemy import SQLAlchemy
+from flask_dbtools.routing import ReplicaDatabase
 import json
 from datetime import date
-from config import database_config
+from config import database_config, ROW_COUNT_TTL
 
 #----------------------------------------------------------------------------#
 # Database Setup 
@@ -13,11 +15,15 @@ from config import database_config
 database_path = os.environ['DATABASE_URL']
 #local postgres database_path
 #database_path = "postgres://{}:{}@{}:{}/{}".format(database_config['user_name'], database_config['password'], database_config['server_name'], database_config['port'],  database_config['database_name'])
+#read replicas of database_path, comma separated; read_only endpoints query them
+replica_paths = [path for path in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if path]
 
-db = SQLAlchemy()
+db = ReplicaDatabase()
 
-def setup_db(app, database_path=database_path):
+def setup_db(app, database_path=database_path, replica_paths=replica_paths):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
+    app.config["SQLALCHEMY_REPLICA_URIS"] = replica_paths
+    app.config["REPLICA_READ_YOUR_WRITES_SECONDS"] = float(os.environ.get('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
@@ -67,6 +73,29 @@ def db_init_records():
     actor3.insert()
 
 
+#----------------------------------------------------------------------------#
+# Row counts
+#----------------------------------------------------------------------------#
+
+# {model: (row count, time counted)}
+row_counts = {}
+
+def row_count(model):
+  '''
+  Number of rows of model, counted at most once per ROW_COUNT_TTL seconds
+  and recounted after this process inserts or deletes one, so paging does
+  not cost a full count per request.
+  '''
+  count, counted_at = row_counts.get(model, (None, None))
+  if count is None or time.monotonic() - counted_at > ROW_COUNT_TTL:
+    count = db.session.query(db.func.count(model.id)).scalar()
+    row_counts[model] = (count, time.monotonic())
+  return count
+
+def forget_row_count(model):
+  row_counts.pop(model, None)
+
+
 #----------------------------------------------------------------------------#
 # starring association N:N 
 #----------------------------------------------------------------------------#
@@ -97,6 +126,7 @@ class Actor(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    forget_row_count(Actor)
   
   def update(self):
     db.session.commit()
@@ -104,6 +134,7 @@ class Actor(db.Model):
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    forget_row_count(Actor)
 
   def format(self):
     return {
@@ -132,6 +163,7 @@ class Movie(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    forget_row_count(Movie)
   
   def update(self):
     db.session.commit()
@@ -139,6 +171,7 @@ class Movie(db.Model):
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    forget_row_count(Movie)
 
   def format(self):
     return {
@@ -3,10 +3,14 @@ import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
 from app import create_app
-from models import setup_db, db_drop_and_create_all, Actor, Movie, db_drop_and_create_all, database_path
+from models import setup_db, db_drop_and_create_all, Actor, Movie, db_drop_and_create_all, database_path, db
 from config import auth_header
 from sqlalchemy import desc
 from datetime import date
+import tempfile
+from flask import Flask, jsonify
+from sqlalchemy import create_engine
+from flask_dbtools.routing import read_only
 
 # Create authorization header for casting_staff and casting_director.
 # casting_staff has only get:actors and get:movies permission
@@ -118,6 +122,15 @@ class CastingTestCase(unittest.TestCase):
         self.assertFalse(data['success'])
         self.assertEqual(data['message'] , 'No actors found in database.')
 
+    def test_get_actors_after_id_continues_in_id_order(self):
+        res = self.client().get('/actors?after_id=1', headers = casting_staff)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([actor['id'] for actor in data['actors']], [2, 3])
+        self.assertEqual(res.headers['X-Total-Count'], '3')
+        self.assertNotIn('Link', res.headers)
+
 #----------------------------------------------------------------------------#
 # Tests for /actors PATCH
 #----------------------------------------------------------------------------#
@@ -238,6 +251,21 @@ class CastingTestCase(unittest.TestCase):
         self.assertFalse(data['success'])
         self.assertEqual(data['message'], 'Authorization header is expected.')
 
+    def test_get_movies_links_next_page_by_after_id(self):
+        with self.app.app_context():
+            for number in range(10):
+                Movie(title = 'paged movie {}'.format(number), release_date = date.today()).insert()
+        res = self.client().get('/movies?page=1', headers = casting_staff)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.headers['X-Total-Count'], '12')
+        self.assertEqual(res.headers['Link'], '<http://localhost/movies?after_id={}>; rel="next"'.format(data['movies'][-1]['id']))
+
+        res = self.client().get('/movies?after_id={}'.format(data['movies'][-1]['id']), headers = casting_staff)
+        second_page = json.loads(self.client().get('/movies?page=2', headers = casting_staff).data)
+
+        self.assertEqual(json.loads(res.data)['movies'], second_page['movies'])
+
     def test_get_movies_with_invalid_page_number(self):        
         res = self.client().get('/movies?page=99999', headers = casting_staff)
         data = json.loads(res.data)
@@ -317,5 +345,61 @@ class CastingTestCase(unittest.TestCase):
         self.assertEqual(data['message'] , 'Movie does not exist.')
 
 
+#----------------------------------------------------------------------------#
+# Tests for read replica routing (SQLite files stand in for the databases)
+#----------------------------------------------------------------------------#
+
+class ReplicaRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        primary_path = 'sqlite:///{}/primary.db'.format(self.directory.name)
+        replica_path = 'sqlite:///{}/replica.db'.format(self.directory.name)
+        self.app = Flask(__name__)
+        self.app.testing = True
+
+        @self.app.route('/actors')
+        @read_only
+        def actor_names():
+            return jsonify([actor.name for actor in Actor.query.order_by(Actor.id)])
+
+        @self.app.route('/actors', methods=['POST'])
+        def add_actor():
+            Actor('written', 'female', 20).insert()
+            return jsonify(True)
+
+        db.session.remove()
+        setup_db(self.app, primary_path, [replica_path])
+        # the replica lags behind: it only holds what was copied to it
+        engine = create_engine(replica_path)
+        db.Model.metadata.create_all(engine)
+        engine.execute(Actor.__table__.insert(), name='replicated')
+        engine.dispose()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.get_engine(self.app).dispose()
+        db.get_engine(self.app, bind='replica0').dispose()
+        self.directory.cleanup()
+
+    def test_read_only_endpoint_reads_replica(self):
+        res = self.client.get('/actors')
+
+        self.assertEqual(json.loads(res.data), ['replicated'])
+
+    def test_reads_after_write_go_to_primary(self):
+        self.client.post('/actors')
+        res = self.client.get('/actors')
+
+        self.assertEqual(json.loads(res.data), ['written'])
+
+    def test_reads_return_to_replica_after_window(self):
+        self.app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = 0
+        self.client.post('/actors')
+        res = self.client.get('/actors')
+
+        self.assertEqual(json.loads(res.data), ['replicated'])
+
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,6 @@
+'''
+Database tooling shared by fyyur, trivia and capstone.
+
+profiler: per-request query counts and timings, with N+1 detection.
+routing: read replica routing for read_only views, with read-your-writes.
+'''
@@ -0,0 +1,179 @@
+import logging
+import re
+import time
+from collections import Counter
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from markupsafe import escape
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# placeholder lists and literals folded away so repeated statements share a fingerprint
+_IN_LIST = re.compile(r'\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)')
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_SPACE = re.compile(r'\s+')
+
+
+class QueryBudgetExceeded(AssertionError):
+    '''
+    Raised in QUERY_PROFILER_STRICT mode when a request runs more statements
+    than its budget or repeats a statement QUERY_REPEAT_THRESHOLD times.
+    '''
+
+
+def fingerprint(statement):
+    '''
+    Normalizes a statement so executions differing only in parameters match.
+    Input: <string> SQL statement
+    Output: <string> fingerprint
+    '''
+    statement = _LITERAL.sub('?', statement)
+    statement = _IN_LIST.sub('(?)', statement)
+    return _SPACE.sub(' ', statement).strip()
+
+
+def query_budget(maxQueries):
+    '''
+    Decorates a view with its own statement budget, overriding QUERY_BUDGET.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def budgeted_view(*args, **kwargs):
+            g.query_budget = maxQueries
+            return view(*args, **kwargs)
+        return budgeted_view
+    return decorator
+
+
+def repeats_expected(view):
+    '''
+    Decorates a view that repeats a statement by design, such as chunked
+    bulk inserts, so its repeats are not reported as N+1 queries.
+    '''
+    @wraps(view)
+    def repeating_view(*args, **kwargs):
+        g.query_repeats_expected = True
+        return view(*args, **kwargs)
+    return repeating_view
+
+
+# ----------------------------------------------------------------------------#
+# Recording.
+# ----------------------------------------------------------------------------#
+
+class QueryProfile:
+    '''
+    Statements sent to the database while serving one request.
+    '''
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.fingerprints = Counter()
+        self.fingerprintSeconds = Counter()
+
+    def record(self, statement, seconds):
+        key = fingerprint(statement)
+        self.count += 1
+        self.seconds += seconds
+        self.fingerprints[key] += 1
+        self.fingerprintSeconds[key] += seconds
+
+    def repeated(self, threshold):
+        # fingerprints run at least threshold times, the usual shape of an N+1
+        return [(key, count) for key, count in self.fingerprints.most_common() if count >= threshold]
+
+
+# conn.info key of the start times of a connection's running statements
+_STARTS = 'query_profiler_start'
+
+
+def _current_profile():
+    return g.get('query_profile') if has_request_context() else None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current_profile() is not None:
+        conn.info.setdefault(_STARTS, []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current_profile()
+    starts = conn.info.get(_STARTS)
+    if profile is not None and starts:
+        profile.record(statement, time.perf_counter() - starts.pop())
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class QueryProfiler:
+    '''
+    Counts and times the statements of every request, on every engine.
+    The totals go out as a Server-Timing header; statements repeated
+    QUERY_REPEAT_THRESHOLD times (outside repeats_expected views) are logged
+    as possible N+1 queries, as are requests over QUERY_BUDGET (or a view's
+    query_budget). With QUERY_PROFILER_PANEL the numbers are appended to
+    HTML pages, and with QUERY_PROFILER_STRICT the offending request raises
+    QueryBudgetExceeded.
+    '''
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PROFILER', True)
+        app.config.setdefault('QUERY_BUDGET', None)
+        app.config.setdefault('QUERY_REPEAT_THRESHOLD', 5)
+        app.config.setdefault('QUERY_PROFILER_PANEL', app.debug)
+        app.config.setdefault('QUERY_PROFILER_STRICT', False)
+        app.extensions['query_profiler'] = self
+        if app.config['QUERY_PROFILER']:
+            app.before_request(self.start)
+            app.after_request(self.finish)
+
+    def start(self):
+        g.query_profile = QueryProfile()
+
+    def finish(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        config = current_app.config
+        budget = g.get('query_budget', config['QUERY_BUDGET'])
+        repeated = [] if g.get('query_repeats_expected') else profile.repeated(config['QUERY_REPEAT_THRESHOLD'])
+        problems = []
+        if budget is not None and profile.count > budget:
+            problems.append('{} ran {} statements, over its budget of {}'.format(request.endpoint, profile.count, budget))
+        for key, count in repeated:
+            problems.append('{} ran this statement {} times: {}'.format(request.endpoint, count, key))
+        for problem in problems:
+            logger.warning('query profiler: %s', problem)
+
+        response.headers.add('Server-Timing', 'db;desc="{} queries";dur={:.2f}'.format(profile.count, profile.seconds * 1000))
+        if repeated:
+            response.headers.add('Server-Timing', 'db-repeat;desc="{} repeated statements";dur={:.2f}'.format(
+                len(repeated), sum(profile.fingerprintSeconds[key] for key, _ in repeated) * 1000))
+        if config['QUERY_PROFILER_PANEL'] and response.mimetype == 'text/html' and not response.is_streamed:
+            self.add_panel(response, profile)
+        if problems and config['QUERY_PROFILER_STRICT']:
+            raise QueryBudgetExceeded('; '.join(problems))
+        return response
+
+    def add_panel(self, response, profile):
+        rows = ''.join('<tr><td>{}</td><td>{:.2f}</td><td><code>{}</code></td></tr>'.format(
+            count, profile.fingerprintSeconds[key] * 1000, escape(key))
+            for key, count in profile.fingerprints.most_common())
+        panel = ('<div id="query-profiler"><p>{} queries in {:.2f} ms</p>'
+                 '<table><tr><th>runs</th><th>ms</th><th>statement</th></tr>{}</table></div>').format(
+            profile.count, profile.seconds * 1000, rows)
+        body = response.get_data(as_text=True)
+        position = body.rfind('</body>')
+        response.set_data(body[:position] + panel + body[position:] if position >= 0 else body + panel)
@@ -0,0 +1,118 @@
+import random
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.sql.dml import UpdateBase
+
+# cookie holding the time of the client's last write, for read-your-writes
+LAST_WRITE_COOKIE = 'db_last_write'
+
+
+# ----------------------------------------------------------------------------#
+# Views.
+# ----------------------------------------------------------------------------#
+
+def read_only(view):
+    '''
+    Marks a view whose queries may be answered by a read replica.
+    '''
+    @wraps(view)
+    def read_only_view(*args, **kwargs):
+        g.read_only = True
+        return view(*args, **kwargs)
+    return read_only_view
+
+
+def replica_binds(app):
+    # one Flask-SQLAlchemy bind per SQLALCHEMY_REPLICA_URIS entry
+    return ['replica{}'.format(number) for number in range(len(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()))]
+
+
+def add_replica_binds(app):
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for bind, uri in zip(replica_binds(app), app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+        binds.setdefault(bind, uri)
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def recently_wrote():
+    # the client wrote within REPLICA_READ_YOUR_WRITES_SECONDS, which replicas may not have caught up with
+    try:
+        lastWrite = float(request.cookies.get(LAST_WRITE_COOKIE, 0))
+    except ValueError:
+        return False
+    return time.time() - lastWrite < current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+
+
+def remember_write(response):
+    # after_request hook: start the client's read-your-writes window
+    if g.get('db_last_write'):
+        response.set_cookie(LAST_WRITE_COOKIE, '{:.3f}'.format(g.db_last_write), httponly=True,
+                            max_age=int(current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 5)) + 1)
+    return response
+
+
+# ----------------------------------------------------------------------------#
+# Session.
+# ----------------------------------------------------------------------------#
+
+class RoutingSession(SignallingSession):
+    '''
+    Sends the queries of read_only views to one of the replica binds, picked
+    once per session, and everything else to the primary. A session that has
+    written anything, or a client inside its read-your-writes window, stays
+    on the primary.
+    '''
+
+    def __init__(self, db, *args, **kwargs):
+        self.db = db
+        super().__init__(db, *args, **kwargs)
+
+    def uses_replica(self):
+        return (has_request_context() and g.get('read_only', False)
+                and not self.info.get('wrote') and bool(replica_binds(self.app))
+                and not recently_wrote())
+
+    def get_bind(self, mapper=None, clause=None):
+        if isinstance(clause, UpdateBase):
+            self.info['wrote'] = True
+        if self._flushing or not self.uses_replica():
+            return super().get_bind(mapper, clause)
+        if 'replica' not in self.info:
+            self.info['replica'] = random.choice(replica_binds(self.app))
+        g.replica_read = True
+        return self.db.get_engine(self.app, bind=self.info['replica'])
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _flushed(session, flushContext):
+    session.info['wrote'] = True
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _committed(session):
+    if session.info.get('wrote') and has_request_context():
+        g.db_last_write = time.time()
+
+
+# ----------------------------------------------------------------------------#
+# Extension.
+# ----------------------------------------------------------------------------#
+
+class ReplicaDatabase(SQLAlchemy):
+    '''
+    SQLAlchemy extension whose sessions route read_only views to the
+    SQLALCHEMY_REPLICA_URIS databases, keeping each client on the primary
+    for REPLICA_READ_YOUR_WRITES_SECONDS after it writes.
+    '''
+
+    def init_app(self, app):
+        add_replica_binds(app)
+        super().init_app(app)
+        app.after_request(remember_write)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
@@ -0,0 +1,9 @@
+from setuptools import setup
+
+setup(
+    name='flask-dbtools',
+    version='0.1.0',
+    description='Database tooling shared by the Flask apps of this repository',
+    packages=['flask_dbtools'],
+    install_requires=['Flask', 'Flask-SQLAlchemy', 'SQLAlchemy', 'MarkupSafe'],
+)
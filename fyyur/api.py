@@ -0,0 +1,177 @@
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, abort, current_app, request
+
+from model import Artist, Venue, Genres, db, venue_genres, artist_generes
+from queries import show_rows, encode_cursor, decode_cursor
+from scheduling import read_schedule_csv, schedule_shows
+from engine import statement_timeout
+from flask_dbtools.routing import read_only
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+VENUE_FIELDS = ('id', 'name', 'city', 'state', 'address', 'phone', 'website', 'image_link', 'facebook_link',
+                'seeking_talent', 'seeking_description', 'upcoming_shows_count', 'past_shows_count')
+ARTIST_FIELDS = ('id', 'name', 'city', 'state', 'phone', 'website', 'image_link', 'facebook_link',
+                 'seeking_venue', 'seeking_description', 'upcoming_shows_count', 'past_shows_count')
+SHOW_FIELDS = ('venue_id', 'venue_name', 'artist_id', 'artist_name', 'artist_image_link', 'start_time')
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+
+
+# ----------------------------------------------------------------------------#
+# Serialization.
+# ----------------------------------------------------------------------------#
+
+def _default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError('{} is not JSON serializable'.format(type(value).__name__))
+
+
+def dumps(content):
+    '''
+    Serializes to compact JSON bytes, with orjson when it is installed.
+    Datetimes are written as ISO 8601 either way.
+    '''
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(content, separators=(',', ':'), default=_default).encode()
+
+
+def json_response(content, status=200):
+    return Response(dumps(content), status=status, mimetype='application/json')
+
+
+@api.errorhandler(400)
+@api.errorhandler(404)
+def http_error(error):
+    return json_response({'error': error.code, 'message': error.description}, error.code)
+
+
+# ----------------------------------------------------------------------------#
+# Request arguments.
+# ----------------------------------------------------------------------------#
+
+def requested_fields(allowed):
+    '''
+    Reads ?fields=a,b,c; every allowed field when it is missing.
+    Unknown field names are a 400.
+    '''
+    if not request.args.get('fields'):
+        return list(allowed)
+    fields = list(dict.fromkeys(field.strip() for field in request.args['fields'].split(',') if field.strip()))
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        abort(400, 'Unknown fields: ' + ', '.join(unknown))
+    return fields
+
+
+def requested_limit():
+    limit = request.args.get('limit', DEFAULT_LIMIT, type=int)
+    return min(max(limit, 1), MAX_LIMIT)
+
+
+# ----------------------------------------------------------------------------#
+# Venues and artists.
+# ----------------------------------------------------------------------------#
+
+def _entity_list(model, allowed):
+    # keyset pages by id: ?after=<last id seen>&limit=<n>
+    fields = requested_fields(allowed)
+    limit = requested_limit()
+    query = model.query.with_entities(model.id, *(getattr(model, field) for field in fields)) \
+        .order_by(model.id)
+    if 'after' in request.args:
+        after = request.args.get('after', type=int)
+        if after is None:
+            abort(400, 'Malformed cursor')
+        query = query.filter(model.id > after)
+    rows = query.limit(limit + 1).all()
+    nextAfter = rows[limit - 1][0] if len(rows) > limit else None
+    return json_response({'data': [dict(zip(fields, row[1:])) for row in rows[:limit]], 'next': nextAfter})
+
+
+def _entity_detail(model, allowed, association, ownColumn, entityId):
+    fields = requested_fields(allowed + ('genres',))
+    columns = [field for field in fields if field != 'genres']
+    row = model.query.with_entities(model.id, *(getattr(model, field) for field in columns)) \
+        .filter(model.id == entityId) \
+        .first()
+    if row is None:
+        abort(404)
+    entity = dict(zip(columns, row[1:]))
+    if 'genres' in fields:
+        entity['genres'] = [name for name, in db.session.query(Genres.name)
+                            .join(association, association.c.genres_id == Genres.id)
+                            .filter(ownColumn == entityId)
+                            .order_by(Genres.name)]
+    return json_response(entity)
+
+
+@api.route('/venues')
+@read_only
+def venues():
+    return _entity_list(Venue, VENUE_FIELDS)
+
+
+@api.route('/venues/<int:venue_id>')
+@read_only
+def venue(venue_id):
+    return _entity_detail(Venue, VENUE_FIELDS, venue_genres, venue_genres.c.venue_id, venue_id)
+
+
+@api.route('/artists')
+@read_only
+def artists():
+    return _entity_list(Artist, ARTIST_FIELDS)
+
+
+@api.route('/artists/<int:artist_id>')
+@read_only
+def artist(artist_id):
+    return _entity_detail(Artist, ARTIST_FIELDS, artist_generes, artist_generes.c.artist_id, artist_id)
+
+
+# ----------------------------------------------------------------------------#
+# Shows.
+# ----------------------------------------------------------------------------#
+
+@api.route('/shows')
+@read_only
+def shows():
+    # same keyset cursor as the /shows page: ?after=<cursor>&limit=<n>
+    fields = requested_fields(SHOW_FIELDS)
+    limit = requested_limit()
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        abort(400, 'Malformed cursor')
+    rows = list(show_rows(after, limit + 1))
+    nextCursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return json_response({'data': [{field: row[field] for field in fields} for row in rows[:limit]],
+                          'next': nextCursor})
+
+
+@api.route('/shows', methods=['POST'])
+@statement_timeout(60000)
+def schedule():
+    # a JSON list of {venue_id, artist_id, start_time} objects, or a text/csv body with that header
+    if request.mimetype == 'text/csv':
+        rows = read_schedule_csv(request.get_data(as_text=True).splitlines())
+    else:
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            abort(400, 'Expected a JSON list of shows or a text/csv body')
+    report = schedule_shows(rows)
+    cache = current_app.extensions.get('page_cache')
+    if cache is not None and report['inserted']:
+        for namespace in ('venues', 'venue', 'artist', 'shows'):
+            cache.invalidate(namespace)
+    return json_response(report)
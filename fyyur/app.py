@@ -2,7 +2,6 @@
 # Imports
 # ----------------------------------------------------------------------------#
 import dateutil.parser
-import babel
 from flask import (
     Flask,
     render_template,
@@ -11,15 +10,29 @@ from flask import (
     flash,
     redirect,
     url_for,
-    jsonify
+    jsonify,
+    abort,
+    stream_with_context
 )
 from flask_moment import Moment
+import click
 import logging
 from logging import Formatter, FileHandler
 from forms import *
 from flask_migrate import Migrate
-from datetime import datetime
-from model import Artist, Venue, Show, Genres, db, init
+from datetime import datetime, timedelta
+from model import Artist, Venue, Show, db, count_show, release_shows, refresh_show_counts, resolve_genres
+from queries import venue_areas, venue_detail, artist_detail, show_rows, show_page, decode_cursor
+from search import search_index
+from seed import seed_command
+from scheduling import read_schedule_csv, schedule_shows
+from conflicts import DEFAULT_DURATION_MINUTES, MAX_DURATION_MINUTES, find_conflicts, describe_conflict
+from formatting import format_datetime
+from cache import PageCache
+from api import api
+from engine import pool_stats
+from flask_dbtools.routing import read_only
+from flask_dbtools.profiler import QueryProfiler
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -28,26 +41,29 @@ from model import Artist, Venue, Show, Genres, db, init
 app = Flask(__name__)
 moment = Moment(app)
 app.config.from_object('config')
-with app.app_context():
-    db.init_app(app)
-    init()
+db.init_app(app)
+if app.config.get('SEED_ON_STARTUP'):
+    with app.app_context():
+        app.logger.info(seed_command())
 migrate = Migrate(app, db)
+cache = PageCache(app)
+profiler = QueryProfiler(app)
+app.register_blueprint(api)
 
 
 # ----------------------------------------------------------------------------#
 # Filters.
 # ----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format)
+app.jinja_env.filters['datetime'] = format_datetime
 
 
-app.jinja_env.filters['datetime'] = format_datetime
+def stream_template(templateName, **context):
+    # render a template chunk by chunk instead of building the whole page in memory
+    app.update_template_context(context)
+    stream = app.jinja_env.get_template(templateName).stream(context)
+    stream.enable_buffering(20)
+    return stream
 
 
 # ----------------------------------------------------------------------------#
@@ -63,40 +79,22 @@ def index():
 #  ----------------------------------------------------------------
 
 @app.route('/venues')
+@cache.cached('venues')
+@read_only
 def venues():
-    data = []
-    currentDateTime = datetime.today()
-    for [city, state] in Venue.query.with_entities(Venue.city, Venue.state).distinct():
-        venues = []
-        for venue in Venue.query.filter_by(city=city).all():
-            venueInfo = {
-                'id': venue.id,
-                'name': venue.name,
-                'num_upcoming_shows': Show.query.filter(Show.venue_id == venue.id,
-                                                        Show.start_time >= currentDateTime).count()
-            }
-            venues.append(venueInfo)
-        cityInfo = {
-            'city': city,
-            'state': state,
-            'venues': venues
-        }
-        data.append(cityInfo)
-
+    data = venue_areas()
     return render_template('pages/venues.html', areas=data)
 
 
 @app.route('/venues/search', methods=['POST'])
 def search_venues():
     venues = []
-    currentDateTime = datetime.today()
-    venueName = request.form.get('search_term')
-    for venue in Venue.query.filter(Venue.name.ilike("%{}%".format(venueName))).all():
+    venueName = request.form.get('search_term', '')
+    for venue in search_index(Venue).search(venueName):
         venueInfo = {
             'id': venue.id,
             'name': venue.name,
-            'num_upcoming_shows': Show.query.filter(Show.venue_id == venue.id,
-                                                    Show.start_time >= currentDateTime).count()
+            'num_upcoming_shows': venue.upcoming_shows_count
         }
         venues.append(venueInfo)
 
@@ -110,42 +108,12 @@ def search_venues():
 
 
 @app.route('/venues/<int:venue_id>')
+@cache.cached('venue', entity='venue_id')
+@read_only
 def show_venue(venue_id):
-    currentDateTime = datetime.today()
-    venue = Venue.query.filter_by(id=venue_id).first()
-    pastShows = []
-    upcomingShows = []
-    for show in venue.shows:
-        showInfo = {
-            "artist_id": show.artist_id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": show.start_time.isoformat() + ".000Z"
-        }
-        if show.start_time >= currentDateTime:
-            upcomingShows.append(showInfo)
-        else:
-            pastShows.append(showInfo)
-
-    data = {
-        "id": venue.id,
-        "name": venue.name,
-        "genres": [g.name for g in venue.genres],
-        "address": venue.address,
-        "city": venue.city,
-        "state": venue.state,
-        "phone": venue.phone,
-        "website": venue.website,
-        "facebook_link": venue.facebook_link,
-        "seeking_talent": venue.seeking_talent,
-        "seeking_description": venue.seeking_description,
-        "image_link": venue.image_link,
-        "past_shows": pastShows,
-        "upcoming_shows": upcomingShows,
-        "past_shows_count": len(pastShows),
-        "upcoming_shows_count": len(upcomingShows),
-    }
-
+    data = venue_detail(venue_id, datetime.today())
+    if data is None:
+        abort(404)
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -176,14 +144,10 @@ def create_venue_submission():
                       phone=venuePhone,
                       facebook_link=venueFacebookLink
                       )
-        for venueGenres in venueGenresList:
-            if Genres.query.filter_by(name=venueGenres).first():
-                venue.genres.append(Genres.query.filter_by(name=venueGenres).first())
-            else:
-                genres = Genres(name=venueGenres)
-                venue.genres.append(genres)
+        venue.genres = resolve_genres(venueGenresList)
         db.session.add(venue)
         db.session.commit()
+        cache.invalidate('venues')
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
         db.session.rollback()
@@ -199,8 +163,13 @@ def delete_venue(venue_id):
     try:
         venue = Venue.query.filter_by(id=venue_id).first()
         venue.genres = []
+        release_shows(venueId=venue.id)
         db.session.delete(venue)
         db.session.commit()
+        # the venue's shows are gone from the show list and from its artists' pages
+        for namespace in ('venues', 'shows', 'artist'):
+            cache.invalidate(namespace)
+        cache.invalidate('venue', venue_id)
         response = {'success': True,
                     'id': venue_id
                     }
@@ -219,6 +188,8 @@ def delete_venue(venue_id):
 #  Artists
 #  ----------------------------------------------------------------
 @app.route('/artists')
+@cache.cached('artists')
+@read_only
 def artists():
     data = []
     for artist in Artist.query.all():
@@ -234,14 +205,12 @@ def artists():
 @app.route('/artists/search', methods=['POST'])
 def search_artists():
     artists = []
-    currentDateTime = datetime.today()
-    artistName = request.form.get('search_term')
-    for artist in Artist.query.filter(Artist.name.ilike("%{}%".format(artistName))).all():
+    artistName = request.form.get('search_term', '')
+    for artist in search_index(Artist).search(artistName):
         artistInfo = {
             'id': artist.id,
             'name': artist.name,
-            'num_upcoming_shows': Show.query.filter(Show.artist_id == artist.id,
-                                                    Show.start_time >= currentDateTime).count()
+            'num_upcoming_shows': artist.upcoming_shows_count
         }
         artists.append(artistInfo)
 
@@ -255,41 +224,12 @@ def search_artists():
 
 
 @app.route('/artists/<int:artist_id>')
+@cache.cached('artist', entity='artist_id')
+@read_only
 def show_artist(artist_id):
-    currentDateTime = datetime.today()
-    artist = Artist.query.filter_by(id=artist_id).first()
-    pastShows = []
-    upcomingShows = []
-    for show in artist.shows:
-        showInfo = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": show.start_time.isoformat() + ".000Z"
-        }
-        if show.start_time >= currentDateTime:
-            upcomingShows.append(showInfo)
-        else:
-            pastShows.append(showInfo)
-
-    data = {
-        "id": artist.id,
-        "name": artist.name,
-        "genres": [g.name for g in artist.genres],
-        "city": artist.city,
-        "state": artist.state,
-        "phone": artist.phone,
-        "website": artist.website,
-        "facebook_link": artist.facebook_link,
-        "seeking_venue": artist.seeking_venue,
-        "seeking_description": artist.seeking_description,
-        "image_link": artist.image_link,
-        "past_shows": pastShows,
-        "upcoming_shows": upcomingShows,
-        "past_shows_count": len(pastShows),
-        "upcoming_shows_count": len(upcomingShows)
-    }
-
+    data = artist_detail(artist_id, datetime.today())
+    if data is None:
+        abort(404)
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -324,14 +264,12 @@ def edit_artist_submission(artist_id):
     oldArtistData.city = newArtistData.get('city')
     oldArtistData.state = newArtistData.get('state')
     oldArtistData.facebook_link = newArtistData.get('facebook_link')
-    oldArtistData.genres = []
-    for artistGenres in newArtistData.getlist('genres'):
-        if Genres.query.filter_by(name=artistGenres).first():
-            oldArtistData.genres.append(Genres.query.filter_by(name=artistGenres).first())
-        else:
-            genres = Genres(name=artistGenres)
-            oldArtistData.genres.append(genres)
+    oldArtistData.genres = resolve_genres(newArtistData.getlist('genres'))
     db.session.commit()
+    # artist names also appear on the show list and on venue pages
+    for namespace in ('artists', 'shows', 'venue'):
+        cache.invalidate(namespace)
+    cache.invalidate('artist', artist_id)
     db.session.close()
     return redirect(url_for('show_artist', artist_id=artist_id))
 
@@ -367,14 +305,12 @@ def edit_venue_submission(venue_id):
     oldVenueData.city = newVenueData.get('city')
     oldVenueData.state = newVenueData.get('state')
     oldVenueData.facebook_link = newVenueData.get('facebook_link')
-    oldVenueData.genres = []
-    for venueGenres in newVenueData.getlist('genres'):
-        if Genres.query.filter_by(name=venueGenres).first():
-            oldVenueData.genres.append(Genres.query.filter_by(name=venueGenres).first())
-        else:
-            genres = Genres(name=venueGenres)
-            oldVenueData.genres.append(genres)
+    oldVenueData.genres = resolve_genres(newVenueData.getlist('genres'))
     db.session.commit()
+    # venue names also appear on the show list and on artist pages
+    for namespace in ('venues', 'shows', 'artist'):
+        cache.invalidate(namespace)
+    cache.invalidate('venue', venue_id)
     db.session.close()
 
     return redirect(url_for('show_venue', venue_id=venue_id))
@@ -405,14 +341,10 @@ def create_artist_submission():
                         state=artistState,
                         facebook_link=artistFacebookLink
                         )
-        for artistGenres in artistGenresList:
-            if Genres.query.filter_by(name=artistGenres).first():
-                artist.genres.append(Genres.query.filter_by(name=artistGenres).first())
-            else:
-                genres = Genres(name=artistGenres)
-                artist.genres.append(genres)
+        artist.genres = resolve_genres(artistGenresList)
         db.session.add(artist)
         db.session.commit()
+        cache.invalidate('artists')
         flash('artist ' + request.form['name'] + ' was successfully listed!')
     except:
         db.session.rollback()
@@ -427,18 +359,19 @@ def create_artist_submission():
 #  ----------------------------------------------------------------
 
 @app.route('/shows')
+@cache.cached('shows', unless=lambda: request.args.get('stream', 0, type=int))
+@read_only
 def shows():
-    data = []
-    for show in Show.query.all():
-        showInfo = {'venue_id': show.venue_id,
-                    'venue_name': show.venue.name,
-                    'artist_id': show.artist_id,
-                    'artist_name': show.artist.name,
-                    'artist_image_link': show.artist.image_link,
-                    'start_time': show.start_time.isoformat() + ".000Z"
-                    }
-        data.append(showInfo)
-    return render_template('pages/shows.html', shows=data)
+    # ?stream=1 streams every show; otherwise one keyset page, continued with ?after=<cursor>
+    if request.args.get('stream', 0, type=int):
+        return Response(stream_with_context(
+            stream_template('pages/shows.html', shows=show_rows(), next_cursor=None)))
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        abort(400)
+    data, nextCursor = show_page(after, app.config['SHOWS_PER_PAGE'])
+    return render_template('pages/shows.html', shows=data, next_cursor=nextCursor)
 
 
 @app.route('/shows/create')
@@ -454,19 +387,34 @@ def create_show_submission():
         showData = request.form
         showVenueId = showData.get('venue_id')
         showArtistId = showData.get('artist_id')
-        showStartTime = showData.get('start_time')
-        if not Venue.query.filter_by(id=showVenueId).first():
+        showStartTime = dateutil.parser.parse(showData.get('start_time'))
+        showDuration = int(showData.get('duration_minutes') or DEFAULT_DURATION_MINUTES)
+        if not 1 <= showDuration <= MAX_DURATION_MINUTES:
+            flash('The duration must be between 1 and {} minutes.'.format(MAX_DURATION_MINUTES))
+        elif not Venue.query.filter_by(id=showVenueId).first():
             flash('The venue does not exist. Please find the venue id from the venues page.')
         elif not Artist.query.filter_by(id=showArtistId).first():
             flash('The artist does not exist. Please find the artist id from the venues page.')
         else:
-            show = Show(venue_id=showVenueId,
-                        artist_id=showArtistId,
-                        start_time=showStartTime
-                        )
-            db.session.add(show)
-            db.session.commit()
-            flash('Show was successfully listed!')
+            conflicts = find_conflicts(showVenueId, showArtistId, showStartTime, showDuration)
+            if conflicts:
+                conflict = conflicts[0]
+                flash('Show could not be listed: ' + describe_conflict(
+                    (conflict.venue_id, conflict.artist_id, conflict.start_time), showVenueId, showArtistId) + '.')
+            else:
+                show = Show(venue_id=showVenueId,
+                            artist_id=showArtistId,
+                            start_time=showStartTime,
+                            duration_minutes=showDuration
+                            )
+                db.session.add(show)
+                count_show(showVenueId, showArtistId, showStartTime)
+                db.session.commit()
+                for namespace in ('venues', 'shows'):
+                    cache.invalidate(namespace)
+                cache.invalidate('venue', int(showVenueId))
+                cache.invalidate('artist', int(showArtistId))
+                flash('Show was successfully listed!')
     except:
         db.session.rollback()
         flash('Show could not be listed!')
@@ -476,6 +424,66 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+#  Commands
+#  ----------------------------------------------------------------
+
+def invalidate_from_command(*namespaces):
+    # a command runs in its own process: only a shared cache backend reaches the server's pages
+    if cache.shared:
+        for namespace in namespaces:
+            cache.invalidate(namespace)
+    elif cache.backend is not None:
+        click.echo('Pages cached by a running server expire within CACHE_TTL ({}s); '
+                   "set CACHE_BACKEND = 'redis' to invalidate them from commands.".format(cache.ttl), err=True)
+
+
+@app.cli.command('seed')
+@click.argument('path', required=False)
+def seed_database_command(path):
+    # PATH is a .json dump or a directory of CSV files; data.py is used when omitted
+    try:
+        click.echo(seed_command(path))
+    except ValueError as error:
+        raise click.ClickException(str(error))
+    invalidate_from_command('venues', 'venue', 'artists', 'artist', 'shows')
+
+
+@app.cli.command('schedule-shows')
+@click.argument('path')
+def schedule_shows_command(path):
+    # PATH is a CSV file with a venue_id, artist_id, start_time header
+    with open(path, newline='') as schedule:
+        report = schedule_shows(read_schedule_csv(schedule))
+    for error in report['errors']:
+        click.echo('row {}: {}'.format(error['row'], error['error']))
+    click.echo('Scheduled {} shows, {} rows rejected.'.format(report['inserted'], len(report['errors'])))
+    invalidate_from_command('venues', 'venue', 'artist', 'shows')
+
+
+@app.cli.command('refresh-show-counts')
+@click.option('--minutes', default=60, type=int,
+              help='Refresh entities with shows started in the last N minutes; 0 refreshes everything.')
+def refresh_show_counts_command(minutes):
+    # run periodically (e.g. from cron) so shows roll over from upcoming to past
+    currentDateTime = datetime.today()
+    since = currentDateTime - timedelta(minutes=minutes) if minutes else None
+    numVenues, numArtists = refresh_show_counts(currentDateTime, since)
+    click.echo('Refreshed show counts of {} venues and {} artists.'.format(numVenues, numArtists))
+    invalidate_from_command('venues')
+
+
+@app.route('/db/pool')
+def database_pool_stats():
+    # connections checked out now and checkout waits since this process started
+    return jsonify(pool_stats(db.engine))
+
+
+@app.route('/cache/stats')
+def cache_stats():
+    # page cache hits and misses per namespace, counted by this process
+    return jsonify(cache.metrics())
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
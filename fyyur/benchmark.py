@@ -0,0 +1,362 @@
+'''
+Benchmarks for the fyyur data layer.
+Seeds a throwaway SQLite database at increasing scale and reports how many
+queries and how much time each view query needs.
+
+    $ python benchmark.py --rows 100 1000 10000 100000
+'''
+import argparse
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import babel.dates
+import dateutil.parser
+from flask import Flask
+from jinja2 import Environment
+from sqlalchemy import event
+
+from formatting import format_datetime
+from model import Artist, Venue, Show, db, refresh_show_counts, resolve_genres
+from queries import venue_areas, venue_detail, artist_detail, show_rows, show_page, decode_cursor
+from search import search_index
+from scheduling import schedule_shows
+
+CITIES = [('San Francisco', 'CA'), ('New York', 'NY'), ('Seattle', 'WA'), ('Austin', 'TX')]
+NAME_WORDS = ['Guns', 'Petals', 'Matt', 'Quevedo', 'Wild', 'Sax', 'Band', 'Musical', 'Hop',
+              'Dueling', 'Pianos', 'Park', 'Square', 'Live', 'Music', 'Coffee', 'Blue', 'Velvet',
+              'Electric', 'Owls', 'Neon', 'Harbor', 'Stone', 'Echo', 'Lantern', 'Static', 'Tide']
+SEARCH_TERMS = ['ba', 'velvet', 'echo lan', '12345']
+
+
+# ----------------------------------------------------------------------------#
+# Helpers.
+# ----------------------------------------------------------------------------#
+
+def create_benchmark_app(databasePath):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + databasePath
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+@contextmanager
+def count_queries():
+    '''
+    Counts the statements sent to the database inside the block.
+    Output: <list> executed statements, filled in as the block runs
+    '''
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+@contextmanager
+def capture_queries():
+    '''
+    Records the SELECT, UPDATE and DELETE statements sent inside the block
+    with their parameters, so they can be explained afterwards.
+    Output: <list> [(statement, parameters)], filled in as the block runs
+    '''
+    queries = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            queries.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield queries
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def _plan_nodes(node):
+    yield node
+    for child in node.get('Plans', []):
+        yield from _plan_nodes(child)
+
+
+def sequential_scans(statement, parameters):
+    '''
+    Explains a statement and lists the tables it reads with a full table scan
+    (a Postgres "Seq Scan", a SQLite "SCAN <table>" without an index).
+    Output: <list> table names
+    '''
+    cursor = db.session.connection().connection.cursor()
+    try:
+        if db.engine.dialect.name == 'postgresql':
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+            plan = cursor.fetchone()[0]
+            plan = json.loads(plan) if isinstance(plan, str) else plan
+            return [node['Relation Name'] for node in _plan_nodes(plan[0]['Plan'])
+                    if node['Node Type'] == 'Seq Scan']
+        cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        scans = []
+        for row in cursor.fetchall():
+            words = row[-1].split()
+            if words[0] == 'SCAN' and 'USING' not in words:
+                # older SQLite versions write "SCAN TABLE <table>"
+                table = words[2] if words[1] == 'TABLE' else words[1]
+                if table not in ('SUBQUERY', 'CONSTANT'):
+                    scans.append(table)
+        return scans
+    finally:
+        cursor.close()
+
+
+def seed(numVenues, showsPerVenue=2, currentDateTime=None):
+    '''
+    Bulk inserts numVenues venues spread over a few cities, one artist and
+    showsPerVenue shows per venue, half in the past and half upcoming.
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    db.session.execute(Artist.__table__.insert(), [{'id': 1, 'name': 'Benchmark Artist'}])
+    db.session.execute(Venue.__table__.insert(), [
+        {'id': venueId,
+         'name': 'Venue {}'.format(venueId),
+         'city': CITIES[venueId % len(CITIES)][0],
+         'state': CITIES[venueId % len(CITIES)][1]}
+        for venueId in range(1, numVenues + 1)
+    ])
+    showRows = []
+    for venueId in range(1, numVenues + 1):
+        for showNumber in range(showsPerVenue):
+            offset = timedelta(days=showNumber + 1)
+            startTime = currentDateTime + offset if showNumber % 2 else currentDateTime - offset
+            showRows.append({'venue_id': venueId, 'artist_id': 1, 'start_time': startTime})
+    if showRows:
+        db.session.execute(Show.__table__.insert(), showRows)
+    refresh_show_counts(currentDateTime)
+
+
+def seed_artists(numArtists):
+    '''
+    Bulk inserts numArtists artists with synthetic, mostly distinct names.
+    '''
+    db.session.execute(Artist.__table__.insert(), [
+        {'id': artistId,
+         'name': '{} {} {}'.format(NAME_WORDS[artistId % len(NAME_WORDS)],
+                                   NAME_WORDS[(artistId // len(NAME_WORDS)) % len(NAME_WORDS)].lower(),
+                                   artistId)}
+        for artistId in range(1, numArtists + 1)
+    ])
+    db.session.commit()
+
+
+# ----------------------------------------------------------------------------#
+# Scenarios.
+# ----------------------------------------------------------------------------#
+
+def timed(function, *args):
+    with count_queries() as statements:
+        start = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - start
+    return len(statements), elapsed
+
+
+def bench_venue_areas(numRows):
+    seed(numRows)
+    numQueries, elapsed = timed(venue_areas)
+    yield 'venue_areas', numQueries, elapsed
+
+
+def bench_search(numRows):
+    seed_artists(numRows)
+    index = search_index(Artist)
+    if hasattr(index, 'build'):
+        yield 'search build', *timed(index.build)
+    for term in SEARCH_TERMS:
+        yield 'search "{}"'.format(term), *timed(index.search, term, 20)
+        yield 'ilike  "{}"'.format(term), *timed(
+            lambda: Artist.query.filter(Artist.name.ilike('%{}%'.format(term)))
+            .order_by(Artist.name).limit(20).all())
+
+
+def bench_shows(numRows):
+    seed(max(numRows // 2, 1))
+    db.session.expunge_all()
+    numQueries, elapsed = timed(show_page, None, 30)
+    yield 'shows first page', numQueries, elapsed
+
+    # stream every show, reporting the peak memory allocated while doing it
+    tracemalloc.start()
+    numQueries, elapsed = timed(lambda: deque(show_rows(), maxlen=0))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    yield 'shows stream peak={}KiB'.format(peak // 1024), numQueries, elapsed
+
+
+def legacy_format_datetime(value, format='medium'):
+    # the filter as it was: a string reparsed and a pattern rebuilt on every call
+    date = dateutil.parser.parse(value)
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format)
+
+
+def bench_datetime(numRows):
+    seed(max(numRows // 2, 1))
+    rows = list(show_rows())
+    for label, formatter, shows in (
+            ('datetime legacy', legacy_format_datetime,
+             [dict(show, start_time=show['start_time'].replace(microsecond=0).isoformat() + '.000Z')
+              for show in rows]),
+            ('datetime cached', format_datetime, rows)):
+        environment = Environment()
+        environment.filters['datetime'] = formatter
+        page = environment.from_string("{% for show in shows %}{{ show.start_time|datetime('full') }}{% endfor %}")
+        numQueries, elapsed = timed(page.render, {'shows': shows})
+        yield '{} {:.1f}us/row'.format(label, elapsed / len(shows) * 1e6), numQueries, elapsed
+
+
+def bench_schedule(numRows):
+    # numRows non-overlapping shows over numRows // 50 venues and artists, plus a replay of the first 1%
+    numEntities = max(numRows // 50, 1)
+    seed_artists(numEntities)
+    db.session.execute(Venue.__table__.insert(), [{'id': venueId, 'name': 'Venue {}'.format(venueId)}
+                                                  for venueId in range(1, numEntities + 1)])
+    db.session.commit()
+    firstStart = datetime(2035, 1, 1, 18, 0)
+    rows = [{'venue_id': showNumber % numEntities + 1,
+             'artist_id': showNumber % numEntities + 1,
+             'start_time': (firstStart + timedelta(hours=3 * (showNumber // numEntities))).isoformat()}
+            for showNumber in range(numRows)]
+    rows += rows[:max(numRows // 100, 1)]
+    with count_queries() as statements:
+        start = time.perf_counter()
+        report = schedule_shows(rows)
+        elapsed = time.perf_counter() - start
+    yield 'schedule inserted={} rejected={}'.format(report['inserted'], len(report['errors'])), \
+        len(statements), elapsed
+
+
+API_PAGES = [
+    ('/venues', '/api/v1/venues?fields=id,name,city,state,upcoming_shows_count&limit=1000'),
+    ('/venues/1', '/api/v1/venues/1'),
+    ('/artists/1', '/api/v1/artists/1'),
+    ('/shows', '/api/v1/shows?limit=30'),
+]
+
+
+def bench_api(numRows):
+    # the HTML pages against their /api/v1 counterparts, both served by the fyyur app
+    from app import app as fyyurApp, cache
+    seed(numRows)
+    db.session.commit()
+    # the scoped session stays bound to the app it was opened under
+    db.session.remove()
+    fyyurApp.config['SQLALCHEMY_DATABASE_URI'] = str(db.engine.url)
+    cache.backend = None
+    with fyyurApp.app_context():
+        client = fyyurApp.test_client()
+        for htmlUrl, apiUrl in API_PAGES:
+            for kind, url in (('html', htmlUrl), ('api', apiUrl)):
+                client.get(url)
+                with count_queries() as statements:
+                    start = time.perf_counter()
+                    response = client.get(url)
+                    elapsed = time.perf_counter() - start
+                yield '{} {} {:.1f}KiB'.format(kind, url.split('?')[0], len(response.data) / 1024), \
+                    len(statements), elapsed
+        db.session.remove()
+        db.engine.dispose()
+
+
+def indexed_queries(numVenues, currentDateTime):
+    '''
+    The view queries expected to run on indexes, with their arguments, for a
+    database seeded with seed(numVenues). The /artists list reads every artist
+    by design and is left out.
+    '''
+    firstPage, nextCursor = show_page(None, 30)
+    return [
+        ('venue_areas', venue_areas),
+        ('venue_detail', venue_detail, numVenues // 2, currentDateTime),
+        ('artist_detail', artist_detail, 1, currentDateTime),
+        ('shows first page', show_page, None, 30),
+        ('shows next page', show_page, decode_cursor(nextCursor), 30),
+        ('refresh show counts', refresh_show_counts, currentDateTime, currentDateTime - timedelta(hours=1)),
+        ('resolve genres', resolve_genres, ['Jazz', 'Folk']),
+    ]
+
+
+def query_plans(numVenues, currentDateTime=None):
+    '''
+    Runs every indexed view query and explains the statements it sent.
+    Output: <list> [(label, elapsed, [(statement, tables read with a full scan)])]
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    plans = []
+    for label, function, *args in indexed_queries(numVenues, currentDateTime):
+        with capture_queries() as queries:
+            start = time.perf_counter()
+            function(*args)
+            elapsed = time.perf_counter() - start
+        plans.append((label, elapsed, [(statement, sequential_scans(statement, parameters))
+                              for statement, parameters in queries]))
+    db.session.rollback()
+    return plans
+
+
+def bench_plans(numRows):
+    seed(numRows, showsPerVenue=4)
+    for label, elapsed, statements in query_plans(numRows):
+        scans = sorted({table for _, tables in statements for table in tables})
+        yield 'plan {} seq={}'.format(label, ','.join(scans) or '-'), len(statements), elapsed
+
+
+SCENARIOS = {
+    'venue_areas': bench_venue_areas,
+    'search': bench_search,
+    'shows': bench_shows,
+    'datetime': bench_datetime,
+    'plans': bench_plans,
+    'api': bench_api,
+    'schedule': bench_schedule
+}
+
+
+def run(scenarios, rowCounts):
+    for scenario in scenarios:
+        for numRows in rowCounts:
+            handle, databasePath = tempfile.mkstemp(suffix='.db')
+            os.close(handle)
+            app = create_benchmark_app(databasePath)
+            try:
+                with app.app_context():
+                    db.create_all()
+                    for label, numQueries, elapsed in SCENARIOS[scenario](numRows):
+                        print('{:<24}  rows={:>8}  queries={:>3}  time={:.4f}s'.format(
+                            label, numRows, numQueries, elapsed))
+                    db.session.remove()
+                    db.engine.dispose()
+            finally:
+                os.remove(databasePath)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the fyyur data layer.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[100, 1000, 10000, 100000],
+                        help='rows to seed, one run per value (search is meant to go to 1000000)')
+    parser.add_argument('--scenario', nargs='+', choices=sorted(SCENARIOS), default=sorted(SCENARIOS))
+    arguments = parser.parse_args()
+    run(arguments.scenario, arguments.rows)
@@ -0,0 +1,181 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request, session
+from flask_dbtools.routing import recently_wrote
+
+
+# ----------------------------------------------------------------------------#
+# Backends.
+# ----------------------------------------------------------------------------#
+
+class MemoryBackend:
+    '''
+    In-process LRU with a per-entry TTL.
+    Counters bumped with incr are kept apart from the LRU and never evicted:
+    a counter restarting at 1 would bring back entries stored under it.
+    '''
+
+    def __init__(self, maxEntries=1024):
+        self.maxEntries = maxEntries
+        self.entries = OrderedDict()
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.monotonic()
+        values = []
+        with self.lock:
+            for key in keys:
+                if key in self.counters:
+                    values.append(self.counters[key])
+                    continue
+                entry = self.entries.get(key)
+                if entry is not None and entry[1] is not None and entry[1] < now:
+                    del self.entries[key]
+                    entry = None
+                if entry is not None:
+                    self.entries.move_to_end(key)
+                values.append(entry[0] if entry is not None else None)
+        return values
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self.lock:
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def incr(self, key):
+        with self.lock:
+            value = self.counters[key] = self.counters.get(key, 0) + 1
+            return value
+
+
+class RedisBackend:
+    '''
+    Any Redis-compatible server (Redis, KeyDB, a local stand-in) reached with redis-py.
+    '''
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url)
+
+    def get_many(self, keys):
+        return [value.decode() if isinstance(value, bytes) else value
+                for value in self.client.mget(keys)]
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, value, ex=ttl or None)
+
+    def incr(self, key):
+        return self.client.incr(key)
+
+
+# ----------------------------------------------------------------------------#
+# Page cache.
+# ----------------------------------------------------------------------------#
+
+class PageCache:
+    '''
+    Caches rendered GET pages per route namespace and entity id.
+    Invalidation bumps a version number instead of deleting keys, so a whole
+    namespace (every /shows page) or a single entity (/venues/3) can be
+    dropped in one write; stale entries age out of the backend.
+    Configured with CACHE_BACKEND ('memory', 'redis' or None to disable),
+    CACHE_TTL, CACHE_MAX_ENTRIES and CACHE_REDIS_URL.
+    '''
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.ttl = None
+        self.stats = {}
+        self.lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = app.config.get('CACHE_BACKEND', 'memory')
+        if backend == 'memory':
+            self.backend = MemoryBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+        elif backend == 'redis':
+            self.backend = RedisBackend(app.config['CACHE_REDIS_URL'])
+        else:
+            self.backend = None
+        self.ttl = app.config.get('CACHE_TTL', 60)
+        app.extensions['page_cache'] = self
+
+    @property
+    def shared(self):
+        # whether other processes read this cache, so that invalidate() reaches their pages
+        return isinstance(self.backend, RedisBackend)
+
+    def _versions(self, namespace, entityId):
+        keys = ['version:' + namespace]
+        if entityId is not None:
+            keys.append('version:{}:{}'.format(namespace, entityId))
+        return [version or 0 for version in self.backend.get_many(keys)]
+
+    def _count(self, namespace, outcome):
+        with self.lock:
+            counts = self.stats.setdefault(namespace, {'hits': 0, 'misses': 0})
+            counts[outcome] += 1
+
+    def cached(self, namespace, entity=None, unless=None):
+        '''
+        Decorates a view to serve its rendered page from the cache.
+        Input: <string> namespace the page belongs to, e.g. 'venue'
+               <string> name of the view argument holding the entity id, if any
+               <function> returning True for requests that should bypass the cache
+        Requests carrying flashed messages bypass the cache, as do clients
+        inside their read-your-writes window: another client may have cached
+        the page from a replica that has not caught up with their write.
+        Only plain rendered pages are stored (streamed responses are not).
+        '''
+        def decorator(view):
+            @wraps(view)
+            def cached_view(*args, **kwargs):
+                if (self.backend is None or request.method != 'GET' or session.get('_flashes')
+                        or recently_wrote() or (unless is not None and unless())):
+                    return view(*args, **kwargs)
+                entityId = kwargs.get(entity) if entity else None
+                key = 'page:{}:{}:{}:{}'.format(namespace,
+                                                ':'.join(str(v) for v in self._versions(namespace, entityId)),
+                                                entityId,
+                                                request.query_string.decode())
+                page = self.backend.get_many([key])[0]
+                if page is not None:
+                    self._count(namespace, 'hits')
+                    return page
+                self._count(namespace, 'misses')
+                response = view(*args, **kwargs)
+                if isinstance(response, str):
+                    # a page read from a lagging replica is only kept as long as the lag is allowed to be
+                    ttl = self.ttl
+                    if g.get('replica_read'):
+                        lag = current_app.config.get('REPLICA_READ_YOUR_WRITES_SECONDS', 5)
+                        ttl = min(ttl, lag) if ttl else lag
+                    self.backend.set(key, response, ttl)
+                return response
+            return cached_view
+        return decorator
+
+    def invalidate(self, namespace, entityId=None):
+        # drops every cached page of the namespace, or only those of one entity
+        if self.backend is None:
+            return
+        if entityId is None:
+            self.backend.incr('version:' + namespace)
+        else:
+            self.backend.incr('version:{}:{}'.format(namespace, entityId))
+
+    def metrics(self):
+        with self.lock:
+            return {namespace: dict(counts) for namespace, counts in self.stats.items()}
+
+
+def page_cache():
+    return current_app.extensions['page_cache']
@@ -0,0 +1,135 @@
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from operator import itemgetter
+
+from sqlalchemy import or_
+
+from model import Show, db
+
+DEFAULT_DURATION_MINUTES = 120
+MAX_DURATION_MINUTES = 24 * 60
+MAX_DURATION = timedelta(minutes=MAX_DURATION_MINUTES)
+
+
+def show_end(startTime, durationMinutes):
+    return startTime + timedelta(minutes=durationMinutes)
+
+
+# ----------------------------------------------------------------------------#
+# In-memory interval index.
+# ----------------------------------------------------------------------------#
+
+class IntervalIndex:
+    '''
+    Intervals kept sorted by start time per key (a venue or an artist id).
+    No show lasts longer than MAX_DURATION, so everything overlapping
+    [start, end) starts in (start - MAX_DURATION, end): two bisections bound
+    the candidates, and a conflict-free schedule has at most a couple there.
+    '''
+
+    def __init__(self):
+        self.starts = {}
+        self.intervals = {}
+
+    def add(self, key, start, end, item):
+        # one interval; an insertion costs O(n) unless it comes last, so bulk loads use extend
+        starts = self.starts.setdefault(key, [])
+        position = bisect_right(starts, start)
+        starts.insert(position, start)
+        self.intervals.setdefault(key, []).insert(position, (start, end, item))
+
+    def extend(self, entries):
+        '''
+        Adds many intervals at once: appended, then each key sorted once.
+        Input: <iterable> (key, start, end, item) tuples
+        '''
+        touched = set()
+        for key, start, end, item in entries:
+            self.intervals.setdefault(key, []).append((start, end, item))
+            touched.add(key)
+        for key in touched:
+            # stable, so equal starts keep their order as with add
+            intervals = self.intervals[key]
+            intervals.sort(key=itemgetter(0))
+            self.starts[key] = [start for start, _, _ in intervals]
+
+    def overlapping(self, key, start, end):
+        starts = self.starts.get(key)
+        if not starts:
+            return []
+        first = bisect_right(starts, start - MAX_DURATION)
+        last = bisect_left(starts, end)
+        return [item for _, intervalEnd, item in self.intervals[key][first:last] if intervalEnd > start]
+
+
+class BookingIndex:
+    '''
+    Venue and artist interval indexes over shows, keyed by
+    (venue_id, artist_id, start_time). Used to validate bulk imports
+    without a query per row.
+    '''
+
+    def __init__(self):
+        self.venues = IntervalIndex()
+        self.artists = IntervalIndex()
+
+    @classmethod
+    def load(cls, venueIds, artistIds, since, until):
+        '''
+        Indexes the stored shows of the given venues and artists that could
+        overlap [since, until), in one query.
+        '''
+        index = cls()
+        if not venueIds and not artistIds:
+            return index
+        rows = db.session.query(Show.venue_id, Show.artist_id, Show.start_time, Show.duration_minutes) \
+            .filter(or_(Show.venue_id.in_(sorted(venueIds)), Show.artist_id.in_(sorted(artistIds))),
+                    Show.start_time > since - MAX_DURATION,
+                    Show.start_time < until)
+        shows = [((venueId, artistId, startTime), show_end(startTime, durationMinutes))
+                 for venueId, artistId, startTime, durationMinutes in rows]
+        index.venues.extend((key[0], key[2], end, key) for key, end in shows)
+        index.artists.extend((key[1], key[2], end, key) for key, end in shows)
+        return index
+
+    def add(self, venueId, artistId, startTime, durationMinutes):
+        end = show_end(startTime, durationMinutes)
+        key = (venueId, artistId, startTime)
+        self.venues.add(venueId, startTime, end, key)
+        self.artists.add(artistId, startTime, end, key)
+
+    def conflicts(self, venueId, artistId, startTime, durationMinutes):
+        # keys of the shows booking the same venue or artist at an overlapping time
+        end = show_end(startTime, durationMinutes)
+        return list(dict.fromkeys(self.venues.overlapping(venueId, startTime, end) +
+                                  self.artists.overlapping(artistId, startTime, end)))
+
+
+# ----------------------------------------------------------------------------#
+# Single show checks.
+# ----------------------------------------------------------------------------#
+
+def find_conflicts(venueId, artistId, startTime, durationMinutes=DEFAULT_DURATION_MINUTES):
+    '''
+    Shows booking the venue or the artist at a time overlapping the new show.
+    The start time window keeps this a range scan on the (venue_id, start_time)
+    and (artist_id, start_time) indexes. Postgres also enforces it with the
+    exclusion constraints added by migration f77316a2cb5f.
+    Output: <list> conflicting Show objects
+    '''
+    end = show_end(startTime, durationMinutes)
+    candidates = Show.query \
+        .filter(or_(Show.venue_id == venueId, Show.artist_id == artistId),
+                Show.start_time > startTime - MAX_DURATION,
+                Show.start_time < end) \
+        .all()
+    return [show for show in candidates if show_end(show.start_time, show.duration_minutes) > startTime]
+
+
+def describe_conflict(key, venueId, artistId):
+    conflictVenueId, conflictArtistId, conflictStartTime = key
+    if conflictArtistId == int(artistId):
+        return 'artist {} is already booked at venue {} from {}'.format(
+            conflictArtistId, conflictVenueId, conflictStartTime.isoformat())
+    return 'venue {} already hosts artist {} from {}'.format(
+        conflictVenueId, conflictArtistId, conflictStartTime.isoformat())
@@ -0,0 +1,118 @@
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context
+from flask_dbtools.routing import ReplicaDatabase
+from sqlalchemy import event, exc
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import QueuePool
+
+
+# ----------------------------------------------------------------------------#
+# Pool.
+# ----------------------------------------------------------------------------#
+
+class TimedQueuePool(QueuePool):
+    '''
+    QueuePool that measures how long checkouts wait for a connection.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        timedOut = False
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            timedOut = True
+            raise
+        finally:
+            wait = time.perf_counter() - start
+            with self.lock:
+                self.checkouts += 1
+                self.timeouts += timedOut
+                self.waitTotal += wait
+                self.waitMax = max(self.waitMax, wait)
+
+
+def pool_stats(engine):
+    '''
+    Current pool usage and, for a TimedQueuePool, checkout wait times.
+    Output: <dict>
+    '''
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({'size': pool.size(),
+                      'checked_out': pool.checkedout(),
+                      'checked_in': pool.checkedin(),
+                      'overflow': pool.overflow()})
+    if isinstance(pool, TimedQueuePool):
+        with pool.lock:
+            stats.update({'checkouts': pool.checkouts,
+                          'timeouts': pool.timeouts,
+                          'wait_seconds_total': round(pool.waitTotal, 6),
+                          'wait_seconds_max': round(pool.waitMax, 6),
+                          'wait_seconds_mean': round(pool.waitTotal / pool.checkouts, 6) if pool.checkouts else 0.0})
+    return stats
+
+
+# ----------------------------------------------------------------------------#
+# Engine options.
+# ----------------------------------------------------------------------------#
+
+class Database(ReplicaDatabase):
+    '''
+    SQLAlchemy extension sizing the connection pool from the DATABASE_POOL_*
+    settings of the app config (see config.py). SQLite keeps the pools
+    Flask-SQLAlchemy picks for it. Sessions route read_only views to the
+    SQLALCHEMY_REPLICA_URIS databases (see flask_dbtools.routing).
+    '''
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        sa_url, options = super().apply_driver_hacks(app, sa_url, options)
+        if not sa_url.drivername.startswith('sqlite'):
+            options.setdefault('poolclass', TimedQueuePool)
+            options.setdefault('pool_size', app.config.get('DATABASE_POOL_SIZE', 5))
+            options.setdefault('max_overflow', app.config.get('DATABASE_MAX_OVERFLOW', 10))
+            options.setdefault('pool_timeout', app.config.get('DATABASE_POOL_TIMEOUT', 10))
+            options.setdefault('pool_recycle', app.config.get('DATABASE_POOL_RECYCLE', 1800))
+            options.setdefault('pool_pre_ping', app.config.get('DATABASE_POOL_PRE_PING', True))
+        return sa_url, options
+
+
+# ----------------------------------------------------------------------------#
+# Statement timeouts.
+# ----------------------------------------------------------------------------#
+
+def statement_timeout(milliseconds):
+    '''
+    Decorates a view to run its statements under another timeout than
+    DATABASE_STATEMENT_TIMEOUT_MS; 0 disables the timeout.
+    '''
+    def decorator(view):
+        @wraps(view)
+        def timed_view(*args, **kwargs):
+            g.statement_timeout_ms = milliseconds
+            return view(*args, **kwargs)
+        return timed_view
+    return decorator
+
+
+@event.listens_for(Session, 'after_begin')
+def _set_statement_timeout(session, transaction, connection):
+    # SET LOCAL lasts until the transaction ends, so a pooled connection
+    # never carries one request's timeout into the next
+    if not has_request_context() or connection.dialect.name != 'postgresql':
+        return
+    milliseconds = g.get('statement_timeout_ms', current_app.config.get('DATABASE_STATEMENT_TIMEOUT_MS'))
+    if milliseconds is not None:
+        connection.execute('SET LOCAL statement_timeout = {:d}'.format(int(milliseconds)))
@@ -0,0 +1,38 @@
+from datetime import datetime
+from functools import lru_cache
+
+import babel.dates
+import dateutil.parser
+from babel import Locale
+
+# Named formats accepted by the datetime filter; anything else is used as a Babel pattern.
+DATETIME_FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma"
+}
+FORMATTED_CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=None)
+def _compiled_pattern(format, locale):
+    # parsing the pattern and the locale data is the expensive part of every call
+    return babel.dates.parse_pattern(DATETIME_FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=FORMATTED_CACHE_SIZE)
+def _format_datetime(value, format, locale):
+    pattern, locale = _compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
+
+
+def format_datetime(value, format='medium', locale=babel.dates.LC_TIME):
+    '''
+    Jinja filter formatting a show time.
+    Views pass native datetime objects; strings are still parsed for callers
+    that hand over ISO timestamps. Compiled patterns are cached per
+    (format, locale) and formatted values in an LRU, since list pages repeat
+    the same start times.
+    '''
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    return _format_datetime(value, format, locale)
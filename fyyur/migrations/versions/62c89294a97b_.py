@@ -0,0 +1,41 @@
+"""make genre names unique
+
+Revision ID: 62c89294a97b
+Revises: 3a37ff9f9c44
+Create Date: 2026-10-18 11:24:05.803112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '62c89294a97b'
+down_revision = '3a37ff9f9c44'
+branch_labels = None
+depends_on = None
+
+# maps every genre id to the lowest id carrying the same name
+CANONICAL = '(SELECT g.id AS id, (SELECT MIN(d.id) FROM genres d WHERE d.name = g.name) AS keep_id FROM genres g)'
+
+
+def upgrade():
+    # fold duplicate genres into the oldest row before adding the constraint
+    for table, owner in (('venue_genres', 'venue_id'), ('artist_genres', 'artist_id')):
+        op.execute(
+            'INSERT INTO {table} ({owner}, genres_id) '
+            'SELECT DISTINCT t.{owner}, c.keep_id FROM {table} t JOIN {canonical} c ON c.id = t.genres_id '
+            'WHERE c.id <> c.keep_id AND NOT EXISTS '
+            '(SELECT 1 FROM {table} o WHERE o.{owner} = t.{owner} AND o.genres_id = c.keep_id)'
+            .format(table=table, owner=owner, canonical=CANONICAL)
+        )
+        op.execute(
+            'DELETE FROM {table} WHERE genres_id IN (SELECT c.id FROM {canonical} c WHERE c.id <> c.keep_id)'
+            .format(table=table, canonical=CANONICAL)
+        )
+    op.execute('DELETE FROM genres WHERE name IS NOT NULL AND id NOT IN (SELECT MIN(id) FROM genres GROUP BY name)')
+    op.create_unique_constraint('uq_genres_name', 'genres', ['name'])
+
+
+def downgrade():
+    op.drop_constraint('uq_genres_name', 'genres', type_='unique')
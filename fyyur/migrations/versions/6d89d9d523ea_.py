@@ -0,0 +1,41 @@
+"""add upcoming and past show counters
+
+Revision ID: 6d89d9d523ea
+Revises: 73d168fcdc17
+Create Date: 2026-10-18 09:12:44.120931
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d89d9d523ea'
+down_revision = '73d168fcdc17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('artist', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('artist', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venue', sa.Column('past_shows_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('venue', sa.Column('upcoming_shows_count', sa.Integer(), server_default='0', nullable=False))
+
+    # backfill the counters from the existing shows
+    for table, column in (('venue', 'venue_id'), ('artist', 'artist_id')):
+        op.execute(
+            'UPDATE {table} SET '
+            'upcoming_shows_count = (SELECT COUNT(*) FROM show '
+            'WHERE show.{column} = {table}.id AND show.start_time >= CURRENT_TIMESTAMP), '
+            'past_shows_count = (SELECT COUNT(*) FROM show '
+            'WHERE show.{column} = {table}.id AND show.start_time < CURRENT_TIMESTAMP)'
+            .format(table=table, column=column)
+        )
+
+
+def downgrade():
+    op.drop_column('venue', 'upcoming_shows_count')
+    op.drop_column('venue', 'past_shows_count')
+    op.drop_column('artist', 'upcoming_shows_count')
+    op.drop_column('artist', 'past_shows_count')
@@ -0,0 +1,30 @@
+"""add indexes for show, venue directory and keyset queries
+
+Revision ID: bb442a0a71e9
+Revises: 62c89294a97b
+Create Date: 2026-10-18 13:41:52.207315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bb442a0a71e9'
+down_revision = '62c89294a97b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_show_venue_id_start_time', 'show', ['venue_id', 'start_time'], unique=False)
+    op.create_index('ix_show_artist_id_start_time', 'show', ['artist_id', 'start_time'], unique=False)
+    op.create_index('ix_show_start_time', 'show', ['start_time', 'venue_id', 'artist_id'], unique=False)
+    op.create_index('ix_venue_state_city', 'venue', ['state', 'city', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_state_city', table_name='venue')
+    op.drop_index('ix_show_start_time', table_name='show')
+    op.drop_index('ix_show_artist_id_start_time', table_name='show')
+    op.drop_index('ix_show_venue_id_start_time', table_name='show')
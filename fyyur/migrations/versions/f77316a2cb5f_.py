@@ -0,0 +1,38 @@
+"""add show duration and overlap exclusion constraints
+
+Revision ID: f77316a2cb5f
+Revises: bb442a0a71e9
+Create Date: 2026-10-18 14:52:08.631470
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f77316a2cb5f'
+down_revision = 'bb442a0a71e9'
+branch_labels = None
+depends_on = None
+
+# the time a show occupies its venue and its artist
+SHOW_RANGE = "tsrange(start_time, start_time + duration_minutes * interval '1 minute')"
+
+
+def upgrade():
+    op.add_column('show', sa.Column('duration_minutes', sa.Integer(), server_default='120', nullable=False))
+    op.create_check_constraint('ck_show_duration_minutes', 'show', 'duration_minutes BETWEEN 1 AND 1440')
+    # btree_gist lets the plain integer ids share a GiST index with the time range.
+    # Existing overlapping bookings make these fail; resolve them before upgrading.
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute('ALTER TABLE show ADD CONSTRAINT ex_show_venue_overlap '
+               'EXCLUDE USING gist (venue_id WITH =, {} WITH &&)'.format(SHOW_RANGE))
+    op.execute('ALTER TABLE show ADD CONSTRAINT ex_show_artist_overlap '
+               'EXCLUDE USING gist (artist_id WITH =, {} WITH &&)'.format(SHOW_RANGE))
+
+
+def downgrade():
+    op.drop_constraint('ex_show_artist_overlap', 'show')
+    op.drop_constraint('ex_show_venue_overlap', 'show')
+    op.drop_constraint('ck_show_duration_minutes', 'show', type_='check')
+    op.drop_column('show', 'duration_minutes')
@@ -1,7 +1,12 @@
-from flask_sqlalchemy import SQLAlchemy
-from data import artists, venues
+from datetime import datetime
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session, make_transient_to_detached
 
-db = SQLAlchemy()
+from engine import Database
+
+db = Database()
 # ----------------------------------------------------------------------------#
 # Models.
 # ----------------------------------------------------------------------------#
@@ -18,16 +23,29 @@ artist_generes = db.Table('artist_genres',
 
 class Show(db.Model):
     __tablename__ = 'show'
+    # detail pages filter on one side and order by start_time; /shows pages and the
+    # counter refresh walk start_time in (start_time, venue_id, artist_id) order
+    __table_args__ = (
+        db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+        db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+        db.Index('ix_show_start_time', 'start_time', 'venue_id', 'artist_id'),
+        db.CheckConstraint('duration_minutes BETWEEN 1 AND 1440', name='ck_show_duration_minutes'),
+    )
 
     venue_id = db.Column(db.Integer, db.ForeignKey('venue.id'), primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey('artist.id'), primary_key=True)
     start_time = db.Column(db.DateTime, primary_key=True)
+    duration_minutes = db.Column(db.Integer, nullable=False, server_default='120', default=120)
     venue = db.relationship("Venue", back_populates='shows')
     artist = db.relationship('Artist', back_populates='shows')
 
 
 class Venue(db.Model):
     __tablename__ = 'venue'
+    # the /venues directory is read in (state, city, id) order
+    __table_args__ = (
+        db.Index('ix_venue_state_city', 'state', 'city', 'id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     name = db.Column(db.String)
@@ -40,6 +58,8 @@ class Venue(db.Model):
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
     genres = db.relationship('Genres', secondary=venue_genres, backref=db.backref('venues', lazy=True))
     shows = db.relationship('Show', back_populates='venue')
 
@@ -58,6 +78,8 @@ class Artist(db.Model):
     seeking_description = db.Column(db.String(500))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
+    past_shows_count = db.Column(db.Integer, nullable=False, server_default='0', default=0)
     genres = db.relationship('Genres', secondary=artist_generes, backref=db.backref('artists', lazy=True))
     shows = db.relationship('Show', back_populates='artist')
 
@@ -66,126 +88,142 @@ class Genres(db.Model):
     __tablename__ = 'genres'
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(120))
+    name = db.Column(db.String(120), unique=True)
+
+
+# ----------------------------------------------------------------------------#
+# Genres.
+# ----------------------------------------------------------------------------#
+def _genre_cache():
+    return current_app.extensions.setdefault('genres', {})
+
+
+def resolve_genres(names):
+    '''
+    Returns the Genres rows for a list of genre names, creating the missing ones.
+    Names already seen come from an in-process name -> id cache; the others are
+    looked up in one IN query, and those still missing are inserted in one
+    multi-row statement. Genres inserted by the current transaction only reach
+    the cache once it commits.
+    '''
+    names = list(dict.fromkeys(name for name in names if name))
+    cache = _genre_cache()
+    created = db.session().info.setdefault('created_genres', {})
+    known = {name: cache.get(name, created.get(name)) for name in names}
+
+    missing = [name for name in names if known[name] is None]
+    if missing:
+        found = dict(db.session.query(Genres.name, Genres.id).filter(Genres.name.in_(missing)))
+        cache.update(found)
+        known.update(found)
+        missing = [name for name in missing if name not in found]
+    if missing:
+        rows = [{'name': name} for name in missing]
+        if db.engine.dialect.name == 'postgresql':
+            inserted = db.session.execute(postgresql.insert(Genres.__table__)
+                                          .values(rows)
+                                          .on_conflict_do_nothing(index_elements=['name'])
+                                          .returning(Genres.name, Genres.id)).fetchall()
+        else:
+            db.session.execute(Genres.__table__.insert(), rows)
+            inserted = []
+        inserted = dict(inserted)
+        if len(inserted) < len(missing):
+            # rows inserted without RETURNING, or by a concurrent transaction
+            inserted.update(db.session.query(Genres.name, Genres.id)
+                            .filter(Genres.name.in_([name for name in missing if name not in inserted])))
+        created.update(inserted)
+        known.update(inserted)
+
+    return [_attached_genre(known[name], name) for name in names]
+
+
+def _attached_genre(genreId, name):
+    # attach a known row to the session without querying it again
+    genre = Genres(id=genreId, name=name)
+    make_transient_to_detached(genre)
+    return db.session.merge(genre, load=False)
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_created_genres(session):
+    created = session.info.pop('created_genres', None)
+    if created and has_app_context():
+        _genre_cache().update(created)
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _drop_created_genres(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('created_genres', None)
 
 
 # ----------------------------------------------------------------------------#
-# Populate original dataset
+# Show counters.
 # ----------------------------------------------------------------------------#
-def init():
-    if Artist.query.count() == 0:
-        for artist in artists:
-            artistId = artist.get('id')
-            artistName = artist.get('name')
-            artistCity = artist.get('city')
-            artistState = artist.get('state')
-            artistPhone = artist.get('phone')
-            artistSeekingVenue = artist.get('seeking_venue')
-            artistSeekingDescription = artist.get('seeking_description')
-            artistWebsite = artist.get('website')
-            artistImageLink = artist.get('image_link')
-            artistFacebookLink = artist.get('facebook_link')
-            artistData = Artist(name=artistName,
-                                city=artistCity,
-                                state=artistState,
-                                phone=artistPhone,
-                                seeking_venue=artistSeekingVenue,
-                                seeking_description=artistSeekingDescription,
-                                website=artistWebsite,
-                                image_link=artistImageLink,
-                                facebook_link=artistFacebookLink
-                                )
-            for artistGenres in artist.get('genres'):
-                if Genres.query.filter_by(name=artistGenres).first():
-                    artistData.genres.append(Genres.query.filter_by(name=artistGenres).first())
-                else:
-                    genres = Genres(name=artistGenres)
-                    artistData.genres.append(genres)
-            db.session.add(artistData)
-            db.session.commit()
-
-        db.session.close()
-
-    if Venue.query.count() == 0:
-        for venue in venues:
-            venueId = venue.get('id')
-            venueName = venue.get('name')
-            venueCity = venue.get('city')
-            venueState = venue.get('state')
-            venueAddress = venue.get('address')
-            venuePhone = venue.get('phone')
-            venueSeekingTalent = venue.get('seeking_talent')
-            venueSeekingDescription = venue.get('seeking_description')
-            venueWebsite = venue.get('website')
-            venueImageLink = venue.get('image_link')
-            venueFacebookLink = venue.get('facebook_link')
-            venueData = Venue(name=venueName,
-                              city=venueCity,
-                              state=venueState,
-                              address=venueAddress,
-                              phone=venuePhone,
-                              seeking_talent=venueSeekingTalent,
-                              seeking_description=venueSeekingDescription,
-                              website=venueWebsite,
-                              image_link=venueImageLink,
-                              facebook_link=venueFacebookLink
-                              )
-
-            for venueGenres in venue.get('genres'):
-                if Genres.query.filter_by(name=venueGenres).first():
-                    venueData.genres.append(Genres.query.filter_by(name=venueGenres).first())
-                else:
-                    genres = Genres(name=venueGenres)
-                    venueData.genres.append(genres)
-            db.session.add(venueData)
-            db.session.commit()
-
-        db.session.close()
-
-    if Show.query.count() == 0:
-        for artist in artists:
-            artistName = artist.get('name')
-            artistData = Artist.query.filter_by(name=artistName).first()
-            for pastShow in artist.get('past_shows'):
-                venueName = pastShow.get('venue_name')
-                venueData = Venue.query.filter_by(name=venueName).first()
-                startTime = pastShow.get('start_time')
-                if Show.query.filter_by(venue_id=venueData.id, artist_id=artistData.id,
-                                        start_time=startTime).count() == 0:
-                    show = Show(start_time=startTime, venue=venueData, artist=artistData)
-                    db.session.add(show)
-                    db.session.commit()
-
-            for upcomingShow in artist.get('upcoming_shows'):
-                venueName = upcomingShow.get('venue_name')
-                venueData = Venue.query.filter_by(name=venueName).first()
-                startTime = upcomingShow.get('start_time')
-                if Show.query.filter_by(venue_id=venueData.id, artist_id=artistData.id,
-                                        start_time=startTime).count() == 0:
-                    show = Show(start_time=startTime, venue=venueData, artist=artistData)
-                    db.session.add(show)
-                    db.session.commit()
-
-        for venue in venues:
-            venueName = venue.get('name')
-            venueData = Venue.query.filter_by(name=venueName).first()
-            for pastShow in venue.get('past_shows'):
-                artistName = pastShow.get('artist_name')
-                artistData = Artist.query.filter_by(name=artistName).first()
-                startTime = pastShow.get('start_time')
-                if Show.query.filter_by(venue_id=venueData.id, artist_id=artistData.id,
-                                        start_time=startTime).count() == 0:
-                    show = Show(start_time=startTime, venue=venueData, artist=artistData)
-                    db.session.add(show)
-                    db.session.commit()
-
-            for upcomingShow in venue.get('upcoming_shows'):
-                artistName = upcomingShow.get('artist_name')
-                artistData = Artist.query.filter_by(name=artistName).first()
-                startTime = upcomingShow.get('start_time')
-                if Show.query.filter_by(venue_id=venueData.id, artist_id=artistData.id,
-                                        start_time=startTime).count() == 0:
-                    show = Show(start_time=startTime, venue=venueData, artist=artistData)
-                    db.session.add(show)
-                    db.session.commit()
-        db.session.close()
+def count_show(venueId, artistId, startTime, currentDateTime=None, delta=1):
+    '''
+    Adds delta to the upcoming or past show counter of a venue and an artist.
+    The counters are bumped in SQL so concurrent submissions do not lose updates.
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    for model, entityId in ((Venue, venueId), (Artist, artistId)):
+        counter = model.upcoming_shows_count if startTime >= currentDateTime else model.past_shows_count
+        model.query.filter(model.id == entityId) \
+            .update({counter: counter + delta}, synchronize_session=False)
+
+
+def release_shows(venueId=None, artistId=None, currentDateTime=None):
+    '''
+    Deletes the shows of a venue or an artist that is about to be deleted and
+    takes them off the counters of the other side of each show.
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    if venueId is not None:
+        shows = Show.query.filter(Show.venue_id == venueId)
+        partner, partnerColumn = Artist, Show.artist_id
+    else:
+        shows = Show.query.filter(Show.artist_id == artistId)
+        partner, partnerColumn = Venue, Show.venue_id
+    for upcoming, counter in ((True, partner.upcoming_shows_count), (False, partner.past_shows_count)):
+        when = Show.start_time >= currentDateTime if upcoming else Show.start_time < currentDateTime
+        released = shows.filter(when) \
+            .with_entities(partnerColumn, db.func.count()) \
+            .group_by(partnerColumn) \
+            .all()
+        for partnerId, numShows in released:
+            partner.query.filter(partner.id == partnerId) \
+                .update({counter: counter - numShows}, synchronize_session=False)
+    shows.delete(synchronize_session=False)
+
+
+def refresh_show_counts(currentDateTime=None, since=None):
+    '''
+    Recomputes the show counters from the show table.
+    With since, only venues and artists having a show that started between since
+    and now are refreshed, which is what moves shows from upcoming to past.
+    Recomputing is idempotent, so overlapping windows are harmless.
+    Output: <tuple> number of venues and artists refreshed
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    refreshed = []
+    for model, column in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+        upcoming = db.session.query(db.func.count()) \
+            .filter(column == model.id, Show.start_time >= currentDateTime) \
+            .correlate(model.__table__).as_scalar()
+        past = db.session.query(db.func.count()) \
+            .filter(column == model.id, Show.start_time < currentDateTime) \
+            .correlate(model.__table__).as_scalar()
+        stale = model.query
+        if since is not None:
+            started = db.session.query(column) \
+                .filter(Show.start_time >= since, Show.start_time < currentDateTime)
+            stale = stale.filter(model.id.in_(started))
+        refreshed.append(stale.update({model.upcoming_shows_count: upcoming,
+                                       model.past_shows_count: past},
+                                      synchronize_session=False))
+    db.session.commit()
+    return tuple(refreshed)
@@ -0,0 +1,224 @@
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import case, tuple_
+from sqlalchemy.orm import contains_eager
+
+from model import Artist, Venue, Show, Genres, db, venue_genres, artist_generes
+
+
+# ----------------------------------------------------------------------------#
+# Venue directory.
+# ----------------------------------------------------------------------------#
+
+def venue_areas():
+    '''
+    Builds the grouped venue directory used by the /venues page.
+    All venues come back from one query, with upcoming show counts read from
+    the counter kept on each venue instead of counted per request.
+    Output: <list> [{'city', 'state', 'venues': [{'id', 'name', 'num_upcoming_shows'}]}]
+    '''
+    rows = db.session.query(Venue.city,
+                            Venue.state,
+                            Venue.id,
+                            Venue.name,
+                            Venue.upcoming_shows_count) \
+        .order_by(Venue.state, Venue.city, Venue.id) \
+        .all()
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1])):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{'id': venueId,
+                        'name': venueName,
+                        'num_upcoming_shows': numUpcomingShows}
+                       for _, _, venueId, venueName, numUpcomingShows in venues]
+        })
+    return areas
+
+
+# ----------------------------------------------------------------------------#
+# Detail pages.
+# ----------------------------------------------------------------------------#
+
+def _split_shows(rows, partner):
+    '''
+    Splits (partner_id, name, image_link, start_time, upcoming) rows into
+    past and upcoming show lists shaped for the detail templates.
+    '''
+    pastShows = []
+    upcomingShows = []
+    for partnerId, partnerName, partnerImageLink, startTime, upcoming in rows:
+        showInfo = {
+            partner + "_id": partnerId,
+            partner + "_name": partnerName,
+            partner + "_image_link": partnerImageLink,
+            "start_time": startTime
+        }
+        if upcoming:
+            upcomingShows.append(showInfo)
+        else:
+            pastShows.append(showInfo)
+    return pastShows, upcomingShows
+
+
+def _show_rows(partner, ownColumn, entityId, currentDateTime):
+    # one query for every show with the partner's name and image, flagged upcoming in SQL
+    upcoming = case([(Show.start_time >= currentDateTime, True)], else_=False)
+    return db.session.query(partner.id,
+                            partner.name,
+                            partner.image_link,
+                            Show.start_time,
+                            upcoming) \
+        .select_from(Show) \
+        .join(partner) \
+        .filter(ownColumn == entityId) \
+        .order_by(Show.start_time) \
+        .all()
+
+
+def _with_genres(model, association, ownColumn, entityId):
+    # a flat outer join chain: the nested join joinedload renders makes SQLite
+    # materialize the whole association table before filtering it
+    return model.query \
+        .outerjoin(association, ownColumn == model.id) \
+        .outerjoin(Genres, Genres.id == association.c.genres_id) \
+        .options(contains_eager(model.genres)) \
+        .filter(model.id == entityId) \
+        .one_or_none()
+
+
+def venue_detail(venue_id, currentDateTime=None):
+    '''
+    Loads everything the venue page shows in two queries, whatever the number
+    of shows: the venue with its genres, then its shows joined
+    with the artists playing them.
+    Output: <dict> venue page data, or None if the venue does not exist
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    venue = _with_genres(Venue, venue_genres, venue_genres.c.venue_id, venue_id)
+    if venue is None:
+        return None
+    pastShows, upcomingShows = _split_shows(
+        _show_rows(Artist, Show.venue_id, venue_id, currentDateTime), 'artist')
+
+    return {
+        "id": venue.id,
+        "name": venue.name,
+        "genres": [g.name for g in venue.genres],
+        "address": venue.address,
+        "city": venue.city,
+        "state": venue.state,
+        "phone": venue.phone,
+        "website": venue.website,
+        "facebook_link": venue.facebook_link,
+        "seeking_talent": venue.seeking_talent,
+        "seeking_description": venue.seeking_description,
+        "image_link": venue.image_link,
+        "past_shows": pastShows,
+        "upcoming_shows": upcomingShows,
+        "past_shows_count": len(pastShows),
+        "upcoming_shows_count": len(upcomingShows),
+    }
+
+
+def artist_detail(artist_id, currentDateTime=None):
+    '''
+    Loads everything the artist page shows in two queries, whatever the number
+    of shows: the artist with its genres, then its shows joined
+    with the venues hosting them.
+    Output: <dict> artist page data, or None if the artist does not exist
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    artist = _with_genres(Artist, artist_generes, artist_generes.c.artist_id, artist_id)
+    if artist is None:
+        return None
+    pastShows, upcomingShows = _split_shows(
+        _show_rows(Venue, Show.artist_id, artist_id, currentDateTime), 'venue')
+
+    return {
+        "id": artist.id,
+        "name": artist.name,
+        "genres": [g.name for g in artist.genres],
+        "city": artist.city,
+        "state": artist.state,
+        "phone": artist.phone,
+        "website": artist.website,
+        "facebook_link": artist.facebook_link,
+        "seeking_venue": artist.seeking_venue,
+        "seeking_description": artist.seeking_description,
+        "image_link": artist.image_link,
+        "past_shows": pastShows,
+        "upcoming_shows": upcomingShows,
+        "past_shows_count": len(pastShows),
+        "upcoming_shows_count": len(upcomingShows)
+    }
+
+
+# ----------------------------------------------------------------------------#
+# Shows listing.
+# ----------------------------------------------------------------------------#
+
+SHOWS_FETCH_SIZE = 1000
+
+
+def encode_cursor(showInfo):
+    # the cursor is the (start_time, venue_id, artist_id) key of the last show seen
+    return '{},{},{}'.format(showInfo['start_time'].isoformat(),
+                             showInfo['venue_id'],
+                             showInfo['artist_id'])
+
+
+def decode_cursor(cursor):
+    '''
+    Parses a cursor made by encode_cursor.
+    Raises ValueError when the cursor is malformed.
+    '''
+    startTime, venueId, artistId = cursor.rsplit(',', 2)
+    return datetime.fromisoformat(startTime), int(venueId), int(artistId)
+
+
+def show_rows(after=None, limit=None):
+    '''
+    Yields the shows page rows ordered by the Show primary key columns
+    (start_time, venue_id, artist_id), starting after the given key.
+    Rows are fetched in batches of SHOWS_FETCH_SIZE (server side cursor on
+    Postgres), so iterating the whole table keeps memory flat.
+    '''
+    query = db.session.query(Show.venue_id,
+                             Venue.name,
+                             Show.artist_id,
+                             Artist.name,
+                             Artist.image_link,
+                             Show.start_time) \
+        .select_from(Show) \
+        .join(Venue) \
+        .join(Artist) \
+        .order_by(Show.start_time, Show.venue_id, Show.artist_id)
+    if after is not None:
+        query = query.filter(tuple_(Show.start_time, Show.venue_id, Show.artist_id) > tuple_(*after))
+    if limit is not None:
+        query = query.limit(limit)
+
+    for venueId, venueName, artistId, artistName, artistImageLink, startTime in \
+            query.execution_options(stream_results=True).yield_per(SHOWS_FETCH_SIZE):
+        yield {'venue_id': venueId,
+               'venue_name': venueName,
+               'artist_id': artistId,
+               'artist_name': artistName,
+               'artist_image_link': artistImageLink,
+               'start_time': startTime}
+
+
+def show_page(after=None, limit=30):
+    '''
+    Returns one page of shows and the cursor of the next page (None on the last page).
+    One extra row is fetched to know whether another page follows.
+    '''
+    rows = list(show_rows(after, limit + 1))
+    nextCursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], nextCursor
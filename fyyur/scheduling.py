@@ -0,0 +1,182 @@
+import csv
+from datetime import datetime
+
+import dateutil.parser
+from sqlalchemy import bindparam
+from sqlalchemy.dialects import postgresql
+
+from conflicts import BookingIndex, DEFAULT_DURATION_MINUTES, MAX_DURATION_MINUTES, describe_conflict, show_end
+from model import Artist, Venue, Show, db
+
+SCHEDULE_FIELDS = ('venue_id', 'artist_id', 'start_time')
+# rows per INSERT statement; keeps Postgres under its 65535 bind parameter limit
+INSERT_CHUNK_SIZE = 5000
+
+
+# ----------------------------------------------------------------------------#
+# Reading schedules.
+# ----------------------------------------------------------------------------#
+
+def read_schedule_csv(lines):
+    '''
+    Reads a season schedule from CSV with a venue_id, artist_id, start_time
+    header and an optional duration_minutes column.
+    Input: <iterable> lines of CSV text (an open file or str.splitlines())
+    Output: <list> row dicts, in file order
+    '''
+    return list(csv.DictReader(lines))
+
+
+def _parse_time(value):
+    # ISO timestamps take the fast path; dateutil reads anything else
+    if isinstance(value, datetime):
+        return value
+    try:
+        startTime = datetime.fromisoformat(value)
+    except ValueError:
+        startTime = dateutil.parser.parse(value)
+    return startTime.replace(tzinfo=None)
+
+
+def _parse_integer(value):
+    # ints, integral floats such as 3.0 from JSON and digit strings; 1.9 is not truncated and True is no id
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError('not an integer')
+    return int(value)
+
+
+def _parse_row(row):
+    # returns the show key and duration, or raises ValueError with a message for the report
+    if not isinstance(row, dict):
+        raise ValueError('expected an object with ' + ', '.join(SCHEDULE_FIELDS))
+    missing = [field for field in SCHEDULE_FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise ValueError('missing ' + ', '.join(missing))
+    try:
+        venueId = _parse_integer(row['venue_id'])
+        artistId = _parse_integer(row['artist_id'])
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('venue_id and artist_id must be integers')
+    try:
+        startTime = _parse_time(row['start_time'])
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('start_time is not a date and time')
+    durationMinutes = row.get('duration_minutes')
+    try:
+        durationMinutes = DEFAULT_DURATION_MINUTES if durationMinutes in (None, '') else _parse_integer(durationMinutes)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError('duration_minutes must be an integer')
+    if not 1 <= durationMinutes <= MAX_DURATION_MINUTES:
+        raise ValueError('duration_minutes must be between 1 and {}'.format(MAX_DURATION_MINUTES))
+    return (venueId, artistId, startTime), durationMinutes
+
+
+# ----------------------------------------------------------------------------#
+# Scheduling.
+# ----------------------------------------------------------------------------#
+
+def _existing_ids(model, ids):
+    if not ids:
+        return set()
+    return {entityId for entityId, in db.session.query(model.id).filter(model.id.in_(sorted(ids)))}
+
+
+def _insert_shows(shows):
+    '''
+    Inserts shows, skipping those already scheduled.
+    Input: <dict> show key -> duration in minutes
+    Output: <set> keys actually inserted
+    '''
+    rows = [dict(zip(SCHEDULE_FIELDS, key), duration_minutes=durationMinutes)
+            for key, durationMinutes in shows.items()]
+    if db.engine.dialect.name == 'postgresql':
+        inserted = set()
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            statement = postgresql.insert(Show.__table__) \
+                .values(rows[start:start + INSERT_CHUNK_SIZE]) \
+                .on_conflict_do_nothing() \
+                .returning(Show.venue_id, Show.artist_id, Show.start_time)
+            inserted.update(tuple(row) for row in db.session.execute(statement))
+        return inserted
+    # no RETURNING here; SQLite serializes writers, so the booking index read
+    # earlier in this transaction already saw every stored show
+    db.session.execute(Show.__table__.insert().prefix_with('OR IGNORE'), rows)
+    return set(shows)
+
+
+def _add_counts(inserted, currentDateTime):
+    # one executemany UPDATE per table and counter instead of one UPDATE per show
+    counts = {}
+    for venueId, artistId, startTime in inserted:
+        upcoming = startTime >= currentDateTime
+        for model, entityId in ((Venue, venueId), (Artist, artistId)):
+            perEntity = counts.setdefault((model, upcoming), {})
+            perEntity[entityId] = perEntity.get(entityId, 0) + 1
+    for (model, upcoming), perEntity in counts.items():
+        counter = model.__table__.c.upcoming_shows_count if upcoming else model.__table__.c.past_shows_count
+        db.session.execute(model.__table__.update()
+                           .where(model.__table__.c.id == bindparam('entity_id'))
+                           .values({counter: counter + bindparam('num_shows')}),
+                           [{'entity_id': entityId, 'num_shows': numShows} for entityId, numShows in perEntity.items()])
+
+
+def schedule_shows(rows, currentDateTime=None):
+    '''
+    Validates and inserts many shows in one transaction.
+    Venue and artist ids are checked against id sets fetched with one query
+    each. Overlapping bookings of a venue or an artist, with stored shows or
+    earlier rows, are found in a BookingIndex loaded with one more query.
+    Shows already scheduled are skipped by the database too (ON CONFLICT DO
+    NOTHING on the show key, OR IGNORE on SQLite) and reported.
+    Input: <list> dicts with venue_id, artist_id, start_time and optionally duration_minutes
+    Output: <dict> {'inserted': <int>, 'errors': [{'row': <1-based index>, 'error': <string>}]}
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    errors = []
+    parsed = []
+    for rowNumber, row in enumerate(rows, start=1):
+        try:
+            parsed.append((rowNumber, _parse_row(row)))
+        except ValueError as error:
+            errors.append({'row': rowNumber, 'error': str(error)})
+
+    venueIds = _existing_ids(Venue, {key[0] for _, (key, _) in parsed})
+    artistIds = _existing_ids(Artist, {key[1] for _, (key, _) in parsed})
+    known = [(rowNumber, key, durationMinutes) for rowNumber, (key, durationMinutes) in parsed
+             if key[0] in venueIds and key[1] in artistIds]
+    bookings = BookingIndex.load({key[0] for _, key, _ in known},
+                                 {key[1] for _, key, _ in known},
+                                 min((key[2] for _, key, _ in known), default=None),
+                                 max((show_end(key[2], duration) for _, key, duration in known), default=None)) \
+        if known else BookingIndex()
+    accepted = {}
+    acceptedRows = {}
+    for rowNumber, (key, durationMinutes) in parsed:
+        if key[0] not in venueIds:
+            errors.append({'row': rowNumber, 'error': 'venue {} does not exist'.format(key[0])})
+            continue
+        if key[1] not in artistIds:
+            errors.append({'row': rowNumber, 'error': 'artist {} does not exist'.format(key[1])})
+            continue
+        if key in acceptedRows:
+            errors.append({'row': rowNumber, 'error': 'duplicate of row {}'.format(acceptedRows[key])})
+            continue
+        conflicts = bookings.conflicts(key[0], key[1], key[2], durationMinutes)
+        if key in conflicts:
+            errors.append({'row': rowNumber, 'error': 'show is already scheduled'})
+        elif conflicts:
+            errors.append({'row': rowNumber, 'error': describe_conflict(conflicts[0], key[0], key[1])})
+        else:
+            bookings.add(key[0], key[1], key[2], durationMinutes)
+            accepted[key] = durationMinutes
+            acceptedRows[key] = rowNumber
+
+    inserted = _insert_shows(accepted) if accepted else set()
+    for key, rowNumber in acceptedRows.items():
+        if key not in inserted:
+            errors.append({'row': rowNumber, 'error': 'show is already scheduled'})
+    _add_counts(inserted, currentDateTime)
+    db.session.commit()
+    errors.sort(key=lambda error: error['row'])
+    return {'inserted': len(inserted), 'errors': errors}
@@ -0,0 +1,183 @@
+from array import array
+
+from flask import current_app, has_app_context
+from sqlalchemy import case, event, func
+from sqlalchemy.orm import Session, object_session
+
+from model import Artist, Venue, db
+
+
+# ----------------------------------------------------------------------------#
+# Search backends.
+# ----------------------------------------------------------------------------#
+
+class PostgresSearchIndex:
+    '''
+    Searches names through the pg_trgm GIN index added by migration 3a37ff9f9c44.
+    ILIKE '%term%' is answered from the trigram index instead of a sequential
+    scan; matches are ranked exact first, then prefix, then by similarity.
+    '''
+
+    def __init__(self, model):
+        self.model = model
+
+    def search(self, term, limit=None):
+        name = self.model.name
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        rank = case([(func.lower(name) == term.lower(), 0),
+                     (name.ilike(escaped + '%'), 1)],
+                    else_=2)
+        query = self.model.query \
+            .filter(name.ilike('%' + escaped + '%')) \
+            .order_by(rank, func.similarity(name, term).desc(), name, self.model.id)
+        if limit is not None:
+            query = query.limit(limit)
+        return query.all()
+
+
+class MemorySearchIndex:
+    '''
+    In-process trigram index used where pg_trgm is not available (SQLite test runs).
+    Names are loaded once in a single query and kept current as sessions commit.
+    Each trigram maps to the ids of the names containing it; a search only
+    verifies the ids under the query's rarest trigram.
+    '''
+
+    def __init__(self, model):
+        self.model = model
+        self.names = None
+        self.postings = {}
+
+    def build(self):
+        self.names = {}
+        self.postings = {}
+        for entityId, name in db.session.query(self.model.id, self.model.name).order_by(self.model.id):
+            self.add(entityId, name)
+
+    def add(self, entityId, name):
+        if self.names is None:
+            return
+        name = (name or '').lower()
+        if self.names.get(entityId) == name:
+            return
+        self.names[entityId] = name
+        for trigram in name_trigrams(name):
+            self.postings.setdefault(trigram, array('i')).append(entityId)
+
+    def discard(self, entityId):
+        # stale postings are skipped when candidates are verified against self.names
+        if self.names is not None:
+            self.names.pop(entityId, None)
+
+    def search(self, term, limit=None):
+        if self.names is None:
+            self.build()
+        term = term.lower()
+        trigrams = name_trigrams(term)
+        if trigrams:
+            postings = [self.postings.get(trigram, ()) for trigram in trigrams]
+            candidates = set(min(postings, key=len))
+        else:
+            # terms shorter than a trigram can only be answered by a scan
+            candidates = list(self.names)
+
+        ranked = []
+        for entityId in candidates:
+            name = self.names.get(entityId)
+            if name is None or term not in name:
+                continue
+            ranked.append((match_rank(name, term), len(name), name, entityId))
+        ranked.sort()
+        if limit is not None:
+            ranked = ranked[:limit]
+
+        ids = [entityId for _, _, _, entityId in ranked]
+        if not ids:
+            return []
+        entities = {entity.id: entity for entity in self.model.query.filter(self.model.id.in_(ids))}
+        return [entities[entityId] for entityId in ids if entityId in entities]
+
+
+def name_trigrams(name):
+    return {name[i:i + 3] for i in range(len(name) - 2)}
+
+
+def match_rank(name, term):
+    if name == term:
+        return 0
+    if name.startswith(term):
+        return 1
+    if any(word.startswith(term) for word in name.split()):
+        return 2
+    return 3
+
+
+# ----------------------------------------------------------------------------#
+# Index registry.
+# ----------------------------------------------------------------------------#
+
+BACKENDS = {
+    'postgres': PostgresSearchIndex,
+    'memory': MemorySearchIndex
+}
+
+
+def search_index(model):
+    '''
+    Returns the search index of a model for the current app.
+    The backend comes from the SEARCH_BACKEND setting, or from the database
+    dialect when it is not set.
+    '''
+    indexes = current_app.extensions.setdefault('search', {})
+    if model not in indexes:
+        backend = current_app.config.get('SEARCH_BACKEND')
+        if backend is None:
+            backend = 'postgres' if db.engine.dialect.name == 'postgresql' else 'memory'
+        indexes[model] = BACKENDS[backend](model)
+    return indexes[model]
+
+
+def _loaded_memory_index(model):
+    if not has_app_context():
+        return None
+    index = current_app.extensions.get('search', {}).get(model)
+    return index if isinstance(index, MemorySearchIndex) else None
+
+
+def _note_change(target, name):
+    # the change reaches the index when the session commits; None removes the name
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault('search_changes', []).append((type(target), target.id, name))
+
+
+def _index_saved(mapper, connection, target):
+    _note_change(target, target.name)
+
+
+def _index_deleted(mapper, connection, target):
+    _note_change(target, None)
+
+
+def _apply_changes(session):
+    for model, entityId, name in session.info.pop('search_changes', ()):
+        index = _loaded_memory_index(model)
+        if index is None:
+            continue
+        if name is None:
+            index.discard(entityId)
+        else:
+            index.add(entityId, name)
+
+
+def _discard_changes(session):
+    # rolled back inserts and renames never reach the index
+    session.info.pop('search_changes', None)
+
+
+for searchable in (Venue, Artist):
+    event.listen(searchable, 'after_insert', _index_saved)
+    event.listen(searchable, 'after_update', _index_saved)
+    event.listen(searchable, 'after_delete', _index_deleted)
+event.listen(Session, 'after_commit', _apply_changes)
+event.listen(Session, 'after_rollback', _discard_changes)
@@ -0,0 +1,189 @@
+import csv
+import io
+import json
+import os
+import time
+from datetime import datetime
+
+import dateutil.parser
+
+from model import Artist, Venue, Show, db, venue_genres, artist_generes, resolve_genres
+
+ARTIST_FIELDS = ('name', 'city', 'state', 'phone', 'website', 'seeking_venue',
+                 'seeking_description', 'image_link', 'facebook_link')
+VENUE_FIELDS = ('name', 'city', 'state', 'address', 'phone', 'website', 'seeking_talent',
+                'seeking_description', 'image_link', 'facebook_link')
+BOOLEAN_FIELDS = ('seeking_venue', 'seeking_talent')
+
+
+# ----------------------------------------------------------------------------#
+# Reading datasets.
+# ----------------------------------------------------------------------------#
+
+def read_dataset(path=None):
+    '''
+    Reads a dataset to seed from.
+    Input: <string> None for data.py, a .json file shaped like data.py
+           ({"artists": [...], "venues": [...]}), or a directory holding
+           artists.csv, venues.csv and shows.csv (venue_name, artist_name, start_time),
+           where the genres column lists genres separated by ';'
+    Output: <dict> {'artists': [...], 'venues': [...], 'shows': [(venue_name, artist_name, start_time)]}
+    '''
+    if path is None:
+        from data import artists, venues
+        return _from_nested(artists, venues)
+    if path.endswith('.json'):
+        with open(path) as dump:
+            content = json.load(dump)
+        return _from_nested(content.get('artists', []), content.get('venues', []))
+
+    def read_csv(name):
+        with open(os.path.join(path, name), newline='') as dump:
+            return list(csv.DictReader(dump))
+
+    entities = {}
+    for kind in ('artists', 'venues'):
+        entities[kind] = []
+        for row in read_csv(kind + '.csv'):
+            row['genres'] = [genre for genre in (row.get('genres') or '').split(';') if genre]
+            for field in BOOLEAN_FIELDS:
+                if field in row:
+                    row[field] = row[field].strip().lower() in ('1', 'true', 'yes')
+            entities[kind].append(row)
+    shows = [(row['venue_name'], row['artist_name'], row['start_time']) for row in read_csv('shows.csv')]
+    return {'artists': entities['artists'], 'venues': entities['venues'], 'shows': shows}
+
+
+def _from_nested(artists, venues):
+    # data.py lists every show twice, once under its artist and once under its venue
+    shows = []
+    for artist in artists:
+        for show in artist.get('past_shows', []) + artist.get('upcoming_shows', []):
+            shows.append((show['venue_name'], artist['name'], show['start_time']))
+    for venue in venues:
+        for show in venue.get('past_shows', []) + venue.get('upcoming_shows', []):
+            shows.append((venue['name'], show['artist_name'], show['start_time']))
+    return {'artists': artists, 'venues': venues, 'shows': shows}
+
+
+def _parse_time(value):
+    if isinstance(value, datetime):
+        return value
+    # show times are stored naive, as Postgres did with the original ISO strings
+    return dateutil.parser.parse(value).replace(tzinfo=None)
+
+
+# ----------------------------------------------------------------------------#
+# Loading.
+# ----------------------------------------------------------------------------#
+
+def _bulk_insert(table, rows):
+    '''
+    Inserts rows in one statement: COPY on Postgres, executemany elsewhere.
+    '''
+    if not rows:
+        return
+    if db.engine.dialect.name != 'postgresql':
+        db.session.execute(table.insert(), rows)
+        return
+    columns = list(rows[0])
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow([row[column] for column in columns])
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY {} ({}) FROM STDIN WITH CSV'.format(table.name, ', '.join(columns)), buffer)
+
+
+def _reset_sequence(table):
+    if db.engine.dialect.name == 'postgresql':
+        db.session.execute("SELECT setval(pg_get_serial_sequence('{0}', 'id'), MAX(id)) FROM {0}"
+                           .format(table.name))
+
+
+def _name_ids(entities):
+    # ids are handed out in dataset order; shows refer to the first entity of a name
+    ids = {}
+    for entityId, entity in enumerate(entities, start=1):
+        ids.setdefault(entity['name'], entityId)
+    return ids
+
+
+def seed(dataset, currentDateTime=None):
+    '''
+    Loads a dataset from read_dataset into empty artist, venue and show tables,
+    in a single transaction. Ids are assigned in memory, so shows are matched
+    to their venue and artist by name without querying them back, and show
+    counters are computed while loading.
+    Output: <dict> rows inserted per table, or None when the tables are not empty
+    Raises ValueError, before anything is inserted, when a show names a venue
+    or artist missing from the dataset
+    '''
+    if currentDateTime is None:
+        currentDateTime = datetime.today()
+    if db.session.query(Artist.query.exists() | Venue.query.exists()).scalar():
+        return None
+
+    genreIds = {genre.name: genre.id for genre in resolve_genres(
+        [genre for entity in dataset['artists'] + dataset['venues'] for genre in entity.get('genres', [])])}
+
+    artistIds = _name_ids(dataset['artists'])
+    venueIds = _name_ids(dataset['venues'])
+    counters = {}
+    shows = []
+    seen = set()
+    for venueName, artistName, startTime in dataset['shows']:
+        for kind, name, ids in (('venue', venueName, venueIds), ('artist', artistName, artistIds)):
+            if name not in ids:
+                raise ValueError('show of {!r} at {!r} on {}: no {} named {!r} in the dataset'.format(
+                    artistName, venueName, startTime, kind, name))
+        key = (venueIds[venueName], artistIds[artistName], _parse_time(startTime))
+        if key in seen:
+            continue
+        seen.add(key)
+        shows.append({'venue_id': key[0], 'artist_id': key[1], 'start_time': key[2]})
+        counter = 'upcoming_shows_count' if key[2] >= currentDateTime else 'past_shows_count'
+        for owner in (('venue', key[0]), ('artist', key[1])):
+            counters.setdefault(owner, {'upcoming_shows_count': 0, 'past_shows_count': 0})[counter] += 1
+
+    inserted = {}
+    for kind, model, fields, associations, entities in (
+            ('artist', Artist, ARTIST_FIELDS, artist_generes, dataset['artists']),
+            ('venue', Venue, VENUE_FIELDS, venue_genres, dataset['venues'])):
+        rows = []
+        genreRows = []
+        for entityId, entity in enumerate(entities, start=1):
+            row = {'id': entityId}
+            row.update({field: entity.get(field) for field in fields})
+            row.update(counters.get((kind, entityId), {'upcoming_shows_count': 0, 'past_shows_count': 0}))
+            rows.append(row)
+            genreRows.extend({kind + '_id': entityId, 'genres_id': genreIds[genre]}
+                             for genre in dict.fromkeys(entity.get('genres', [])) if genre)
+        _bulk_insert(model.__table__, rows)
+        _bulk_insert(associations, genreRows)
+        _reset_sequence(model.__table__)
+        inserted[kind] = len(rows)
+        inserted[kind + '_genres'] = len(genreRows)
+    _bulk_insert(Show.__table__, shows)
+    inserted['show'] = len(shows)
+    db.session.commit()
+    return inserted
+
+
+def seed_command(path=None):
+    '''
+    Seeds the database and reports the load rate.
+    Output: <string> summary line
+    '''
+    start = time.perf_counter()
+    inserted = seed(read_dataset(path))
+    elapsed = time.perf_counter() - start
+    if inserted is None:
+        return 'Artists or venues already exist; nothing seeded.'
+    numRows = sum(inserted.values())
+    return 'Seeded {} rows ({}) in {:.2f}s, {:.0f} rows/second.'.format(
+        numRows,
+        ', '.join('{} {}'.format(count, table) for table, count in inserted.items()),
+        elapsed,
+        numRows / elapsed if elapsed else numRows)
@@ -0,0 +1,576 @@
+import json
+import os
+import tempfile
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from flask import Flask
+from sqlalchemy import create_engine, exc
+
+from benchmark import create_benchmark_app, count_queries, seed, query_plans
+from model import Artist, Venue, Show, Genres, db, count_show, release_shows, refresh_show_counts, resolve_genres
+from queries import venue_areas, venue_detail, artist_detail, show_rows, show_page, decode_cursor
+from search import search_index
+from seed import read_dataset, seed as seed_dataset
+from formatting import format_datetime
+from cache import MemoryBackend, PageCache
+from api import api
+from scheduling import read_schedule_csv, schedule_shows
+from conflicts import BookingIndex, find_conflicts
+from engine import TimedQueuePool, pool_stats
+from flask_dbtools.routing import LAST_WRITE_COOKIE, read_only
+from flask_dbtools.profiler import QueryBudgetExceeded, QueryProfiler, fingerprint, query_budget
+
+
+class FyyurTestCase(unittest.TestCase):
+    """This class represents the fyyur data layer test case"""
+
+    def setUp(self):
+        """Define test variables and initialize a throwaway database."""
+        handle, self.database_path = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        self.app = create_benchmark_app(self.database_path)
+        self.context = self.app.app_context()
+        self.context.push()
+        db.create_all()
+        self.now = datetime.today()
+
+    def tearDown(self):
+        db.session.remove()
+        db.engine.dispose()
+        self.context.pop()
+        os.remove(self.database_path)
+
+    def test_venue_areas_groups_by_city_and_state(self):
+        seed(8, showsPerVenue=4, currentDateTime=self.now)
+        areas = venue_areas()
+
+        self.assertEqual(len(areas), 4)
+        self.assertEqual(sum(len(area['venues']) for area in areas), 8)
+        for area in areas:
+            for venue in area['venues']:
+                self.assertEqual(venue['num_upcoming_shows'], 2)
+
+    def test_venue_areas_keeps_venues_without_upcoming_shows(self):
+        seed(3, showsPerVenue=1, currentDateTime=self.now)
+        areas = venue_areas()
+
+        self.assertEqual(sum(len(area['venues']) for area in areas), 3)
+        self.assertTrue(all(venue['num_upcoming_shows'] == 0
+                            for area in areas for venue in area['venues']))
+
+    def test_venue_areas_query_count_is_constant(self):
+        seed(10, currentDateTime=self.now)
+        with count_queries() as small:
+            venue_areas()
+
+        numVenues = int(os.environ.get('FYYUR_BENCH_ROWS', 2000))
+        db.session.execute('DELETE FROM show')
+        db.session.execute('DELETE FROM venue')
+        db.session.execute('DELETE FROM artist')
+        seed(numVenues, currentDateTime=self.now)
+        with count_queries() as large:
+            venue_areas()
+
+        self.assertEqual(len(small), 1)
+        self.assertEqual(len(large), len(small))
+
+    def test_count_show_bumps_upcoming_counters(self):
+        seed(1, showsPerVenue=0, currentDateTime=self.now)
+        startTime = self.now + timedelta(days=3)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=startTime))
+        count_show(1, 1, startTime, self.now)
+        db.session.commit()
+
+        self.assertEqual(Venue.query.get(1).upcoming_shows_count, 1)
+        self.assertEqual(Artist.query.get(1).upcoming_shows_count, 1)
+        self.assertEqual(Venue.query.get(1).past_shows_count, 0)
+
+    def test_release_shows_updates_partner_counters(self):
+        seed(2, showsPerVenue=4, currentDateTime=self.now)
+        release_shows(venueId=1, currentDateTime=self.now)
+        db.session.commit()
+
+        artist = Artist.query.get(1)
+        self.assertEqual(artist.upcoming_shows_count, 2)
+        self.assertEqual(artist.past_shows_count, 2)
+        self.assertEqual(Show.query.filter_by(venue_id=1).count(), 0)
+
+    def test_refresh_show_counts_rolls_shows_over(self):
+        seed(2, showsPerVenue=2, currentDateTime=self.now)
+        later = self.now + timedelta(days=2, hours=1)
+        numVenues, numArtists = refresh_show_counts(later, since=self.now)
+
+        self.assertEqual((numVenues, numArtists), (2, 1))
+        venue = Venue.query.get(1)
+        self.assertEqual(venue.upcoming_shows_count, 0)
+        self.assertEqual(venue.past_shows_count, 2)
+        self.assertEqual(Artist.query.get(1).past_shows_count, 4)
+
+    def test_search_ranks_exact_then_prefix_then_substring(self):
+        for name in ['The Wild Sax Band', 'Sax', 'Saxophone Club', 'Wild Sax']:
+            db.session.add(Venue(name=name))
+        db.session.commit()
+        results = [venue.name for venue in search_index(Venue).search('sax')]
+
+        self.assertEqual(results, ['Sax', 'Saxophone Club', 'Wild Sax', 'The Wild Sax Band'])
+
+    def test_search_index_follows_inserts_and_deletes(self):
+        oldArtist = Artist(name='Guns N Petals')
+        db.session.add(oldArtist)
+        db.session.commit()
+        index = search_index(Artist)
+        self.assertEqual(len(index.search('petal')), 1)
+
+        db.session.add(Artist(name='Petals Revival'))
+        db.session.delete(oldArtist)
+        db.session.commit()
+
+        self.assertEqual([artist.name for artist in index.search('petal')], ['Petals Revival'])
+
+    def test_search_index_ignores_rolled_back_changes(self):
+        artist = Artist(name='Guns N Petals')
+        db.session.add(artist)
+        db.session.commit()
+        index = search_index(Artist)
+        self.assertEqual(len(index.search('petal')), 1)
+
+        db.session.add(Artist(name='Petals Revival'))
+        artist.name = 'The Wild Sax Band'
+        db.session.flush()
+        db.session.rollback()
+
+        self.assertEqual([artist.name for artist in index.search('petal')], ['Guns N Petals'])
+        self.assertEqual(index.search('sax'), [])
+
+    def test_search_short_and_missing_terms(self):
+        db.session.add(Artist(name='Matt Quevedo'))
+        db.session.commit()
+
+        self.assertEqual(len(search_index(Artist).search('qu')), 1)
+        self.assertEqual(search_index(Artist).search('zzz'), [])
+
+    def test_venue_detail_splits_past_and_upcoming_shows(self):
+        seed(1, showsPerVenue=3, currentDateTime=self.now)
+        data = venue_detail(1, self.now)
+
+        self.assertEqual(data['past_shows_count'], 2)
+        self.assertEqual(data['upcoming_shows_count'], 1)
+        self.assertEqual(data['upcoming_shows'][0]['artist_name'], 'Benchmark Artist')
+        self.assertIsNone(venue_detail(2, self.now))
+
+    def test_detail_query_count_is_constant(self):
+        seed(2, showsPerVenue=1, currentDateTime=self.now)
+        with count_queries() as few:
+            venue_detail(1, self.now)
+        with count_queries() as fewArtist:
+            artist_detail(1, self.now)
+
+        for showNumber in range(50):
+            db.session.add(Show(venue_id=1, artist_id=1,
+                                start_time=self.now + timedelta(hours=showNumber + 1)))
+        db.session.commit()
+        db.session.expire_all()
+        with count_queries() as many:
+            data = venue_detail(1, self.now)
+        with count_queries() as manyArtist:
+            artist_detail(1, self.now)
+
+        self.assertEqual(data['upcoming_shows_count'], 50)
+        self.assertEqual(len(few), 2)
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(manyArtist), len(fewArtist))
+
+    def test_show_pages_cover_every_show_once(self):
+        seed(7, showsPerVenue=3, currentDateTime=self.now)
+        seen = []
+        after = None
+        while True:
+            page, nextCursor = show_page(after, limit=4)
+            seen.extend((show['start_time'], show['venue_id'], show['artist_id']) for show in page)
+            if nextCursor is None:
+                break
+            after = decode_cursor(nextCursor)
+
+        self.assertEqual(len(seen), 21)
+        self.assertEqual(seen, sorted(set(seen)))
+
+    def test_show_rows_is_lazy(self):
+        seed(3, showsPerVenue=2, currentDateTime=self.now)
+        rows = show_rows()
+
+        self.assertEqual(next(rows)['artist_name'], 'Benchmark Artist')
+        self.assertEqual(len(list(rows)), 5)
+
+    def test_decode_cursor_rejects_garbage(self):
+        with self.assertRaises(ValueError):
+            decode_cursor('not-a-cursor')
+
+    def test_resolve_genres_batches_lookups_and_inserts(self):
+        venue = Venue(name='Dueling Pianos')
+        with count_queries() as first:
+            venue.genres = resolve_genres(['Jazz', 'Rock', 'Jazz', 'Folk'])
+        db.session.add(venue)
+        db.session.commit()
+        with count_queries() as cached:
+            genres = resolve_genres(['Rock', 'Jazz'])
+
+        self.assertEqual(len([q for q in first if q.startswith('INSERT')]), 1)
+        self.assertLessEqual(len([q for q in first if q.startswith('SELECT')]), 2)
+        self.assertEqual(cached, [])
+        self.assertEqual([genre.name for genre in genres], ['Rock', 'Jazz'])
+        self.assertEqual(Genres.query.count(), 3)
+
+    def test_resolve_genres_forgets_rolled_back_inserts(self):
+        resolve_genres(['Swing'])
+        db.session.rollback()
+        venue = Venue(name='Park Square Live Music & Coffee')
+        venue.genres = resolve_genres(['Swing'])
+        db.session.add(venue)
+        db.session.commit()
+
+        self.assertEqual([genre.name for genre in Venue.query.get(venue.id).genres], ['Swing'])
+
+    def test_seed_loads_data_py_in_one_pass(self):
+        with count_queries() as statements:
+            inserted = seed_dataset(read_dataset(), self.now)
+
+        self.assertEqual(inserted['artist'], 3)
+        self.assertEqual(inserted['venue'], 3)
+        self.assertEqual(inserted['show'], 5)
+        self.assertLessEqual(len(statements), 10)
+        self.assertEqual(Venue.query.filter_by(name='Park Square Live Music & Coffee').one().upcoming_shows_count, 3)
+        self.assertEqual([genre.name for genre in Artist.query.filter_by(name='The Wild Sax Band').one().genres],
+                         ['Jazz', 'Classical'])
+        self.assertIsNone(seed_dataset(read_dataset(), self.now))
+
+    def test_seed_reads_json_and_csv_dumps(self):
+        dumpDirectory = tempfile.mkdtemp()
+        jsonPath = os.path.join(dumpDirectory, 'dump.json')
+        with open(jsonPath, 'w') as dump:
+            json.dump({'artists': [{'name': 'Neon Owls', 'genres': ['Folk'], 'upcoming_shows': [
+                {'venue_name': 'Echo Hall', 'start_time': '2035-01-01T20:00:00.000Z'}]}],
+                       'venues': [{'name': 'Echo Hall', 'genres': []}]}, dump)
+        for name, content in (('artists.csv', 'name,genres,seeking_venue\nNeon Owls,Folk;Jazz,true\n'),
+                              ('venues.csv', 'name,city,state,genres\nEcho Hall,Austin,TX,\n'),
+                              ('shows.csv', 'venue_name,artist_name,start_time\nEcho Hall,Neon Owls,2035-01-01 20:00\n')):
+            with open(os.path.join(dumpDirectory, name), 'w') as dump:
+                dump.write(content)
+
+        fromJson = read_dataset(jsonPath)
+        fromCsv = read_dataset(dumpDirectory)
+
+        self.assertEqual(fromJson['shows'], [('Echo Hall', 'Neon Owls', '2035-01-01T20:00:00.000Z')])
+        self.assertEqual(fromCsv['artists'][0]['genres'], ['Folk', 'Jazz'])
+        self.assertIs(fromCsv['artists'][0]['seeking_venue'], True)
+        inserted = seed_dataset(fromCsv, self.now)
+        self.assertEqual((inserted['artist'], inserted['venue'], inserted['show']), (1, 1, 1))
+        self.assertEqual(Artist.query.one().upcoming_shows_count, 1)
+
+    def test_seed_names_a_show_with_a_missing_venue(self):
+        dataset = {'artists': [{'name': 'Neon Owls'}], 'venues': [{'name': 'Echo Hall'}],
+                   'shows': [('Lost Hall', 'Neon Owls', '2035-01-01 20:00')]}
+
+        with self.assertRaises(ValueError) as raised:
+            seed_dataset(dataset, self.now)
+        self.assertIn("no venue named 'Lost Hall'", str(raised.exception))
+        self.assertIn("show of 'Neon Owls' at 'Lost Hall' on 2035-01-01 20:00", str(raised.exception))
+        self.assertEqual(Artist.query.count(), 0)
+
+    def test_format_datetime_accepts_datetimes_and_iso_strings(self):
+        startTime = datetime(2035, 4, 1, 20, 0, 0, 123456)
+
+        self.assertEqual(format_datetime(startTime, 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+        self.assertEqual(format_datetime('2035-04-01T20:00:00.000Z', 'full'), 'Sunday April, 1, 2035 at 8:00PM')
+        self.assertEqual(format_datetime(startTime), 'Sun 04, 01, 2035 8:00PM')
+        self.assertEqual(format_datetime(startTime, 'yyyy-MM-dd'), '2035-04-01')
+
+    def test_view_queries_use_indexes(self):
+        seed(2000, showsPerVenue=4, currentDateTime=self.now)
+        db.session.commit()
+
+        for label, _, statements in query_plans(2000, self.now):
+            for statement, tables in statements:
+                self.assertEqual(tables, [], '{} scans {}:\n{}'.format(label, tables, statement))
+
+    def test_api_projects_requested_fields_and_pages_by_id(self):
+        seed(3, showsPerVenue=2, currentDateTime=self.now)
+        db.session.commit()
+        self.app.register_blueprint(api)
+        client = self.app.test_client()
+
+        first = client.get('/api/v1/venues?fields=name,upcoming_shows_count&limit=2').get_json()
+        rest = client.get('/api/v1/venues?fields=name&after={}'.format(first['next'])).get_json()
+        detail = client.get('/api/v1/artists/1?fields=name,genres').get_json()
+        shows = client.get('/api/v1/shows?fields=venue_id,start_time&limit=4').get_json()
+
+        self.assertEqual(first['data'], [{'name': 'Venue 1', 'upcoming_shows_count': 1},
+                                         {'name': 'Venue 2', 'upcoming_shows_count': 1}])
+        self.assertEqual(rest, {'data': [{'name': 'Venue 3'}], 'next': None})
+        self.assertEqual(detail, {'name': 'Benchmark Artist', 'genres': []})
+        self.assertEqual(len(shows['data']), 4)
+        self.assertEqual(set(shows['data'][0]), {'venue_id', 'start_time'})
+        self.assertEqual(decode_cursor(shows['next'])[0].isoformat(), shows['data'][-1]['start_time'])
+        self.assertEqual(client.get('/api/v1/venues?fields=name,secret').status_code, 400)
+        self.assertEqual(client.get('/api/v1/venues/99').get_json()['error'], 404)
+
+    def test_schedule_shows_reports_rows_it_skips(self):
+        seed(2, showsPerVenue=1, currentDateTime=self.now)
+        db.session.commit()
+        existing = Show.query.filter_by(venue_id=1).one().start_time
+        rows = read_schedule_csv([
+            'venue_id,artist_id,start_time',
+            '1,1,2035-01-01 20:00',
+            '2,1,2035-01-02 20:00',
+            '2,1,2035-01-02T20:00:00',
+            '9,1,2035-01-01 20:00',
+            '1,7,2035-01-01 20:00',
+            '1,x,2035-01-01 20:00',
+            '1,1,not a time',
+            '1,1,' + existing.isoformat(),
+            '2,1,2035-01-01 21:30',
+        ])
+
+        with count_queries() as statements:
+            report = schedule_shows(rows, self.now)
+
+        self.assertEqual(report['inserted'], 2)
+        self.assertEqual([error['row'] for error in report['errors']], [3, 4, 5, 6, 7, 8, 9])
+        self.assertEqual(report['errors'][0]['error'], 'duplicate of row 2')
+        self.assertEqual(report['errors'][-2]['error'], 'show is already scheduled')
+        self.assertEqual(report['errors'][-1]['error'], 'artist 1 is already booked at venue 1 from 2035-01-01T20:00:00')
+        self.assertEqual(Venue.query.get(2).upcoming_shows_count, 1)
+        self.assertEqual(Artist.query.get(1).upcoming_shows_count, 2)
+        # two id lookups, the booking index load, the insert and one update per table and counter
+        self.assertEqual(len(statements), 6)
+
+    def test_schedule_shows_checks_json_ids_by_value(self):
+        seed(2, showsPerVenue=0, currentDateTime=self.now)
+        db.session.commit()
+        report = schedule_shows([
+            {'venue_id': 0, 'artist_id': 1, 'start_time': '2035-01-01T20:00:00'},
+            {'venue_id': 1.9, 'artist_id': 1, 'start_time': '2035-01-01T20:00:00'},
+            {'venue_id': True, 'artist_id': 1, 'start_time': '2035-01-01T20:00:00'},
+            {'venue_id': 2.0, 'artist_id': 1, 'start_time': '2035-01-01T20:00:00', 'duration_minutes': 90.5},
+            {'venue_id': 2.0, 'artist_id': 1, 'start_time': '2035-01-01T20:00:00', 'duration_minutes': 90.0},
+        ], self.now)
+
+        self.assertEqual(report['inserted'], 1)
+        self.assertEqual([(error['row'], error['error']) for error in report['errors']], [
+            (1, 'venue 0 does not exist'),
+            (2, 'venue_id and artist_id must be integers'),
+            (3, 'venue_id and artist_id must be integers'),
+            (4, 'duration_minutes must be an integer')])
+        self.assertEqual(Show.query.filter_by(venue_id=2).one().duration_minutes, 90)
+
+    def test_booking_index_finds_overlaps_in_both_directions(self):
+        bookings = BookingIndex()
+        start = datetime(2035, 1, 1, 20, 0)
+        bookings.add(1, 1, start, 120)
+        bookings.add(2, 2, start + timedelta(hours=3), 60)
+
+        self.assertEqual(bookings.conflicts(3, 1, start - timedelta(minutes=30), 31), [(1, 1, start)])
+        self.assertEqual(bookings.conflicts(3, 1, start - timedelta(minutes=30), 30), [])
+        self.assertEqual(bookings.conflicts(1, 3, start + timedelta(minutes=119), 60), [(1, 1, start)])
+        self.assertEqual(bookings.conflicts(1, 3, start + timedelta(minutes=120), 60), [])
+        self.assertEqual(bookings.conflicts(2, 1, start + timedelta(hours=1), 180),
+                         [(2, 2, start + timedelta(hours=3)), (1, 1, start)])
+
+    def test_booking_index_load_sorts_shows_once(self):
+        seed(2, showsPerVenue=0, currentDateTime=self.now)
+        start = datetime(2035, 1, 1, 20, 0)
+        hours = [5, 1, 9, 3, 7, 0]
+        for hour in hours:
+            db.session.add(Show(venue_id=hour % 2 + 1, artist_id=1, start_time=start + timedelta(hours=hour),
+                                duration_minutes=60))
+        db.session.commit()
+        loaded = BookingIndex.load({1, 2}, {1}, start, start + timedelta(days=1))
+        added = BookingIndex()
+        for hour in hours:
+            added.add(hour % 2 + 1, 1, start + timedelta(hours=hour), 60)
+
+        self.assertEqual(loaded.artists.starts[1], [start + timedelta(hours=hour) for hour in sorted(hours)])
+        self.assertEqual(loaded.venues.intervals, added.venues.intervals)
+        self.assertEqual(loaded.artists.intervals, added.artists.intervals)
+        self.assertEqual(loaded.conflicts(2, 2, start + timedelta(minutes=90), 120),
+                         [(2, 1, start + timedelta(hours=1)), (2, 1, start + timedelta(hours=3))])
+
+    def test_find_conflicts_checks_venue_and_artist(self):
+        seed(2, showsPerVenue=0, currentDateTime=self.now)
+        start = datetime(2035, 1, 1, 20, 0)
+        db.session.add(Show(venue_id=1, artist_id=1, start_time=start, duration_minutes=90))
+        db.session.commit()
+
+        self.assertEqual(len(find_conflicts(2, 1, start + timedelta(minutes=89))), 1)
+        self.assertEqual(len(find_conflicts(1, 2, start - timedelta(hours=1), 61)), 1)
+        self.assertEqual(find_conflicts(2, 1, start + timedelta(minutes=90)), [])
+        self.assertEqual(find_conflicts(2, 2, start), [])
+
+    def test_timed_pool_reports_checkouts_and_waits(self):
+        engine = create_engine('sqlite:///' + self.database_path, poolclass=TimedQueuePool,
+                               pool_size=1, max_overflow=0, pool_timeout=0.05)
+        connection = engine.connect()
+        self.assertEqual(pool_stats(engine)['checked_out'], 1)
+        with self.assertRaises(exc.TimeoutError):
+            engine.connect()
+        connection.close()
+        engine.connect().close()
+
+        stats = pool_stats(engine)
+        self.assertEqual((stats['checked_out'], stats['checkouts'], stats['timeouts']), (0, 3, 1))
+        self.assertGreaterEqual(stats['wait_seconds_max'], 0.05)
+        engine.dispose()
+
+    def test_sqlite_keeps_its_default_pool(self):
+        self.app.config['DATABASE_POOL_SIZE'] = 3
+        self.assertEqual(pool_stats(db.engine)['pool'], 'NullPool')
+
+    def test_read_only_views_use_the_replica_outside_the_write_window(self):
+        handle, replicaPath = tempfile.mkstemp(suffix='.db')
+        os.close(handle)
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.database_path
+        app.config['SQLALCHEMY_REPLICA_URIS'] = ['sqlite:///' + replicaPath]
+        app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+        db.init_app(app)
+        db.session.remove()
+        with app.app_context():
+            db.Model.metadata.create_all(db.get_engine(app, bind='replica0'))
+
+        @app.route('/venues')
+        @read_only
+        def venues():
+            return str(Venue.query.count())
+
+        @app.route('/venues', methods=['POST'])
+        def create_venue():
+            db.session.add(Venue(name='New Venue'))
+            db.session.commit()
+            return str(Venue.query.count())
+
+        @app.route('/venues/touch')
+        @read_only
+        def touch_venue():
+            db.session.add(Venue(name='Written While Reading'))
+            db.session.flush()
+            return str(Venue.query.count())
+
+        try:
+            client = app.test_client()
+            self.assertEqual(client.get('/venues').data, b'0')
+            self.assertEqual(client.post('/venues').data, b'1')
+            # read-your-writes: the cookie set by the write keeps this client on the primary
+            self.assertEqual(client.get('/venues').data, b'1')
+            self.assertEqual(app.test_client().get('/venues').data, b'0')
+            app.config['REPLICA_READ_YOUR_WRITES_SECONDS'] = 0
+            self.assertEqual(client.get('/venues').data, b'0')
+            self.assertEqual(client.get('/venues/touch').data, b'2')
+        finally:
+            with app.app_context():
+                db.get_engine(app, bind='replica0').dispose()
+                db.get_engine(app).dispose()
+            os.remove(replicaPath)
+
+    def test_query_profiler_reports_repeated_statements(self):
+        seed(6, showsPerVenue=1, currentDateTime=self.now)
+        self.app.testing = True
+        self.app.config['QUERY_PROFILER_PANEL'] = True
+        QueryProfiler(self.app)
+
+        @self.app.route('/shows')
+        def lazy_shows():
+            # one venue load per show: the N+1 the profiler should catch
+            return '<html><body>{}</body></html>'.format(
+                ', '.join(show.venue.name for show in Show.query.order_by(Show.venue_id)))
+
+        @self.app.route('/venues/<int:venue_id>')
+        @query_budget(1)
+        def show_venue(venue_id):
+            return str(venue_detail(venue_id, self.now)['upcoming_shows_count'])
+
+        client = self.app.test_client()
+        response = client.get('/shows')
+        timings = response.headers.getlist('Server-Timing')
+        self.assertTrue(timings[0].startswith('db;desc="7 queries";dur='))
+        self.assertTrue(timings[1].startswith('db-repeat;desc="1 repeated statements"'))
+        self.assertIn(b'<div id="query-profiler">', response.data)
+        self.assertTrue(response.data.endswith(b'</body></html>'))
+
+        self.app.config['QUERY_PROFILER_STRICT'] = True
+        with self.assertRaises(QueryBudgetExceeded):
+            client.get('/shows')
+        with self.assertRaises(QueryBudgetExceeded):
+            client.get('/venues/1')
+        self.assertEqual(fingerprint("SELECT * FROM venue WHERE id IN (?, ?,?) AND name = 'x' LIMIT 10"),
+                         'SELECT * FROM venue WHERE id IN (?) AND name = ? LIMIT ?')
+
+    def test_page_cache_serves_hits_until_invalidated(self):
+        self.app.config['SECRET_KEY'] = 'test'
+        cache = PageCache(self.app)
+        renders = []
+
+        @self.app.route('/venues/<int:venue_id>')
+        @cache.cached('venue', entity='venue_id')
+        def show_venue(venue_id):
+            renders.append(venue_id)
+            return 'venue {} render {}'.format(venue_id, len(renders))
+
+        client = self.app.test_client()
+        first = client.get('/venues/1').data
+        self.assertEqual(client.get('/venues/1').data, first)
+        client.get('/venues/2')
+        cache.invalidate('venue', 1)
+        self.assertNotEqual(client.get('/venues/1').data, first)
+        client.get('/venues/2')
+        cache.invalidate('venue')
+        client.get('/venues/2')
+
+        self.assertEqual(renders, [1, 2, 1, 2])
+        self.assertEqual(cache.metrics(), {'venue': {'hits': 2, 'misses': 4}})
+
+    def test_page_cache_skips_clients_inside_their_write_window(self):
+        self.app.config['SECRET_KEY'] = 'test'
+        cache = PageCache(self.app)
+        renders = []
+
+        @self.app.route('/venues')
+        @cache.cached('venues')
+        def venues():
+            renders.append(len(renders))
+            return 'render {}'.format(len(renders))
+
+        # a client that has not written caches a page, possibly from a lagging replica
+        self.assertEqual(self.app.test_client().get('/venues').data, b'render 1')
+        writer = self.app.test_client()
+        writer.set_cookie('localhost', LAST_WRITE_COOKIE, '{:.3f}'.format(time.time()))
+
+        self.assertEqual(writer.get('/venues').data, b'render 2')
+        self.assertEqual(self.app.test_client().get('/venues').data, b'render 1')
+        self.assertEqual(cache.metrics(), {'venues': {'hits': 1, 'misses': 1}})
+
+    def test_memory_backend_evicts_least_recent_and_expired_entries(self):
+        backend = MemoryBackend(maxEntries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get_many(['a'])
+        backend.set('c', 3)
+        backend.set('d', 4, ttl=-1)
+
+        self.assertEqual(backend.get_many(['a', 'b', 'c', 'd']), [None, None, 3, None])
+
+    def test_memory_backend_never_evicts_counters(self):
+        backend = MemoryBackend(maxEntries=2)
+        backend.incr('version:venue')
+        backend.set('page:venue:1', 'stale')
+        backend.incr('version:venue')
+        for key in ('a', 'b', 'c'):
+            backend.set(key, key)
+
+        self.assertEqual(backend.incr('version:venue'), 3)
+        self.assertEqual(backend.get_many(['version:venue', 'a']), [3, None])
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,164 @@
+import csv
+import io
+import json
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import bindparam
+
+from models import Question, category_registry, db, question_count, question_buckets
+from search import loaded_memory_index
+
+# rows per multi-row INSERT; 4 parameters each stays under SQLite's variable limit
+IMPORT_CHUNK_SIZE = 500
+# rows fetched per query while exporting
+EXPORT_CHUNK_SIZE = 5000
+FORMATS = ('jsonl', 'csv')
+FIELDS = ('question', 'answer', 'category', 'difficulty')
+
+
+class InvalidQuestion(ValueError):
+    pass
+
+
+def read_questions(stream, format='jsonl'):
+    '''
+    Yields the questions of a JSON Lines or CSV (with a header row) text
+    stream one at a time, with the line they start on.
+    '''
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            raise InvalidQuestion('line {}: not valid JSON'.format(line_number))
+        yield line_number, row
+
+
+def validate_question(line_number, row, category_ids):
+    # a row ready to insert, or InvalidQuestion naming the line and field
+    if not isinstance(row, dict):
+        raise InvalidQuestion('line {}: expected an object'.format(line_number))
+    for field in ('question', 'answer'):
+        if not isinstance(row.get(field), str) or not row[field].strip():
+            raise InvalidQuestion('line {}: {} must be a non-empty string'.format(line_number, field))
+    try:
+        category = int(row.get('category'))
+        difficulty = int(row.get('difficulty'))
+    except (TypeError, ValueError):
+        raise InvalidQuestion('line {}: category and difficulty must be integers'.format(line_number))
+    if category not in category_ids:
+        raise InvalidQuestion('line {}: category {} does not exist'.format(line_number, category))
+    return {
+        'question': row['question'],
+        'answer': row['answer'],
+        'category': category,
+        'difficulty': difficulty
+    }
+
+
+def insert_statement(size):
+    # a multi-row INSERT of size rows, with parameters named <field>_<row>
+    return Question.__table__.insert().values([
+        {field: bindparam('{}_{}'.format(field, row)) for field in FIELDS} for row in range(size)])
+
+
+def insert_parameters(chunk):
+    return {'{}_{}'.format(field, row): question[field] for row, question in enumerate(chunk) for field in FIELDS}
+
+
+def import_questions(rows, chunk_size=IMPORT_CHUNK_SIZE):
+    '''
+    Inserts (line number, row) pairs in multi-row INSERTs of chunk_size,
+    all in one transaction: an invalid row rolls back the whole import.
+    Rows are read as they are inserted, so memory stays flat however large
+    the import. Returns the number of questions imported.
+    '''
+    category_ids = category_registry().ids
+    # the full-chunk INSERT is compiled once and reused for every chunk
+    connection = db.session.connection().execution_options(compiled_cache={})
+    statement = insert_statement(chunk_size)
+    imported = 0
+    chunk = []
+    try:
+        for line_number, row in rows:
+            chunk.append(validate_question(line_number, row, category_ids))
+            if len(chunk) == chunk_size:
+                connection.execute(statement, insert_parameters(chunk))
+                imported += len(chunk)
+                chunk = []
+        if chunk:
+            connection.execute(insert_statement(len(chunk)), insert_parameters(chunk))
+            imported += len(chunk)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    question_count.invalidate()
+    question_buckets.invalidate()
+    index = loaded_memory_index()
+    if index is not None:
+        index.reset()
+    return imported
+
+
+def export_questions(chunk_size=EXPORT_CHUNK_SIZE):
+    '''
+    Yields every question as JSON Lines, in id order, one string per
+    chunk_size rows read by keyset, so memory stays flat.
+    '''
+    columns = (Question.id, Question.question, Question.answer, Question.category, Question.difficulty)
+    last_id = 0
+    while True:
+        rows = db.session.query(*columns).filter(Question.id > last_id) \
+            .order_by(Question.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield ''.join(json.dumps({
+            'id': question_id,
+            'question': question,
+            'answer': answer,
+            'category': category,
+            'difficulty': difficulty
+        }) + '\n' for question_id, question, answer, category, difficulty in rows)
+        if len(rows) < chunk_size:
+            return
+        last_id = rows[-1][0]
+
+
+def file_format(path, format):
+    # --format, or the file's extension
+    if format:
+        return format
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+questions_cli = AppGroup('questions', help='Import and export questions.')
+
+
+@questions_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', type=click.Choice(FORMATS), help='jsonl or csv; taken from the extension by default')
+def import_command(path, format):
+    '''Import questions from a JSON Lines or CSV file.'''
+    with io.open(path, encoding='utf-8', newline='') as stream:
+        try:
+            imported = import_questions(read_questions(stream, file_format(path, format)))
+        except InvalidQuestion as error:
+            raise click.ClickException(str(error))
+    click.echo('imported {} questions'.format(imported))
+
+
+@questions_cli.command('export')
+@click.argument('path', type=click.Path(dir_okay=False, writable=True), default='-')
+def export_command(path):
+    '''Export every question as JSON Lines, to PATH or stdout.'''
+    with click.open_file(path, 'w', encoding='utf-8') as stream:
+        for line in export_questions():
+            stream.write(line)
@@ -1,27 +1,60 @@
+import codecs
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS, cross_origin
-import random
-from werkzeug.exceptions import BadRequest
-from models import setup_db, Question, Category
+from werkzeug.exceptions import BadRequest, Gone
+from models import setup_db, Question, question_count, category_question_count, category_registry
+from flask_dbtools.profiler import QueryProfiler, repeats_expected
+from quiz import QuizSessions, next_question, random_question
+from search import search_index
+from bulk import InvalidQuestion, export_questions, import_questions, questions_cli, read_questions
 
 QUESTIONS_PER_PAGE = 10
 
 
-def paginate_questions(request, questions):
-    page = request.args.get('page', 1, type=int)
-    start = (page - 1) * QUESTIONS_PER_PAGE
-    end = start + QUESTIONS_PER_PAGE
-    selection = questions[start:end]
-    formatted_questions = [question.format() for question in selection]
-    return formatted_questions
+def paginate_questions(request, query):
+    # page in SQL: ?after_id=<id> continues after that question (keyset),
+    # otherwise ?page=<n> skips the earlier pages with OFFSET
+    after_id = request.args.get('after_id', type=int)
+    query = query.order_by(Question.id)
+    if after_id is not None:
+        query = query.filter(Question.id > after_id)
+    else:
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            return []
+        query = query.offset((page - 1) * QUESTIONS_PER_PAGE)
+    return [question.format() for question in query.limit(QUESTIONS_PER_PAGE)]
+
+
+def next_after_id(questions):
+    # after_id of the next page, or None on the last page
+    return questions[-1]['id'] if len(questions) == QUESTIONS_PER_PAGE else None
+
+
+def search_questions(term, page):
+    # one page of questions matching term, best matches first, with the number of matches
+    offset = (page - 1) * QUESTIONS_PER_PAGE
+    questions, total = search_index().search(term, offset, QUESTIONS_PER_PAGE)
+    return {
+        'success': True,
+        'questions': [question.format() for question in questions],
+        'total_questions': total,
+        'current_category': None,
+        'page': page
+    }
 
 
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
     setup_db(app)
+    # Server-Timing header with each request's query count and database time
+    QueryProfiler(app)
+    quiz_sessions = QuizSessions()
+    # flask questions import <file> / flask questions export [file]
+    app.cli.add_command(questions_cli)
     cors = CORS(app, resources={r"/api/*": {"origins": "*"}})
 
     @app.after_request
@@ -33,34 +66,74 @@ def create_app(test_config=None):
 
     @app.route('/categories')
     def get_all_categories():
-        # handle get all categories
-        categories = Category.query.order_by(Category.type).all()
-        formatted_categories = {category.id: category.type for category in categories}
-        response = {
-            'success': True,
-            'categories': formatted_categories
-        }
-        return jsonify(response)
+        # handle get all categories; clients revalidate with If-None-Match and
+        # get an empty 304 while the categories are unchanged
+        categories = category_registry()
+        if request.if_none_match.contains(categories.etag):
+            response = app.response_class(status=304)
+        else:
+            response = jsonify({
+                'success': True,
+                'categories': categories.types
+            })
+        response.set_etag(categories.etag)
+        response.cache_control.no_cache = True
+        return response
 
     @app.route('/questions')
     def get_all_questions():
-        # handle get all questions
-        questions = Question.query.order_by(Question.id).all()
-        formatted_questions = paginate_questions(request, questions)
-        categories = Category.query.order_by(Category.type).all()
-        formatted_categories = {category.id: category.type for category in categories}
+        # handle get all questions, a page at a time
+        formatted_questions = paginate_questions(request, Question.query)
         if len(formatted_questions) == 0:
             abort(404)
         else:
             response = {
                 'success': True,
                 'questions': formatted_questions,
-                'total_questions': len(questions),
-                'categories': formatted_categories,
-                'current_category': None
+                'total_questions': question_count(),
+                'categories': category_registry().types,
+                'current_category': None,
+                'next_after_id': next_after_id(formatted_questions)
             }
         return jsonify(response)
 
+    @app.route('/questions/search')
+    def get_search_results():
+        # handle ranked search over question text: ?q=<term>&page=<n>
+        term = request.args.get('q', '').strip()
+        page = request.args.get('page', 1, type=int)
+        if term == '' or page < 1:
+            abort(422)
+        return jsonify(search_questions(term, page))
+
+    @app.route('/questions/import', methods=['POST'])
+    @repeats_expected
+    def import_all_questions():
+        # handle bulk import of a JSON Lines body, or CSV with ?format=csv or
+        # Content-Type text/csv; the body is read as it is inserted
+        format = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+        if format not in ('jsonl', 'csv'):
+            abort(400)
+        try:
+            imported = import_questions(read_questions(codecs.iterdecode(request.stream, 'utf-8'), format))
+        except (InvalidQuestion, UnicodeDecodeError) as error:
+            response = {
+                'success': False,
+                'error': 422,
+                'message': str(error)
+            }
+            return jsonify(response), 422
+        response = {
+            'success': True,
+            'imported': imported
+        }
+        return jsonify(response)
+
+    @app.route('/questions/export')
+    def export_all_questions():
+        # handle export of every question as JSON Lines, streamed a chunk at a time
+        return app.response_class(stream_with_context(export_questions()), mimetype='application/x-ndjson')
+
     @app.route('/questions/<int:question_id>', methods=['DELETE'])
     def delete_question(question_id):
         # handle delete question by id
@@ -87,7 +160,9 @@ def create_app(test_config=None):
                 question = body.get('question')
                 answer = body.get('answer')
                 difficulty = body.get('difficulty')
-                category_id = body.get('category')
+                category_id = int(body.get('category'))
+                if category_id not in category_registry().ids:
+                    abort(422)
 
                 new_question = Question(
                     question=question,
@@ -105,16 +180,10 @@ def create_app(test_config=None):
         elif 'searchTerm' in body:
             try:
                 title = body.get('searchTerm')
-                if title is None or title == '':
+                page = int(body.get('page', 1))
+                if title is None or title == '' or page < 1:
                     abort(422)
-                questions = Question.query.filter(Question.question.ilike('%{}%'.format(title))).all()
-                formatted_questions = [question.format() for question in questions]
-                response = {
-                    'success': True,
-                    'questions': formatted_questions,
-                    'total_questions': len(formatted_questions),
-                    'current_category': None
-                }
+                response = search_questions(title, page)
             except:
                 abort(422)
         else:
@@ -123,54 +192,61 @@ def create_app(test_config=None):
 
     @app.route('/categories/<int:category_id>/questions')
     def get_questions_by_category(category_id):
-        # handle get questions based on category
-        try:
-            category = Category.query.filter_by(id=category_id).one_or_none()
-            if category is None:
-                abort(404)
-            else:
-                questions = Question.query.filter_by(category=category_id).all()
-                formatted_questions = [question.format() for question in questions]
-                response = {
-                    'success': True,
-                    'questions': formatted_questions,
-                    'total_questions': len(formatted_questions),
-                    'current_category': category_id
-                }
-        except:
+        # handle get questions based on category, a page at a time like /questions
+        if category_id not in category_registry().ids:
             abort(404)
+        formatted_questions = paginate_questions(request, Question.query.filter_by(category=category_id))
+        response = {
+            'success': True,
+            'questions': formatted_questions,
+            'total_questions': category_question_count(category_id),
+            'current_category': category_id,
+            'next_after_id': next_after_id(formatted_questions)
+        }
         return jsonify(response)
 
     @app.route('/quizzes', methods=['POST'])
     def play():
-        # handle get a new random question for the selected category/categories
+        # handle get a new random question for the selected category/categories;
+        # the first round starts a quiz session and returns its quiz_token, later
+        # rounds that send it back need no previous_questions, and with
+        # answered_correctly about the last question get easier or harder ones;
+        # a token that is unknown or has expired is refused with 410 so the
+        # client starts a new quiz itself
         try:
             body = request.get_json()
-            if 'quiz_category' not in body or 'previous_questions' not in body:
+            if 'quiz_category' not in body or ('previous_questions' not in body and 'quiz_token' not in body):
                 abort(400)
             else:
-                previous_questions = body.get('previous_questions')
+                previous_questions = body.get('previous_questions') or []
                 category = body.get('quiz_category')
             if 'id' not in category:
                 abort(400)
             category_id = int(category.get('id'))
-            if category_id == 0:
-                questions = Question.query.filter(Question.id.notin_(previous_questions)).all()
-            else:
-                questions = Question.query.filter_by(category=category_id).filter(
-                    Question.id.notin_(previous_questions)).all()
-
-            if len(questions) == 0:
-                new_question = None
+            token = body.get('quiz_token')
+            session = quiz_sessions.get(token) if token else None
+            if token and session is None:
+                abort(410)
+            if session is None and not previous_questions:
+                token, session = quiz_sessions.start(category_id)
+            if session is not None:
+                if 'answered_correctly' in body:
+                    session.record(bool(body.get('answered_correctly')))
+                question = next_question(session)
             else:
-                new_question = random.choice(questions).format()
+                token = None
+                question = random_question(category_id, previous_questions)
 
             response = {
                 'success': True,
-                'question': new_question
+                'question': question.format() if question else None,
+                'quiz_token': token,
+                'quiz': session.format() if session is not None else None
             }
         except BadRequest:
             abort(400)
+        except Gone:
+            abort(410)
         except:
             abort(422)
         return jsonify(response)
@@ -195,6 +271,16 @@ def create_app(test_config=None):
         }
         return jsonify(response), 404
 
+    @app.errorhandler(410)
+    def gone(error):
+        # handle 410 error
+        response = {
+            'success': False,
+            'error': 410,
+            'message': "The quiz session has expired."
+        }
+        return jsonify(response), 410
+
     @app.errorhandler(422)
     def not_processed(error):
         # handle 404 error
@@ -0,0 +1,19 @@
+--
+-- Indexes for GET /questions/search.
+--
+--     $ psql trivia < migrations/001_question_search.sql
+--
+-- The full-text index answers the ranked word search; the trigram index
+-- answers the substring (ILIKE '%term%') matches searched alongside it. The
+-- expression in the full-text index must stay the one search.py queries.
+--
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS questions_question_fts_idx
+    ON public.questions USING gin (to_tsvector('english', COALESCE(question, '')));
+
+CREATE INDEX IF NOT EXISTS questions_question_trgm_idx
+    ON public.questions USING gin (question gin_trgm_ops);
+
+ANALYZE public.questions;
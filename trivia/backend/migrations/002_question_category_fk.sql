@@ -0,0 +1,45 @@
+--
+-- questions.category as an indexed integer foreign key to categories.id.
+--
+--     $ psql trivia < migrations/002_question_category_fk.sql
+--
+-- trivia.psql already creates the column as integer with the foreign key;
+-- databases created by db.create_all() before this change have it as
+-- varchar, without either. Category values that are not ids become NULL,
+-- as the foreign key's ON DELETE SET NULL would have made them. The
+-- (category, id) index serves the per-category pages in id order and
+-- their counts as index-only scans.
+--
+
+BEGIN;
+
+DO $$
+BEGIN
+    IF (SELECT data_type FROM information_schema.columns
+        WHERE table_schema = 'public' AND table_name = 'questions' AND column_name = 'category') <> 'integer' THEN
+        ALTER TABLE public.questions
+            ALTER COLUMN category TYPE integer
+            USING CASE WHEN category ~ '^\s*\d+\s*$' THEN category::integer END;
+    END IF;
+END
+$$;
+
+UPDATE public.questions SET category = NULL
+WHERE category IS NOT NULL AND category NOT IN (SELECT id FROM public.categories);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint
+                   WHERE conrelid = 'public.questions'::regclass AND contype = 'f') THEN
+        ALTER TABLE ONLY public.questions
+            ADD CONSTRAINT category FOREIGN KEY (category) REFERENCES public.categories(id)
+            ON UPDATE CASCADE ON DELETE SET NULL;
+    END IF;
+END
+$$;
+
+CREATE INDEX IF NOT EXISTS questions_category_id_idx ON public.questions (category, id);
+
+COMMIT;
+
+VACUUM ANALYZE public.questions;
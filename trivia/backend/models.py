@@ -1,10 +1,15 @@
+import hashlib
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import random
+import threading
+import time
+from array import array
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine
 from flask_sqlalchemy import SQLAlchemy
 import json
 
 database_name = "trivia_test"
-database_path = "postgres://postgres:huangqi861012@{}/{}".format('localhost:5432', database_name)
+database_path = os.environ.get('DATABASE_URL', "postgres://postgres:huangqi861012@{}/{}".format('localhost:5432', database_name))
 
 db = SQLAlchemy()
 
@@ -19,17 +24,97 @@ def setup_db(app, database_path=database_path):
     db.init_app(app)
     db.create_all()
 
+'''
+CachedValue(load, ttl)
+    keeps the result of load() for ttl seconds, or until invalidate() is
+    called after a write; other processes' writes show up within ttl. With
+    ttl None, the value is kept until invalidated
+'''
+class CachedValue:
+  def __init__(self, load, ttl=60):
+    self.load = load
+    self.ttl = ttl
+    self.lock = threading.Lock()
+    self.value = None
+    self.loaded_at = None
+
+  def __call__(self):
+    with self.lock:
+      if self.loaded_at is None or (self.ttl is not None and time.monotonic() - self.loaded_at > self.ttl):
+        self.value = self.load()
+        self.loaded_at = time.monotonic()
+      return self.value
+
+  def invalidate(self):
+    with self.lock:
+      self.loaded_at = None
+
+'''
+question_count()
+    number of questions, counted once per ttl instead of on every page
+'''
+question_count = CachedValue(lambda: db.session.query(db.func.count(Question.id)).scalar())
+
+'''
+category_question_count(category_id)
+    number of questions in a category, counted from questions_category_id_idx
+'''
+def category_question_count(category_id):
+  return db.session.query(db.func.count(Question.id)).filter(Question.category == category_id).scalar()
+
+'''
+question_buckets()
+    {category id: {difficulty: array of question ids in shuffled order}},
+    with every question under category 0 and questions without a
+    difficulty under difficulty 0; quiz sessions walk these without querying
+'''
+def load_question_buckets():
+  buckets = {0: {}}
+  for question_id, category, difficulty in db.session.query(Question.id, Question.category, Question.difficulty):
+    difficulty = difficulty or 0
+    buckets[0].setdefault(difficulty, array('l')).append(question_id)
+    if category is not None:
+      buckets.setdefault(category, {}).setdefault(difficulty, array('l')).append(question_id)
+  for category_buckets in buckets.values():
+    for ids in category_buckets.values():
+      random.shuffle(ids)
+  return buckets
+
+question_buckets = CachedValue(load_question_buckets, ttl=600)
+
+'''
+Categories(types)
+    the category registry: types is {id: type} ordered by type, ids the set
+    of valid category ids, and etag a strong ETag of the contents, the same
+    in every process that loaded the same categories
+'''
+class Categories:
+  def __init__(self, types):
+    self.types = types
+    self.ids = frozenset(types)
+    self.etag = hashlib.sha1(json.dumps(sorted(types.items())).encode('utf-8')).hexdigest()
+
+'''
+category_registry()
+    the Categories, reloaded once per ttl so that changes made by other
+    processes are seen, and at once when this process changes a category
+'''
+category_registry = CachedValue(
+  lambda: Categories({category.id: category.type for category in Category.query.order_by(Category.type)}))
+
 '''
 Question
 
 '''
 class Question(db.Model):  
   __tablename__ = 'questions'
+  # a category's questions in id order, and their count, from the index alone
+  __table_args__ = (Index('questions_category_id_idx', 'category', 'id'),)
 
   id = Column(Integer, primary_key=True)
   question = Column(String)
   answer = Column(String)
-  category = Column(String)
+  category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
   difficulty = Column(Integer)
 
   def __init__(self, question, answer, category, difficulty):
@@ -41,13 +126,18 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    question_count.invalidate()
+    question_buckets.invalidate()
   
   def update(self):
     db.session.commit()
+    question_buckets.invalidate()
 
   def delete(self):
     db.session.delete(self)
     db.session.commit()
+    question_count.invalidate()
+    question_buckets.invalidate()
 
   def format(self):
     return {
@@ -71,6 +161,20 @@ class Category(db.Model):
   def __init__(self, type):
     self.type = type
 
+  def insert(self):
+    db.session.add(self)
+    db.session.commit()
+    category_registry.invalidate()
+
+  def update(self):
+    db.session.commit()
+    category_registry.invalidate()
+
+  def delete(self):
+    db.session.delete(self)
+    db.session.commit()
+    category_registry.invalidate()
+
   def format(self):
     return {
       'id': self.id,
@@ -0,0 +1,174 @@
+import math
+import random
+import secrets
+import threading
+import time
+from collections import OrderedDict
+
+from models import Question, question_buckets
+
+# quiz sessions idle longer than this are forgotten
+SESSION_TTL = 3600
+# oldest sessions are dropped past this many
+MAX_SESSIONS = 10000
+# random offsets tried before a legacy request falls back to NOT IN; kept
+# below the profiler's QUERY_REPEAT_THRESHOLD (5) so the retries are not
+# reported as an N+1
+RANDOM_OFFSET_ATTEMPTS = 3
+# a session aims at this difficulty first, and stays within the bounds
+START_DIFFICULTY = 2
+MIN_DIFFICULTY = 1
+MAX_DIFFICULTY = 5
+# correct answers in a row that raise the aimed difficulty by one
+STREAK_TO_LEVEL_UP = 2
+
+
+'''
+BucketWalk(ids)
+    walks a bucket's shuffled question ids in an order of its own: the i-th
+    question is ids[(step * i + offset) % n] with step coprime to n, which
+    visits every id exactly once. Holds no copy of ids, so starting a walk
+    and taking a step are both O(1), and the ids served so far are just
+    those before position.
+'''
+class BucketWalk:
+    __slots__ = ('ids', 'step', 'offset', 'position')
+
+    def __init__(self, ids):
+        self.ids = ids
+        size = len(ids)
+        self.step = 1
+        if size > 2:
+            self.step = random.randrange(1, size)
+            while math.gcd(self.step, size) != 1:
+                self.step = random.randrange(1, size)
+        self.offset = random.randrange(size) if size else 0
+        self.position = 0
+
+    def next_id(self):
+        if self.position >= len(self.ids):
+            return None
+        question_id = self.ids[(self.step * self.position + self.offset) % len(self.ids)]
+        self.position += 1
+        return question_id
+
+
+'''
+QuizSession(buckets)
+    an adaptive quiz over one category's difficulty buckets. Each correct
+    answer adds to the score and streak, and every STREAK_TO_LEVEL_UP in a
+    row raise the aimed difficulty; a wrong one resets the streak and lowers
+    it. Questions come from the bucket nearest the aimed difficulty, easier
+    on ties, so the whole state is a few integers per bucket however long
+    the quiz runs.
+'''
+class QuizSession:
+    __slots__ = ('walks', 'difficulty', 'score', 'streak', 'asked', 'awaiting_answer', 'used_at')
+
+    def __init__(self, buckets):
+        self.walks = {difficulty: BucketWalk(ids) for difficulty, ids in buckets.items() if ids}
+        self.difficulty = START_DIFFICULTY
+        self.score = 0
+        self.streak = 0
+        self.asked = 0
+        self.awaiting_answer = False
+        self.used_at = time.monotonic()
+
+    def record(self, correct):
+        # the answer to the last question served; repeated reports are ignored
+        if not self.awaiting_answer:
+            return
+        self.awaiting_answer = False
+        if correct:
+            self.score += 1
+            self.streak += 1
+            if self.streak % STREAK_TO_LEVEL_UP == 0:
+                self.difficulty = min(self.difficulty + 1, MAX_DIFFICULTY)
+        else:
+            self.streak = 0
+            self.difficulty = max(self.difficulty - 1, MIN_DIFFICULTY)
+
+    def next_id(self):
+        # at most one step per bucket: exhausted buckets are dropped
+        while self.walks:
+            difficulty = min(self.walks, key=lambda bucket: (abs(bucket - self.difficulty), bucket))
+            question_id = self.walks[difficulty].next_id()
+            if question_id is not None:
+                return question_id
+            del self.walks[difficulty]
+        return None
+
+    def format(self):
+        return {
+            'score': self.score,
+            'streak': self.streak,
+            'asked': self.asked,
+            'difficulty': self.difficulty
+        }
+
+
+class QuizSessions:
+    # in-process session store keyed by quiz token, least recently used first
+
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.lock = threading.Lock()
+        self.sessions = OrderedDict()
+
+    def start(self, category_id):
+        session = QuizSession(question_buckets().get(category_id, {}))
+        token = secrets.token_urlsafe(16)
+        with self.lock:
+            self.sessions[token] = session
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+        return token, session
+
+    def get(self, token):
+        with self.lock:
+            session = self.sessions.get(token)
+            if session is None:
+                return None
+            if time.monotonic() - session.used_at > self.ttl:
+                del self.sessions[token]
+                return None
+            session.used_at = time.monotonic()
+            self.sessions.move_to_end(token)
+            return session
+
+
+def next_question(session):
+    '''
+    Next question of a session, one primary key lookup per round; ids of
+    questions deleted since the session started are skipped.
+    '''
+    while True:
+        question_id = session.next_id()
+        if question_id is None:
+            return None
+        question = Question.query.get(question_id)
+        if question is not None:
+            session.asked += 1
+            session.awaiting_answer = True
+            return question
+
+
+def random_question(category_id, previous_questions):
+    '''
+    For clients without a quiz token: picks a random row by OFFSET on the
+    id index, retrying when it was already asked. Falls back to the NOT IN
+    query once the category is mostly used up.
+    '''
+    query = Question.query
+    if category_id:
+        query = query.filter_by(category=category_id)
+    asked = set(previous_questions)
+    total = sum(len(ids) for ids in question_buckets().get(category_id, {}).values())
+    if total > len(asked):
+        for _ in range(RANDOM_OFFSET_ATTEMPTS):
+            question = query.order_by(Question.id).offset(random.randrange(total)).limit(1).first()
+            if question is not None and question.id not in asked:
+                return question
+    remaining = query.filter(Question.id.notin_(previous_questions)).all()
+    return random.choice(remaining) if remaining else None
@@ -0,0 +1,269 @@
+import re
+from array import array
+from bisect import bisect_left, insort
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, or_
+from sqlalchemy.orm import Session, object_session
+
+from models import Question, db
+
+WORD = re.compile(r'\w+')
+
+
+def words(text):
+    return WORD.findall((text or '').lower())
+
+
+def word_trigrams(word):
+    return {word[i:i + 3] for i in range(len(word) - 2)}
+
+
+'''
+PostgresSearchIndex
+    full-text and trigram search over questions.question, answered from the
+    GIN indexes of migrations/001_question_search.sql. A question matches
+    when its text matches the term as a full-text query or contains it as a
+    substring; matches are ranked by ts_rank_cd, then trigram similarity.
+'''
+class PostgresSearchIndex:
+
+    def search(self, term, offset, limit):
+        document = func.to_tsvector('english', func.coalesce(Question.question, ''))
+        term_query = func.plainto_tsquery('english', term)
+        escaped = term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        matches = or_(document.op('@@')(term_query), Question.question.ilike('%' + escaped + '%'))
+        total = db.session.query(func.count(Question.id)).filter(matches).scalar()
+        questions = Question.query.filter(matches) \
+            .order_by(func.ts_rank_cd(document, term_query).desc(),
+                      func.similarity(Question.question, term).desc(),
+                      Question.id) \
+            .offset(offset).limit(limit).all()
+        return questions, total
+
+
+'''
+MemorySearchIndex
+    in-process inverted index for databases without full-text search
+    (SQLite). Built with one query on first use and kept current as
+    sessions commit. Every word of the term must be contained in a word of
+    the question, so a question containing the term matches as it does with
+    ILIKE on Postgres; words are not stemmed as they are by full-text search.
+    Questions where more of the term's words are whole words rank first.
+    Postings are sorted id arrays, so a 500k question bank costs a few tens
+    of MB. The words containing a term word are found through a trigram
+    index of the vocabulary, and a search starts from its rarest term word
+    and probes the others by bisection.
+'''
+class MemorySearchIndex:
+
+    def __init__(self):
+        self.postings = None
+        # every word seen, numbered in the order it was first seen
+        self.vocabulary = []
+        self.word_numbers = {}
+        # trigram: ascending numbers of the words containing it
+        self.trigrams = {}
+
+    def build(self):
+        postings = {}
+        for question_id, text in db.session.query(Question.id, Question.question).order_by(Question.id):
+            for word in set(words(text)):
+                posting = postings.get(word)
+                if posting is None:
+                    posting = postings[word] = array('l')
+                posting.append(question_id)
+        self.vocabulary = []
+        self.word_numbers = {}
+        self.trigrams = {}
+        for word in postings:
+            self.number(word)
+        self.postings = postings
+
+    def number(self, word):
+        # indexes the trigrams of a word the first time it is seen
+        if word in self.word_numbers:
+            return
+        word_number = self.word_numbers[word] = len(self.vocabulary)
+        self.vocabulary.append(word)
+        for trigram in word_trigrams(word):
+            numbers = self.trigrams.get(trigram)
+            if numbers is None:
+                numbers = self.trigrams[trigram] = array('l')
+            numbers.append(word_number)
+
+    def add(self, question_id, text):
+        if self.postings is None:
+            return
+        for word in set(words(text)):
+            posting = self.postings.get(word)
+            if posting is None:
+                self.number(word)
+                posting = self.postings[word] = array('l')
+            if not posting or posting[-1] < question_id:
+                posting.append(question_id)
+            elif not contains(posting, question_id):
+                insort(posting, question_id)
+
+    def remove(self, question_id, text):
+        # words left without questions keep their number but match nothing
+        if self.postings is None:
+            return
+        for word in set(words(text)):
+            posting = self.postings.get(word)
+            if posting is None:
+                continue
+            index = bisect_left(posting, question_id)
+            if index < len(posting) and posting[index] == question_id:
+                del posting[index]
+            if not posting:
+                del self.postings[word]
+
+    def reset(self):
+        # rebuilt on the next search, after bulk writes
+        self.postings = None
+
+    def containing(self, term_word):
+        # postings of every word containing term_word
+        trigrams = word_trigrams(term_word)
+        if trigrams:
+            numbers = min((self.trigrams.get(trigram, ()) for trigram in trigrams), key=len)
+            candidates = (self.vocabulary[word_number] for word_number in numbers)
+        else:
+            # words shorter than a trigram are looked for in every word
+            candidates = self.postings
+        postings = []
+        for word in candidates:
+            if term_word in word:
+                posting = self.postings.get(word)
+                if posting:
+                    postings.append(posting)
+        return postings
+
+    def search(self, term, offset, limit):
+        if self.postings is None:
+            self.build()
+        term_words = set(words(term))
+        if not term_words:
+            return [], 0
+        # (matching ids, term word, postings), rarest term word first
+        matches = []
+        for term_word in term_words:
+            postings = self.containing(term_word)
+            matches.append((sum(map(len, postings)), term_word, postings))
+        matches.sort(key=lambda match: match[0])
+        size, _, postings = matches[0]
+        candidates = set()
+        for posting in postings:
+            candidates.update(posting)
+        for size, _, postings in matches[1:]:
+            if not candidates:
+                break
+            if len(postings) == 1 and len(candidates) < size:
+                candidates = {question_id for question_id in candidates if contains(postings[0], question_id)}
+            elif len(candidates) * len(postings) < size:
+                candidates = {question_id for question_id in candidates
+                              if any(contains(posting, question_id) for posting in postings)}
+            else:
+                matched = set()
+                for posting in postings:
+                    matched.update(posting)
+                candidates &= matched
+
+        # words matched only inside a longer word rank lower
+        whole_words = {}
+        for _, term_word, postings in matches:
+            if len(postings) == 1:
+                continue
+            exact = self.postings.get(term_word, ())
+            if len(exact) < len(candidates):
+                found = (question_id for question_id in exact if question_id in candidates)
+            else:
+                found = (question_id for question_id in candidates if contains(exact, question_id))
+            for question_id in found:
+                whole_words[question_id] = whole_words.get(question_id, 0) + 1
+        if whole_words:
+            ranked = sorted(candidates, key=lambda question_id: (-whole_words.get(question_id, 0), question_id))
+        else:
+            ranked = sorted(candidates)
+        page_ids = ranked[offset:offset + limit]
+        if not page_ids:
+            return [], len(ranked)
+        questions = {question.id: question for question in Question.query.filter(Question.id.in_(page_ids))}
+        return [questions[question_id] for question_id in page_ids if question_id in questions], len(ranked)
+
+
+def contains(posting, question_id):
+    index = bisect_left(posting, question_id)
+    return index < len(posting) and posting[index] == question_id
+
+
+def search_index():
+    # the app's search index: full-text on Postgres, in memory elsewhere
+    extensions = current_app.extensions
+    if 'question_search' not in extensions:
+        if db.engine.dialect.name == 'postgresql':
+            extensions['question_search'] = PostgresSearchIndex()
+        else:
+            extensions['question_search'] = MemorySearchIndex()
+    return extensions['question_search']
+
+
+def loaded_memory_index():
+    if not has_app_context():
+        return None
+    index = current_app.extensions.get('question_search')
+    return index if isinstance(index, MemorySearchIndex) else None
+
+
+'''
+The mapper events below only note a session's changes to question text, as
+(id, text removed, text added); they reach the index when the session
+commits and are dropped when it rolls back, so rolled back inserts are
+never found and a reused id never inherits a deleted question's words.
+'''
+def note_change(question, change):
+    session = object_session(question)
+    if session is not None:
+        session.info.setdefault('question_search_changes', []).append(change)
+
+
+@event.listens_for(Question, 'after_insert')
+def question_inserted(mapper, connection, question):
+    note_change(question, (question.id, None, question.question))
+
+
+@event.listens_for(Question, 'after_update')
+def question_updated(mapper, connection, question):
+    history = inspect(question).attrs.question.history
+    if history.has_changes():
+        removed = history.deleted[0] if history.deleted else None
+        # text replaced without having been loaded: rebuild the index instead
+        note_change(question, (question.id, removed, question.question) if removed is not None else None)
+
+
+@event.listens_for(Question, 'after_delete')
+def question_deleted(mapper, connection, question):
+    note_change(question, (question.id, question.question, None))
+
+
+@event.listens_for(Session, 'after_commit')
+def apply_changes(session):
+    changes = session.info.pop('question_search_changes', None)
+    index = loaded_memory_index()
+    if not changes or index is None:
+        return
+    for change in changes:
+        if change is None:
+            index.reset()
+            return
+        question_id, removed, added = change
+        if removed is not None:
+            index.remove(question_id, removed)
+        if added is not None:
+            index.add(question_id, added)
+
+
+@event.listens_for(Session, 'after_rollback')
+def discard_changes(session):
+    session.info.pop('question_search_changes', None)
@@ -1,9 +1,13 @@
 import os
+import resource
+import tempfile
 import unittest
 import json
+from unittest import mock
 from flask_sqlalchemy import SQLAlchemy
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, category_registry, question_count, question_buckets
+from flask_dbtools.profiler import QueryBudgetExceeded
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -43,8 +47,12 @@ class TriviaTestCase(unittest.TestCase):
             'answer': "Tim Berners-Lee"
         }
 
+        # questions a test adds, deleted by prefix after it runs whatever its outcome
+        self.added_prefixes = []
+
     def tearDown(self):
-        pass
+        for prefix in self.added_prefixes:
+            self.delete_imported_questions(prefix)
 
     def test_get_categories(self):
         res = self.client().get('/categories')
@@ -54,6 +62,59 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['categories']))
 
+    def test_categories_changed_elsewhere_are_seen_after_ttl(self):
+        self.client().get('/categories')
+        with self.app.app_context():
+            # committed without Category.insert, as another process would
+            category = Category(type='Literature')
+            db.session.add(category)
+            db.session.commit()
+            try:
+                category_registry.loaded_at -= category_registry.ttl + 1
+                data = json.loads(self.client().get('/categories').data)
+
+                self.assertEqual(data['categories'][str(category.id)], 'Literature')
+            finally:
+                category.delete()
+
+    def test_get_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        self.assertEqual(res.headers['ETag'], etag)
+
+        with self.app.app_context():
+            category = Category(type='Literature')
+            category.insert()
+            res = self.client().get('/categories', headers={'If-None-Match': etag})
+            data = json.loads(res.data)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertNotEqual(res.headers['ETag'], etag)
+            self.assertEqual(data['categories'][str(category.id)], 'Literature')
+
+            category.delete()
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertEqual(res.status_code, 304)
+
+    def test_listing_endpoints_stay_within_query_budget(self):
+        self.app.testing = True
+        self.app.config['QUERY_PROFILER_STRICT'] = True
+        self.app.config['QUERY_BUDGET'] = 2
+        for url in ['/categories', '/questions', '/questions?page=2', '/categories/1/questions']:
+            res = self.client().get(url)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertTrue(res.headers['Server-Timing'].startswith('db;desc='))
+
+        self.app.config['QUERY_BUDGET'] = 0
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client().get('/questions')
+
     def test_get_questions_without_arguments(self):
         res = self.client().get('/questions')
         data = json.loads(res.data)
@@ -75,6 +136,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(len(data['categories']))
         self.assertFalse(data['current_category'])
 
+    def test_get_questions_after_id_matches_page_numbers(self):
+        first_page = json.loads(self.client().get('/questions').data)
+        second_page = json.loads(self.client().get('/questions?page=2').data)
+        res = self.client().get('/questions?after_id={}'.format(first_page['next_after_id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['questions'], second_page['questions'])
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+
+    def test_get_questions_total_follows_inserts(self):
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        self.client().post('/questions', json=self.good_question)
+        data = json.loads(self.client().get('/questions').data)
+
+        self.assertEqual(data['total_questions'], total + 1)
+
     def test_404_get_questions_with_nonexisting_page(self):
         res = self.client().get('/questions?page=9999')
         data = json.loads(res.data)
@@ -109,6 +187,73 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], "The request can not be processed.")
 
+    def delete_imported_questions(self, prefix):
+        with self.app.app_context():
+            Question.query.filter(Question.question.like(prefix + '%')).delete(synchronize_session=False)
+            db.session.commit()
+        question_count.invalidate()
+        question_buckets.invalidate()
+
+    def test_import_questions_from_json_lines_and_csv(self):
+        self.added_prefixes.append('Imported question')
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        lines = ''.join(json.dumps({'question': 'Imported question {}?'.format(number), 'answer': 'Yes',
+                                    'category': 1, 'difficulty': 2}) + '\n' for number in range(3))
+        res = self.client().post('/questions/import', data=lines, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], 3)
+
+        rows = 'question,answer,category,difficulty\n"Imported question, from CSV?",Yes,2,3\n'
+        res = self.client().post('/questions/import', data=rows, content_type='text/csv')
+        data = json.loads(res.data)
+
+        self.assertEqual(data['imported'], 1)
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total + 4)
+
+        res = self.client().get('/questions/export')
+        exported = [json.loads(line) for line in res.data.decode('utf-8').splitlines()]
+
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        self.assertEqual(len(exported), total + 4)
+        self.assertIn('Imported question, from CSV?', [question['question'] for question in exported])
+
+    def test_import_with_unknown_category_inserts_nothing(self):
+        total = json.loads(self.client().get('/questions').data)['total_questions']
+        lines = json.dumps({'question': 'Imported question?', 'answer': 'Yes', 'category': 1, 'difficulty': 2}) + \
+            '\n' + json.dumps({'question': 'Imported question?', 'answer': 'No', 'category': 999, 'difficulty': 2})
+        res = self.client().post('/questions/import', data=lines, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['message'], 'line 2: category 999 does not exist')
+        self.assertEqual(json.loads(self.client().get('/questions').data)['total_questions'], total)
+
+    def test_import_and_export_in_bounded_memory(self):
+        # TRIVIA_BENCH_ROWS=1000000 for the full million-row run, which takes about 30s
+        num_questions = int(os.environ.get('TRIVIA_BENCH_ROWS', 20000))
+        self.added_prefixes.append('Bulk question')
+        with tempfile.TemporaryFile() as body:
+            for number in range(num_questions):
+                body.write(json.dumps({'question': 'Bulk question {}?'.format(number), 'answer': 'Yes',
+                                       'category': number % 6 + 1, 'difficulty': number % 5 + 1}).encode() + b'\n')
+            body.seek(0)
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            res = self.client().post('/questions/import', input_stream=body, content_type='application/x-ndjson')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['imported'], num_questions)
+
+        res = self.client().get('/questions/export', buffered=False)
+        exported = sum(chunk.count(b'\n') for chunk in res.response)
+        res.close()
+
+        self.assertGreaterEqual(exported, num_questions)
+        # kilobytes on Linux; a million rows held at once would take several hundred MB
+        self.assertLess(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss, 100 * 1024)
+
     def test_add_valid_question(self):
         res = self.client().post('/questions', json=self.good_question)
         data = json.loads(res.data)
@@ -153,6 +298,86 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], False)
         self.assertEqual(data['message'], "The request can not be processed.")
 
+    def test_search_endpoint_pages_ranked_results(self):
+        res = self.client().get('/questions/search?q=what')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['success'], True)
+        self.assertTrue(len(data['questions']))
+        self.assertLessEqual(len(data['questions']), 10)
+        self.assertGreaterEqual(data['total_questions'], len(data['questions']))
+        self.assertEqual(data['page'], 1)
+
+        legacy = json.loads(self.client().post('/questions', json={'searchTerm': 'what'}).data)
+        self.assertEqual(legacy['questions'], data['questions'])
+        self.assertEqual(legacy['total_questions'], data['total_questions'])
+
+    def test_search_endpoint_follows_inserts_and_deletes(self):
+        question = Question(question='Which xylophonist searched for this?', answer='Nobody',
+                            category=1, difficulty=1)
+        self.client().get('/questions/search?q=what')
+        with self.app.app_context():
+            question.insert()
+            question_id = question.id
+        data = json.loads(self.client().get('/questions/search?q=xylophonist').data)
+
+        self.assertEqual([found['id'] for found in data['questions']], [question_id])
+
+        self.client().delete('/questions/{}'.format(question_id))
+        data = json.loads(self.client().get('/questions/search?q=xylophonist').data)
+
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], 0)
+
+    def test_search_endpoint_matches_substrings(self):
+        question = Question(question='Which organ pumps the xylophonists blood?', answer='The heart',
+                            category=1, difficulty=1)
+        self.client().get('/questions/search?q=what')
+        with self.app.app_context():
+            question.insert()
+            question_id = question.id
+        data = json.loads(self.client().get('/questions/search?q=lophon').data)
+
+        self.assertEqual([found['id'] for found in data['questions']], [question_id])
+
+        legacy = json.loads(self.client().post('/questions', json={'searchTerm': 'lophon', 'page': 2}).data)
+        self.assertEqual(legacy['questions'], [])
+        self.assertEqual(legacy['total_questions'], 1)
+        self.client().delete('/questions/{}'.format(question_id))
+
+    def test_search_endpoint_ignores_rolled_back_and_reused_ids(self):
+        self.client().get('/questions/search?q=what')
+        with self.app.app_context():
+            rolled_back = Question(question='Which zeppelinist was never saved?', answer='Nobody',
+                                   category=1, difficulty=1)
+            db.session.add(rolled_back)
+            db.session.flush()
+            db.session.rollback()
+            deleted = Question(question='Which zeppelinist was deleted?', answer='Nobody',
+                               category=1, difficulty=1)
+            deleted.insert()
+            deleted.delete()
+            replacement = Question(question='Which balloonist came next?', answer='Nobody',
+                                   category=1, difficulty=1)
+            replacement.insert()
+            replacement_id = replacement.id
+        data = json.loads(self.client().get('/questions/search?q=zeppelinist').data)
+
+        self.assertEqual(data['questions'], [])
+        self.assertEqual(data['total_questions'], 0)
+
+        data = json.loads(self.client().get('/questions/search?q=balloonist').data)
+        self.assertEqual([found['id'] for found in data['questions']], [replacement_id])
+        self.client().delete('/questions/{}'.format(replacement_id))
+
+    def test_search_endpoint_without_term(self):
+        res = self.client().get('/questions/search?q=')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(data['success'], False)
+
     def test_add_invalid_question_without_search_term(self):
         res = self.client().post('/questions', json={})
         data = json.loads(res.data)
@@ -171,6 +396,23 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'])
         self.assertEqual(data['current_category'], 1)
 
+    def test_get_questions_by_category_pages_in_order(self):
+        self.added_prefixes.append('Category page question')
+        with self.app.app_context():
+            for number in range(11):
+                Question(question='Category page question {}?'.format(number), answer='Yes',
+                         category=2, difficulty=1).insert()
+        first_page = json.loads(self.client().get('/categories/2/questions').data)
+        res = self.client().get('/categories/2/questions?after_id={}'.format(first_page['next_after_id']))
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(first_page['questions']), 10)
+        self.assertEqual(data['total_questions'], first_page['total_questions'])
+        self.assertGreaterEqual(data['total_questions'], 11)
+        self.assertTrue(all(question['category'] == 2 for question in first_page['questions'] + data['questions']))
+        self.assertEqual(data['questions'], json.loads(self.client().get('/categories/2/questions?page=2').data)['questions'])
+
     def test_get_questions_by_category_with_invalid_category(self):
         res = self.client().get('/categories/100/questions')
         data = json.loads(res.data)
@@ -217,6 +459,107 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(data['success'], True)
         self.assertTrue(len(data['question']))
 
+    def test_play_quiz_session_serves_each_question_once(self):
+        request = {
+            'previous_questions': [],
+            'quiz_category': {
+                'id': 1,
+                'type': 'science'
+            }
+        }
+        data = json.loads(self.client().post('/quizzes', json=request).data)
+        served = []
+        while data['question']:
+            served.append(data['question'])
+            request = {'quiz_token': data['quiz_token'], 'quiz_category': {'id': 1}}
+            data = json.loads(self.client().post('/quizzes', json=request).data)
+
+        with self.app.app_context():
+            category_size = Question.query.filter_by(category=1).count()
+        self.assertEqual(len(served), category_size)
+        self.assertEqual(len({question['id'] for question in served}), category_size)
+        self.assertTrue(all(int(question['category']) == 1 for question in served))
+
+    def test_play_quiz_session_adapts_difficulty_to_answers(self):
+        with self.app.app_context():
+            category = Category(type='Adaptive')
+            category.insert()
+            category_id = category.id
+            for difficulty in range(1, 6):
+                for number in range(2):
+                    Question(question='Adaptive question {}-{}?'.format(difficulty, number), answer='Yes',
+                             category=category_id, difficulty=difficulty).insert()
+        request = {'previous_questions': [], 'quiz_category': {'id': category_id}}
+        data = json.loads(self.client().post('/quizzes', json=request).data)
+        served = [data['question']['difficulty']]
+        for answered_correctly in [True, True, False]:
+            request = {'quiz_token': data['quiz_token'], 'quiz_category': {'id': category_id},
+                       'answered_correctly': answered_correctly}
+            data = json.loads(self.client().post('/quizzes', json=request).data)
+            served.append(data['question']['difficulty'])
+
+        # two right raise the aim from 2 to 3; a wrong one lowers it to the
+        # used-up 2, so the easier of the nearest buckets, 1, serves next
+        self.assertEqual(served, [2, 2, 3, 1])
+        self.assertEqual(data['quiz'], {'score': 2, 'streak': 0, 'asked': 4, 'difficulty': 2})
+
+        self.delete_imported_questions('Adaptive question')
+        with self.app.app_context():
+            Category.query.get(category_id).delete()
+
+    def test_play_quiz_without_token_skips_previous_questions(self):
+        with self.app.app_context():
+            question_ids = [question.id for question in Question.query.filter_by(category=1)]
+        request = {
+            'previous_questions': question_ids[1:],
+            'quiz_category': {
+                'id': 1,
+                'type': 'science'
+            }
+        }
+        res = self.client().post('/quizzes', json=request)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], question_ids[0])
+        self.assertIsNone(data['quiz_token'])
+
+    def test_play_quiz_without_token_retries_below_repeat_threshold(self):
+        self.app.testing = True
+        self.app.config['QUERY_PROFILER_STRICT'] = True
+        with self.app.app_context():
+            question_ids = [question.id for question in Question.query.filter_by(category=1).order_by(Question.id)]
+        request = {
+            'previous_questions': question_ids[1:],
+            'quiz_category': {
+                'id': 1,
+                'type': 'science'
+            }
+        }
+        # every random offset lands on an asked question, down to the fallback
+        with mock.patch('quiz.random.randrange', return_value=1):
+            res = self.client().post('/quizzes', json=request)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['question']['id'], question_ids[0])
+        self.assertNotIn('db-repeat', res.headers['Server-Timing'])
+
+    def test_play_quiz_with_unknown_token(self):
+        request = {
+            'quiz_token': 'expired-or-never-issued',
+            'quiz_category': {
+                'id': 1,
+                'type': 'science'
+            }
+        }
+        res = self.client().post('/quizzes', json=request)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 410)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], "The quiz session has expired.")
+
     def test_play_quiz_with_invalid_request(self):
         request = {
             'previous_questions': []
@@ -14,6 +14,7 @@ class QuestionView extends Component {
       totalQuestions: 0,
       categories: {},
       currentCategory: null,
+      searchTerm: null,
     }
   }
 
@@ -30,7 +31,8 @@ class QuestionView extends Component {
           questions: result.questions,
           totalQuestions: result.total_questions,
           categories: result.categories,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: null })
         return;
       },
       error: (error) => {
@@ -41,7 +43,13 @@ class QuestionView extends Component {
   }
 
   selectPage(num) {
-    this.setState({page: num}, () => this.getQuestions());
+    if (this.state.searchTerm !== null) {
+      this.setState({page: num}, () => this.getSearchResults());
+    } else if (this.state.currentCategory !== null) {
+      this.setState({page: num}, () => this.getByCategory(this.state.currentCategory));
+    } else {
+      this.setState({page: num}, () => this.getQuestions());
+    }
   }
 
   createPagination(){
@@ -58,15 +66,20 @@ class QuestionView extends Component {
     return pageNumbers;
   }
 
+  selectCategory = (id) => {
+    this.setState({page: 1}, () => this.getByCategory(id));
+  }
+
   getByCategory= (id) => {
     $.ajax({
-      url: `/categories/${id}/questions`, //TODO: update request URL
+      url: `/categories/${id}/questions?page=${this.state.page}`, //TODO: update request URL
       type: "GET",
       success: (result) => {
         this.setState({
           questions: result.questions,
           totalQuestions: result.total_questions,
-          currentCategory: result.current_category })
+          currentCategory: result.current_category,
+          searchTerm: null })
         return;
       },
       error: (error) => {
@@ -77,12 +90,16 @@ class QuestionView extends Component {
   }
 
   submitSearch = (searchTerm) => {
+    this.setState({searchTerm: searchTerm, page: 1}, () => this.getSearchResults());
+  }
+
+  getSearchResults = () => {
     $.ajax({
       url: `/questions`, //TODO: update request URL
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({searchTerm: searchTerm}),
+      data: JSON.stringify({searchTerm: this.state.searchTerm, page: this.state.page}),
       xhrFields: {
         withCredentials: true
       },
@@ -108,7 +125,7 @@ class QuestionView extends Component {
           url: `/questions/${id}`, //TODO: update request URL
           type: "DELETE",
           success: (result) => {
-            this.getQuestions();
+            this.selectPage(this.state.page);
           },
           error: (error) => {
             alert('Unable to load questions. Please try your request again')
@@ -123,10 +140,10 @@ class QuestionView extends Component {
     return (
       <div className="question-view">
         <div className="categories-list">
-          <h2 onClick={() => {this.getQuestions()}}>Categories</h2>
+          <h2 onClick={() => {this.setState({page: 1}, () => this.getQuestions())}}>Categories</h2>
           <ul>
             {Object.keys(this.state.categories).map((id, ) => (
-              <li key={id} onClick={() => {this.getByCategory(id)}}>
+              <li key={id} onClick={() => {this.selectCategory(id)}}>
                 {this.state.categories[id]}
                 <img className="category" src={`${this.state.categories[id]}.svg`}/>
               </li>
@@ -16,7 +16,9 @@ class QuizView extends Component {
         numCorrect: 0,
         currentQuestion: {},
         guess: '',
-        forceEnd: false
+        forceEnd: false,
+        quizToken: null,
+        lastAnswerCorrect: null
     }
   }
 
@@ -52,7 +54,13 @@ class QuizView extends Component {
       type: "POST",
       dataType: 'json',
       contentType: 'application/json',
-      data: JSON.stringify({
+      // once the server has started a quiz session, its token stands in for
+      // the previous questions and the last answer steers the difficulty
+      data: JSON.stringify(this.state.quizToken ? {
+        quiz_token: this.state.quizToken,
+        quiz_category: this.state.quizCategory,
+        answered_correctly: this.state.lastAnswerCorrect
+      } : {
         previous_questions: previousQuestions,
         quiz_category: this.state.quizCategory
       }),
@@ -66,11 +74,22 @@ class QuizView extends Component {
           previousQuestions: previousQuestions,
           currentQuestion: result.question,
           guess: '',
-          forceEnd: result.question ? false : true
+          forceEnd: result.question ? false : true,
+          quizToken: result.quiz_token
         })
         return;
       },
       error: (error) => {
+        if (error.status === 410) {
+          // the quiz session expired on the server: start a new one
+          this.setState({
+            quizToken: null,
+            previousQuestions: [],
+            currentQuestion: {},
+            lastAnswerCorrect: null
+          }, this.getNextQuestion)
+          return;
+        }
         alert('Unable to load question. Please try your request again')
         return;
       }
@@ -84,6 +103,7 @@ class QuizView extends Component {
     this.setState({
       numCorrect: !evaluate ? this.state.numCorrect : this.state.numCorrect + 1,
       showAnswer: true,
+      lastAnswerCorrect: evaluate
     })
   }
 
@@ -95,7 +115,9 @@ class QuizView extends Component {
       numCorrect: 0,
       currentQuestion: {},
       guess: '',
-      forceEnd: false
+      forceEnd: false,
+      quizToken: null,
+      lastAnswerCorrect: null
     })
   }
 